@@ -0,0 +1,304 @@
+"""
+Agenda da frota: quais manutenções vencem primeiro, em toda a frota.
+
+Mantém uma tabela com a projeção de cada par (veículo, tipo de manutenção)
+e um heap ordenado pelo prazo projetado: a data em que a manutenção vence
+pelo intervalo em dias ou pela quilometragem, projetada com a média de uso
+do veículo (odometro.taxas_uso_km: a do odômetro ou, sem leituras recentes,
+a estimada pelo histórico de manutenções), o que vier primeiro. Manutenções
+nunca realizadas vêm antes de todas. As que vencem por km em veículos sem
+média conhecida só ganham prazo quando já estão vencidas; até lá ficam no fim.
+
+A tabela é uma visão incremental (veja visao.py): cada escrita recalcula só
+os veículos e pares afetados, e as consultas por veículo ou par
+(do_veiculo, projecao) são lidas direto dela.
+"""
+import heapq
+import itertools
+import math
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import database as db
+import odometro
+import visao
+
+# Chave de ordenação das manutenções nunca realizadas e das sem prazo conhecido
+_PENDENTE = 0
+_SEM_PRAZO = date.max.toordinal() + 1
+
+
+def _somar_dias(base: date, dias: float) -> date:
+    """Soma dias a uma data, limitando ao intervalo representável."""
+    ordinal = base.toordinal() + math.ceil(dias)
+    return date.fromordinal(min(max(ordinal, 1), date.max.toordinal()))
+
+
+def _data_base(veiculo: dict) -> date:
+    """Data em que a quilometragem do veículo foi informada pela última vez."""
+    instante = veiculo.get("atualizado_em") or veiculo.get("criado_em")
+    return date.fromisoformat(instante[:10]) if instante else date.today()
+
+
+class AgendaFrota(visao.VisaoIncremental):
+    """
+    Heap de prazos de toda a frota. Os itens removidos ou recalculados são
+    descartados do heap de forma preguiçosa, ao serem encontrados.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._heap: list = []           # (chave, sequência, (veiculo_id, tipo_id))
+        self._itens: dict = {}          # (veiculo_id, tipo_id) -> item atual
+        self._sequencia = itertools.count()
+        self._veiculos: dict = {}
+        self._tipos: dict = {}
+        self._taxas: dict = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._atualizar_versao()
+            return len(self._itens)
+
+    # ---------- manutenção do heap ----------
+
+    def _projetar(self, veiculo: dict, tipo: dict) -> dict:
+        """Calcula o item da agenda de um par (veículo, tipo)."""
+        item = {
+            "veiculo_id": veiculo["id"],
+            "tipo_manutencao_id": tipo["id"],
+            "pendente": False,
+            "km_proxima": None,
+            "km_faltante": None,
+            "data_proxima": None,
+            "prazo": None,
+            "taxa_km_dia": self._taxas.get(veiculo["id"]),
+        }
+        ultimo = db.ultimo_registro_manutencao(veiculo["id"], tipo["id"])
+        if ultimo is None:
+            item["pendente"] = True
+            item["chave"] = (_PENDENTE, 0.0)
+            return item
+
+        prazos = []
+        if tipo["intervalo_km"]:
+            item["km_proxima"] = ultimo["km_realizada"] + tipo["intervalo_km"]
+            item["km_faltante"] = item["km_proxima"] - veiculo["km"]
+            if item["taxa_km_dia"]:
+                prazos.append(_somar_dias(_data_base(veiculo), item["km_faltante"] / item["taxa_km_dia"]))
+            elif item["km_faltante"] <= 0:
+                prazos.append(_data_base(veiculo))
+        if tipo["intervalo_dias"]:
+            item["data_proxima"] = datetime.fromisoformat(ultimo["data_realizada"]) + timedelta(days=tipo["intervalo_dias"])
+            prazos.append(item["data_proxima"].date())
+
+        item["prazo"] = min(prazos) if prazos else None
+        item["chave"] = (
+            item["prazo"].toordinal() if item["prazo"] else _SEM_PRAZO,
+            item["km_faltante"] if item["km_faltante"] is not None else math.inf,
+        )
+        return item
+
+    def _incluir(self, par: tuple, item: dict):
+        """Inclui ou substitui o item de um par no heap."""
+        item["sequencia"] = next(self._sequencia)
+        self._itens[par] = item
+        heapq.heappush(self._heap, (item["chave"], item["sequencia"], par))
+
+    def _recalcular(self, pares):
+        """Recalcula os pares informados, removendo os que deixaram de existir."""
+        for par in pares:
+            veiculo, tipo = self._veiculos.get(par[0]), self._tipos.get(par[1])
+            if veiculo is None or tipo is None:
+                self._itens.pop(par, None)
+            else:
+                self._incluir(par, self._projetar(veiculo, tipo))
+        if len(self._heap) > 2 * len(self._itens) + 64:
+            # Muitos itens descartados: refaz o heap só com os atuais
+            self._heap = [(item["chave"], item["sequencia"], par) for par, item in self._itens.items()]
+            heapq.heapify(self._heap)
+
+    def _montar(self):
+        """Recalcula a agenda inteira a partir do armazenamento."""
+        self._veiculos = {v["id"]: v for v in db.listar_veiculos()}
+        self._tipos = {t["id"]: t for t in db.listar_tipos_manutencao()}
+        self._taxas = odometro.taxas_uso_km()
+        self._itens = {}
+        for veiculo in self._veiculos.values():
+            for tipo in self._tipos.values():
+                item = self._projetar(veiculo, tipo)
+                item["sequencia"] = next(self._sequencia)
+                self._itens[(veiculo["id"], tipo["id"])] = item
+        self._heap = [(item["chave"], item["sequencia"], par) for par, item in self._itens.items()]
+        heapq.heapify(self._heap)
+
+    def _atualizar_taxa(self, veiculo_id: int) -> list:
+        """Recalcula a média de uso do veículo e retorna todos os pares dele."""
+        taxa = odometro.taxa_uso_km(veiculo_id) if veiculo_id in self._veiculos else None
+        if taxa is None:
+            self._taxas.pop(veiculo_id, None)
+        else:
+            self._taxas[veiculo_id] = taxa
+        return [(veiculo_id, tipo_id) for tipo_id in self._tipos]
+
+    def _pares_afetados(self, operacao: str, parametros: dict, resultado) -> Optional[list]:
+        """
+        Atualiza veículos, tipos e médias conhecidos conforme a escrita e
+        retorna os pares a recalcular, ou None se for preciso reconstruir.
+        """
+        if operacao in ("adicionar_veiculo", "atualizar_veiculo", "excluir_veiculo"):
+            if not resultado:
+                return []
+            veiculo_id = resultado["id"] if isinstance(resultado, dict) else parametros["veiculo_id"]
+            if isinstance(resultado, dict):
+                self._veiculos[veiculo_id] = resultado
+            else:
+                self._veiculos.pop(veiculo_id, None)
+            # A quilometragem atual entra na média de uso
+            return self._atualizar_taxa(veiculo_id)
+        if operacao in ("adicionar_tipo_manutencao", "atualizar_tipo_manutencao", "excluir_tipo_manutencao"):
+            if not resultado:
+                return []
+            if not isinstance(resultado, dict):
+                # Os registros do tipo são excluídos e mudam a média de uso de toda a frota
+                return None
+            self._tipos[resultado["id"]] = resultado
+            return [(veiculo_id, resultado["id"]) for veiculo_id in self._veiculos]
+        if operacao in ("adicionar_registro_manutencao", "excluir_registro_manutencao"):
+            if not resultado:
+                return []
+            # O registro pode mudar a média de uso e, com ela, os prazos do veículo todo
+            return self._atualizar_taxa(resultado["veiculo_id"])
+        if operacao == "atualizar_odometros":
+            pares = []
+            for veiculo_id in parametros["leituras"]:
+                veiculo = db.obter_veiculo(veiculo_id)
+                if veiculo is not None:
+                    self._veiculos[veiculo_id] = veiculo
+                    pares += self._atualizar_taxa(veiculo_id)
+            return pares
+        if operacao == "adicionar_em_lote":
+            colecao = parametros["colecao"]
+            if colecao == "registros_manutencao":
+                return [par for veiculo_id in {r["veiculo_id"] for r in resultado} for par in self._atualizar_taxa(veiculo_id)]
+            if colecao == "veiculos":
+                self._veiculos.update((v["id"], v) for v in resultado)
+                return [(v["id"], tipo_id) for v in resultado for tipo_id in self._tipos]
+            self._tipos.update((t["id"], t) for t in resultado)
+            return [(veiculo_id, t["id"]) for t in resultado for veiculo_id in self._veiculos]
+        if operacao == "compactar":
+            return []
+        # Demais escritas (ex.: particionar_registros): reconstrói por segurança
+        return None
+
+    def _aplicar(self, operacao: str, parametros: dict, resultado) -> bool:
+        """Recalcula só os pares afetados pela escrita."""
+        pares = self._pares_afetados(operacao, parametros, resultado)
+        if pares is None:
+            return False
+        self._recalcular(pares)
+        return True
+
+    # ---------- consultas ----------
+
+    def _em_ordem(self):
+        """
+        Percorre os itens atuais em ordem de prazo sem alterar o heap: cada
+        item visitado custa O(log k), onde k é quantos já foram visitados.
+        """
+        heap = self._heap
+        fronteira = [(heap[0], 0)] if heap else []
+        while fronteira:
+            entrada, i = heapq.heappop(fronteira)
+            chave, sequencia, par = entrada
+            item = self._itens.get(par)
+            if item is not None and item["sequencia"] == sequencia:
+                yield item
+            for filho in (2 * i + 1, 2 * i + 2):
+                if filho < len(heap):
+                    heapq.heappush(fronteira, (heap[filho], filho))
+
+    def _resultado(self, item: dict, agora: datetime) -> dict:
+        """
+        Monta o resultado no formato de database.calcular_proxima_manutencao,
+        acrescido do par, de marca/modelo, do prazo projetado (AAAA-MM-DD) e
+        da média de uso usada na projeção (km/dia, ou None).
+        """
+        veiculo = self._veiculos[item["veiculo_id"]]
+        resultado = {
+            "veiculo_id": item["veiculo_id"],
+            "tipo_manutencao_id": item["tipo_manutencao_id"],
+            "marca": veiculo["marca"],
+            "modelo": veiculo["modelo"],
+            "tipo_nome": self._tipos[item["tipo_manutencao_id"]]["nome"],
+            "prazo": item["prazo"].isoformat() if item["prazo"] else None,
+            "taxa_km_dia": item["taxa_km_dia"],
+            "km_faltante": None,
+            "dias_faltantes": None,
+            "status": "ok",
+        }
+        if item["pendente"]:
+            resultado["status"] = "pendente"
+            resultado["mensagem"] = "Manutenção nunca realizada"
+            return resultado
+        if item["km_proxima"] is not None:
+            resultado["km_faltante"] = item["km_faltante"]
+            resultado["km_proxima"] = item["km_proxima"]
+            if item["km_faltante"] <= 0:
+                resultado["status"] = "vencida"
+        if item["data_proxima"] is not None:
+            resultado["dias_faltantes"] = (item["data_proxima"] - agora).days
+            resultado["data_proxima"] = item["data_proxima"].strftime("%d/%m/%Y")
+            if resultado["dias_faltantes"] <= 0:
+                resultado["status"] = "vencida"
+        return resultado
+
+    def projecao(self, veiculo_id: int, tipo_id: int, agora: Optional[datetime] = None) -> Optional[dict]:
+        """Projeção de um par (veículo, tipo), ou None se um dos dois não existir."""
+        agora = agora or datetime.now()
+        with self._lock:
+            self._atualizar_versao()
+            item = self._itens.get((veiculo_id, tipo_id))
+            return self._resultado(item, agora) if item else None
+
+    def do_veiculo(self, veiculo_id: int, agora: Optional[datetime] = None) -> list:
+        """Projeções do veículo para cada tipo de manutenção, na ordem de listar_tipos_manutencao."""
+        agora = agora or datetime.now()
+        with self._lock:
+            self._atualizar_versao()
+            itens = (self._itens.get((veiculo_id, tipo_id)) for tipo_id in self._tipos)
+            return [self._resultado(item, agora) for item in itens if item]
+
+    def todas(self, agora: Optional[datetime] = None) -> list:
+        """Projeções de todos os pares, por veículo e tipo, na ordem das listagens."""
+        agora = agora or datetime.now()
+        with self._lock:
+            self._atualizar_versao()
+            return [
+                self._resultado(self._itens[(veiculo_id, tipo_id)], agora)
+                for veiculo_id in self._veiculos for tipo_id in self._tipos
+                if (veiculo_id, tipo_id) in self._itens
+            ]
+
+    def proximas(self, quantidade: int, agora: Optional[datetime] = None) -> list:
+        """As `quantidade` manutenções de prazo mais próximo, das pendentes em diante."""
+        agora = agora or datetime.now()
+        with self._lock:
+            self._atualizar_versao()
+            return [self._resultado(item, agora) for item in itertools.islice(self._em_ordem(), quantidade)]
+
+    def ate(self, data: date, agora: Optional[datetime] = None) -> list:
+        """Todas as manutenções pendentes ou com prazo até `data` (inclusive), em ordem de prazo."""
+        agora = agora or datetime.now()
+        limite = data.toordinal()
+        with self._lock:
+            self._atualizar_versao()
+            return [
+                self._resultado(item, agora)
+                for item in itertools.takewhile(lambda item: item["chave"][0] <= limite, self._em_ordem())
+            ]
+
+
+def obter_agenda() -> AgendaFrota:
+    """Agenda compartilhada pelo processo, criada no primeiro uso."""
+    return AgendaFrota.compartilhada()
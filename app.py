@@ -2,9 +2,16 @@
 Controle de Manutenção de Veículos
 Aplicação Streamlit para gerenciar veículos e suas manutenções.
 """
+import os
+import tempfile
 import streamlit as st
 from datetime import datetime, date
+import agenda
+import busca
 import database as db
+import indicadores
+import instrumentacao
+import relatorio
 
 # Configuração da página
 st.set_page_config(
@@ -15,11 +22,51 @@ st.set_page_config(
 
 st.title("🚗 Controle de Manutenção de Veículos")
 
+
+# ===================== CACHE DE LEITURAS =====================
+# Compartilhado entre as sessões e chaveado por db.versao_dados(): qualquer
+# escrita gera uma nova versão, e as leituras seguintes são refeitas.
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def carregar_veiculos(versao: int) -> list:
+    """Veículos cadastrados na versão de dados informada."""
+    return db.listar_veiculos()
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def carregar_tipos(versao: int) -> list:
+    """Tipos de manutenção cadastrados na versão de dados informada."""
+    return db.listar_tipos_manutencao()
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def carregar_historico(versao: int, limite: int, deslocamento: int, **filtros) -> dict:
+    """Página do histórico de manutenções na versão de dados informada."""
+    return db.listar_historico_manutencao(**filtros, limite=limite, deslocamento=deslocamento)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def carregar_busca(versao: int, consulta: str, limite: int, deslocamento: int) -> dict:
+    """Página do resultado de uma busca na versão de dados informada."""
+    return busca.buscar(consulta, limite, deslocamento)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def carregar_vencidas_por_modelo(versao: int, hoje: date):
+    """
+    Taxa de vencidas por marca e modelo na versão de dados informada.
+    `hoje` faz o cache expirar na virada do dia, quando os prazos mudam.
+    """
+    return indicadores.vencidas_por_modelo()
+
+
 # Menu lateral
-menu = st.sidebar.selectbox(
-    "Menu",
-    ["Veículos", "Tipos de Manutenção", "Registrar Manutenção", "Próximas Manutenções"]
-)
+opcoes_menu = ["Veículos", "Tipos de Manutenção", "Registrar Manutenção", "Busca", "Próximas Manutenções",
+               "Agenda da Frota", "Indicadores", "Relatório da Frota"]
+if instrumentacao.ATIVO:
+    # Página de diagnóstico só aparece com MANUTENCAO_INSTRUMENTACAO=1
+    opcoes_menu.append("Diagnóstico")
+menu = st.sidebar.selectbox("Menu", opcoes_menu)
 
 # ===================== VEÍCULOS =====================
 if menu == "Veículos":
@@ -46,7 +93,7 @@ if menu == "Veículos":
 
     # Lista de veículos
     st.subheader("Veículos Cadastrados")
-    veiculos = db.listar_veiculos()
+    veiculos = carregar_veiculos(db.versao_dados())
 
     if not veiculos:
         st.info("Nenhum veículo cadastrado ainda.")
@@ -133,7 +180,7 @@ elif menu == "Tipos de Manutenção":
                     st.error("Preencha o nome e pelo menos um intervalo!")
 
     st.subheader("Tipos Cadastrados")
-    tipos = db.listar_tipos_manutencao()
+    tipos = carregar_tipos(db.versao_dados())
 
     if not tipos:
         st.info("Nenhum tipo de manutenção cadastrado.")
@@ -182,8 +229,8 @@ elif menu == "Tipos de Manutenção":
 elif menu == "Registrar Manutenção":
     st.header("Registrar Manutenção Realizada")
 
-    veiculos = db.listar_veiculos()
-    tipos = db.listar_tipos_manutencao()
+    veiculos = carregar_veiculos(db.versao_dados())
+    tipos = carregar_tipos(db.versao_dados())
 
     if not veiculos:
         st.warning("Cadastre um veículo primeiro!")
@@ -203,7 +250,7 @@ elif menu == "Registrar Manutenção":
 
             col1, col2 = st.columns(2)
             with col1:
-                veiculo = db.obter_veiculo(veiculo_id)
+                veiculo = next(v for v in veiculos if v['id'] == veiculo_id)
                 km_realizada = st.number_input("KM na Manutenção", min_value=0.0, value=float(veiculo['km']), step=100.0)
             with col2:
                 data_realizada = st.date_input("Data da Manutenção", value=date.today())
@@ -223,35 +270,130 @@ elif menu == "Registrar Manutenção":
 
     # Histórico de manutenções
     st.subheader("Histórico de Manutenções")
-    registros = db.listar_registros_manutencao()
 
-    if not registros:
-        st.info("Nenhuma manutenção registrada ainda.")
+    # Filtros: qualquer mudança volta para a primeira página
+    voltar_inicio = lambda: st.session_state.update(hist_pagina=1)
+    nomes_veiculos = {None: "Todos", **{v['id']: f"{v['marca']} {v['modelo']} ({v['ano']})" for v in veiculos}}
+    nomes_tipos = {None: "Todos", **{t['id']: t['nome'] for t in tipos}}
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        filtro_veiculo = st.selectbox("Veículo", options=list(nomes_veiculos), format_func=nomes_veiculos.get,
+                                      key="hist_veiculo", on_change=voltar_inicio)
+    with col2:
+        filtro_tipo = st.selectbox("Tipo", options=list(nomes_tipos), format_func=nomes_tipos.get,
+                                   key="hist_tipo", on_change=voltar_inicio)
+    with col3:
+        filtro_inicio = st.date_input("De", value=None, format="DD/MM/YYYY", key="hist_inicio", on_change=voltar_inicio)
+    with col4:
+        filtro_fim = st.date_input("Até", value=None, format="DD/MM/YYYY", key="hist_fim", on_change=voltar_inicio)
+
+    por_pagina = 20
+    pagina = st.session_state.get("hist_pagina", 1)
+    filtros = dict(
+        veiculo_id=filtro_veiculo,
+        tipo_manutencao_id=filtro_tipo,
+        data_inicio=filtro_inicio.isoformat() if filtro_inicio else None,
+        data_fim=filtro_fim.isoformat() if filtro_fim else None,
+    )
+    historico = carregar_historico(db.versao_dados(), por_pagina, (pagina - 1) * por_pagina, **filtros)
+    total_paginas = max(1, -(-historico['total'] // por_pagina))
+    if pagina > total_paginas:
+        # A página atual deixou de existir (ex.: após uma exclusão)
+        pagina = st.session_state['hist_pagina'] = total_paginas
+        historico = carregar_historico(db.versao_dados(), por_pagina, (pagina - 1) * por_pagina, **filtros)
+
+    if not historico['total']:
+        if any(filtros.values()):
+            st.info("Nenhuma manutenção encontrada com esses filtros.")
+        else:
+            st.info("Nenhuma manutenção registrada ainda.")
     else:
-        for reg in sorted(registros, key=lambda x: x['data_realizada'], reverse=True):
-            veiculo = db.obter_veiculo(reg['veiculo_id'])
-            tipo = db.obter_tipo_manutencao(reg['tipo_manutencao_id'])
-
-            if veiculo and tipo:
-                with st.container():
-                    col1, col2 = st.columns([4, 1])
-                    with col1:
-                        st.write(f"**{tipo['nome']}** - {veiculo['marca']} {veiculo['modelo']}")
-                        st.caption(f"Data: {reg['data_realizada']} | KM: {reg['km_realizada']:,.0f}")
-                        if reg.get('observacao'):
-                            st.caption(f"Obs: {reg['observacao']}")
-                    with col2:
-                        if st.button("🗑️", key=f"del_reg_{reg['id']}"):
-                            db.excluir_registro_manutencao(reg['id'])
-                            st.rerun()
-                    st.divider()
+        for reg in historico['registros']:
+            with st.container():
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.write(f"**{reg['tipo_nome']}** - {reg['marca']} {reg['modelo']}")
+                    st.caption(f"Data: {reg['data_realizada']} | KM: {reg['km_realizada']:,.0f}")
+                    if reg.get('observacao'):
+                        st.caption(f"Obs: {reg['observacao']}")
+                with col2:
+                    if st.button("🗑️", key=f"del_reg_{reg['id']}"):
+                        db.excluir_registro_manutencao(reg['id'])
+                        st.rerun()
+                st.divider()
+
+        # Navegação entre páginas
+        inicio = (pagina - 1) * por_pagina + 1
+        col1, col2, col3 = st.columns([1, 3, 1])
+        with col1:
+            st.button("◀ Anterior", disabled=pagina <= 1,
+                      on_click=lambda: st.session_state.update(hist_pagina=pagina - 1))
+        with col2:
+            st.caption(f"Página {pagina} de {total_paginas} — "
+                       f"registros {inicio} a {inicio + len(historico['registros']) - 1} de {historico['total']}")
+        with col3:
+            st.button("Próxima ▶", disabled=pagina >= total_paginas,
+                      on_click=lambda: st.session_state.update(hist_pagina=pagina + 1))
+
+# ===================== BUSCA =====================
+elif menu == "Busca":
+    st.header("Busca")
+    consulta = st.text_input("Buscar", placeholder="Ex.: filtro mann, 5w30, gol óleo", key="busca_consulta",
+                             on_change=lambda: st.session_state.update(busca_pagina=1))
+    st.caption("Procura nas observações, na marca e no modelo do veículo e no nome da manutenção. "
+               "Acentos e maiúsculas são ignorados, e o começo de uma palavra já basta.")
+
+    if consulta.strip():
+        por_pagina = 20
+        pagina = st.session_state.get("busca_pagina", 1)
+        resultado = carregar_busca(db.versao_dados(), consulta, por_pagina, (pagina - 1) * por_pagina)
+        total_paginas = max(1, -(-resultado['total'] // por_pagina))
+        if pagina > total_paginas:
+            # A página atual deixou de existir (ex.: após uma exclusão)
+            pagina = st.session_state['busca_pagina'] = total_paginas
+            resultado = carregar_busca(db.versao_dados(), consulta, por_pagina, (pagina - 1) * por_pagina)
+
+        if not resultado['total'] and not resultado['veiculos']:
+            st.info("Nada encontrado para essa busca.")
+        else:
+            st.subheader(f"Veículos ({len(resultado['veiculos'])})")
+            st.dataframe(
+                [{
+                    "Veículo": f"{v['marca']} {v['modelo']} ({v['ano']})",
+                    "KM atual": v['km'],
+                    "Manutenções encontradas": v['registros'],
+                } for v in resultado['veiculos']],
+                hide_index=True,
+                column_config={"KM atual": st.column_config.NumberColumn(format="%.0f")}
+            )
+
+            st.subheader(f"Manutenções ({resultado['total']})")
+            for reg in resultado['registros']:
+                st.write(f"**{reg['tipo_nome']}** - {reg['marca']} {reg['modelo']}")
+                st.caption(f"Data: {reg['data_realizada']} | KM: {reg['km_realizada']:,.0f}")
+                if reg.get('observacao'):
+                    st.caption(f"Obs: {reg['observacao']}")
+                st.divider()
+
+            if resultado['total']:
+                inicio = (pagina - 1) * por_pagina + 1
+                col1, col2, col3 = st.columns([1, 3, 1])
+                with col1:
+                    st.button("◀ Anterior", key="busca_anterior", disabled=pagina <= 1,
+                              on_click=lambda: st.session_state.update(busca_pagina=pagina - 1))
+                with col2:
+                    st.caption(f"Página {pagina} de {total_paginas} — "
+                               f"manutenções {inicio} a {inicio + len(resultado['registros']) - 1} de {resultado['total']}")
+                with col3:
+                    st.button("Próxima ▶", key="busca_proxima", disabled=pagina >= total_paginas,
+                              on_click=lambda: st.session_state.update(busca_pagina=pagina + 1))
 
 # ===================== PRÓXIMAS MANUTENÇÕES =====================
 elif menu == "Próximas Manutenções":
     st.header("Próximas Manutenções")
 
-    veiculos = db.listar_veiculos()
-    tipos = db.listar_tipos_manutencao()
+    veiculos = carregar_veiculos(db.versao_dados())
+    tipos = carregar_tipos(db.versao_dados())
 
     if not veiculos:
         st.warning("Cadastre um veículo primeiro!")
@@ -262,42 +404,176 @@ elif menu == "Próximas Manutenções":
         veiculo_options = {f"{v['marca']} {v['modelo']} ({v['ano']}) - {v['km']:,.0f} km": v['id'] for v in veiculos}
         veiculo_sel = st.selectbox("Selecione o Veículo", options=list(veiculo_options.keys()))
         veiculo_id = veiculo_options[veiculo_sel]
-        veiculo = db.obter_veiculo(veiculo_id)
 
         st.divider()
 
-        # Mostra status de cada tipo de manutenção
-        for tipo in tipos:
-            resultado = db.calcular_proxima_manutencao(veiculo_id, tipo['id'])
-
-            if resultado:
-                with st.container():
-                    col1, col2 = st.columns([3, 1])
-
-                    with col1:
-                        st.write(f"**{resultado['tipo_nome']}**")
-
-                        if resultado['status'] == 'pendente':
-                            st.warning("⚠️ Manutenção nunca realizada")
-                        elif resultado['status'] == 'vencida':
-                            st.error("🚨 Manutenção vencida!")
-                            if resultado.get('km_faltante') is not None:
-                                st.write(f"Atrasada em {abs(resultado['km_faltante']):,.0f} km")
-                            if resultado.get('dias_faltantes') is not None:
-                                st.write(f"Atrasada em {abs(resultado['dias_faltantes'])} dias")
-                        else:
-                            st.success("✅ Em dia")
-                            if resultado.get('km_faltante') is not None:
-                                st.write(f"Próxima em {resultado['km_faltante']:,.0f} km (aos {resultado['km_proxima']:,.0f} km)")
-                            if resultado.get('dias_faltantes') is not None:
-                                st.write(f"Próxima em {resultado['dias_faltantes']} dias ({resultado['data_proxima']})")
-
-                    with col2:
-                        if st.button("Registrar", key=f"reg_{tipo['id']}"):
-                            st.session_state['goto_registrar'] = True
-                            st.rerun()
+        # Mostra status de cada tipo de manutenção, lido das projeções da agenda
+        resultados = agenda.obter_agenda().do_veiculo(veiculo_id)
+        for resultado in resultados:
+            with st.container():
+                col1, col2 = st.columns([3, 1])
+
+                with col1:
+                    st.write(f"**{resultado['tipo_nome']}**")
+
+                    if resultado['status'] == 'pendente':
+                        st.warning("⚠️ Manutenção nunca realizada")
+                    elif resultado['status'] == 'vencida':
+                        st.error("🚨 Manutenção vencida!")
+                        if resultado.get('km_faltante') is not None:
+                            st.write(f"Atrasada em {abs(resultado['km_faltante']):,.0f} km")
+                        if resultado.get('dias_faltantes') is not None:
+                            st.write(f"Atrasada em {abs(resultado['dias_faltantes'])} dias")
+                    else:
+                        st.success("✅ Em dia")
+                        if resultado.get('km_faltante') is not None:
+                            st.write(f"Próxima em {resultado['km_faltante']:,.0f} km (aos {resultado['km_proxima']:,.0f} km)")
+                        if resultado.get('dias_faltantes') is not None:
+                            st.write(f"Próxima em {resultado['dias_faltantes']} dias ({resultado['data_proxima']})")
+                    if resultado['prazo'] and resultado['taxa_km_dia']:
+                        st.caption(f"Previsão: {date.fromisoformat(resultado['prazo']).strftime('%d/%m/%Y')} "
+                                   f"(uso médio de {resultado['taxa_km_dia']:,.0f} km/dia)")
+
+                with col2:
+                    if st.button("Registrar", key=f"reg_{resultado['tipo_manutencao_id']}"):
+                        st.session_state['goto_registrar'] = True
+                        st.rerun()
+
+                st.divider()
+
+# ===================== AGENDA DA FROTA =====================
+elif menu == "Agenda da Frota":
+    st.header("Agenda da Frota")
+    st.caption("Manutenções de todos os veículos, da que vence primeiro em diante. "
+               "Prazos por km são projetados pela média de uso de cada veículo.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        modo = st.radio("Mostrar", ["Próximas", "Até uma data"], horizontal=True)
+    with col2:
+        if modo == "Próximas":
+            quantidade = st.number_input("Quantidade", min_value=1, max_value=1000, value=20, step=10)
+            itens = agenda.obter_agenda().proximas(int(quantidade))
+        else:
+            data_limite = st.date_input("Até", value=date.today(), format="DD/MM/YYYY")
+            itens = agenda.obter_agenda().ate(data_limite)
+
+    if not itens:
+        st.info("Nenhuma manutenção na agenda.")
+    else:
+        situacoes = {"pendente": "⚠️ Nunca realizada", "vencida": "🚨 Vencida", "ok": "✅ Em dia"}
+        st.dataframe(
+            [{
+                "Veículo": f"{item['marca']} {item['modelo']}",
+                "Manutenção": item['tipo_nome'],
+                "Situação": situacoes[item['status']],
+                "Prazo": date.fromisoformat(item['prazo']).strftime("%d/%m/%Y") if item['prazo'] else "",
+                "Km faltante": item['km_faltante'],
+                "Dias faltantes": item['dias_faltantes'],
+            } for item in itens],
+            hide_index=True
+        )
+
+# ===================== INDICADORES =====================
+elif menu == "Indicadores":
+    st.header("Indicadores")
+    tabelas = indicadores.obter_indicadores()
+
+    st.subheader("Manutenções por mês")
+    por_mes = tabelas.manutencoes_por_mes()
+    if por_mes.empty:
+        st.info("Nenhuma manutenção registrada.")
+    else:
+        st.bar_chart(por_mes.pivot_table(index="mes", columns="tipo", values="quantidade", fill_value=0))
 
-                    st.divider()
+    st.subheader("Km médio entre serviços")
+    km = tabelas.km_entre_servicos()
+    if km.empty:
+        st.info("É preciso ao menos duas manutenções do mesmo tipo em um veículo.")
+    else:
+        st.dataframe(
+            km.rename(columns={"tipo": "Manutenção", "km_medio": "Km médio", "intervalos": "Intervalos"}),
+            hide_index=True,
+            column_config={"Km médio": st.column_config.NumberColumn(format="%.0f")}
+        )
+
+    st.subheader("Vencidas por marca e modelo")
+    vencidas = carregar_vencidas_por_modelo(db.versao_dados(), date.today())
+    if vencidas.empty:
+        st.info("Nenhum veículo ou tipo de manutenção cadastrado.")
+    else:
+        st.dataframe(
+            vencidas.assign(taxa_vencidas=vencidas["taxa_vencidas"] * 100).rename(columns={
+                "marca": "Marca", "modelo": "Modelo", "pares": "Manutenções", "vencidas": "Vencidas",
+                "pendentes": "Nunca realizadas", "taxa_vencidas": "% vencidas",
+            }),
+            hide_index=True,
+            column_config={"% vencidas": st.column_config.NumberColumn(format="%.1f%%")}
+        )
+
+# ===================== RELATÓRIO DA FROTA =====================
+elif menu == "Relatório da Frota":
+    st.header("Relatório da Frota")
+    st.caption("Cada veículo, a situação de cada manutenção e o histórico completo, em uma única tabela.")
+
+    formato = st.radio("Formato", list(relatorio.FORMATOS), horizontal=True, format_func=str.upper)
+    if st.button("Gerar relatório"):
+        with st.spinner("Gerando relatório..."), tempfile.TemporaryDirectory() as diretorio:
+            caminho = os.path.join(diretorio, f"relatorio_frota.{formato}")
+            resumo = relatorio.exportar(caminho, formato)
+            with open(caminho, "rb") as f:
+                st.session_state['relatorio'] = {"formato": formato, "dados": f.read(), **resumo}
+
+    gerado = st.session_state.get('relatorio')
+    if gerado and gerado["formato"] == formato:
+        st.success(f"Relatório com {gerado['veiculos']} veículos e {gerado['linhas']} linhas.")
+        st.download_button(
+            "Baixar relatório",
+            data=gerado["dados"],
+            file_name=f"relatorio_frota_{date.today():%Y%m%d}.{formato}",
+            mime=relatorio.FORMATOS[formato]
+        )
+
+# ===================== DIAGNÓSTICO =====================
+elif menu == "Diagnóstico":
+    st.header("Diagnóstico do Armazenamento")
+
+    metricas = instrumentacao.resumo()
+    st.caption(f"Métricas acumuladas neste processo desde {metricas['desde'][:19].replace('T', ' ')}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Zerar métricas"):
+            instrumentacao.zerar()
+            st.rerun()
+    with col2:
+        st.download_button(
+            "Baixar JSON",
+            data=instrumentacao.para_json(),
+            file_name="diagnostico_manutencao.json",
+            mime="application/json"
+        )
+
+    st.subheader("Funções")
+    if metricas["funcoes"]:
+        st.dataframe(
+            [{"funcao": nome, **valores} for nome, valores in metricas["funcoes"].items()],
+            hide_index=True
+        )
+    else:
+        st.info("Nenhuma chamada registrada ainda.")
+
+    st.subheader("I/O de arquivos")
+    st.dataframe(
+        [{"contador": nome, "valor": valor} for nome, valor in metricas["io"].items()],
+        hide_index=True
+    )
+
+    st.subheader("Caches")
+    st.dataframe(
+        [{"cache": nome, **valores} for nome, valores in metricas["cache"].items()],
+        hide_index=True
+    )
 
 # Rodapé
 st.sidebar.divider()
@@ -0,0 +1,10 @@
+"""
+Benchmarks da camada de persistência (database.py).
+
+Gera frotas sintéticas determinísticas em um diretório temporário e mede
+cada operação pública, emitindo um relatório JSON que pode ser comparado
+entre commits:
+
+    python -m benchmarks --escala 1000 100000 --saida atual.json
+    python -m benchmarks comparar base.json atual.json
+"""
@@ -0,0 +1,317 @@
+"""
+Execução dos benchmarks e comparação de relatórios.
+
+Cada operação é repetida até `repeticoes` vezes (ou até estourar
+`tempo_max` segundos, com um mínimo de MIN_REPETICOES), medindo a latência
+de cada chamada. O pico de memória vem de uma execução extra sob
+tracemalloc, para não distorcer as latências.
+"""
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+from typing import Callable, Optional
+
+import database as db
+import frota
+from benchmarks.gerador import gerar_frota
+
+ESCALAS = [1000, 100000, 1000000]
+TIPOS = 8
+# Data em que terminam os históricos gerados: fixa, para que a mesma semente
+# gere a mesma frota em qualquer dia e os relatórios sejam comparáveis
+DATA_REFERENCIA = date(2026, 1, 1)
+REPETICOES = 100
+MIN_REPETICOES = 3
+TEMPO_MAX = 2.0
+# Variação de p50 acima da qual `comparar` aponta regressão
+LIMITE_REGRESSAO = 0.2
+
+
+def _percentil(ordenadas: list, fracao: float) -> float:
+    """Percentil pelo método do posto mais próximo."""
+    return ordenadas[max(0, min(len(ordenadas) - 1, math.ceil(fracao * len(ordenadas)) - 1))]
+
+
+def medir(
+    funcao: Callable,
+    preparar: Optional[Callable[[], tuple]] = None,
+    repeticoes: int = REPETICOES,
+    tempo_max: float = TEMPO_MAX,
+) -> dict:
+    """
+    Mede uma operação. `preparar`, se informado, roda antes de cada chamada
+    (fora da medição) e devolve os argumentos dela.
+    """
+    latencias = []
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        args = preparar() if preparar else ()
+        t0 = time.perf_counter()
+        funcao(*args)
+        latencias.append(time.perf_counter() - t0)
+        if time.perf_counter() - inicio > tempo_max and len(latencias) >= MIN_REPETICOES:
+            break
+
+    args = preparar() if preparar else ()
+    tracemalloc.start()
+    try:
+        funcao(*args)
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    total = sum(latencias)
+    ordenadas = sorted(latencias)
+    return {
+        "repeticoes": len(latencias),
+        "total_s": round(total, 6),
+        "vazao_ops_s": round(len(latencias) / total, 3) if total else None,
+        "media_ms": round(total / len(latencias) * 1000, 4),
+        "p50_ms": round(_percentil(ordenadas, 0.50) * 1000, 4),
+        "p99_ms": round(_percentil(ordenadas, 0.99) * 1000, 4),
+        "memoria_pico_kb": round(pico / 1024, 1),
+    }
+
+
+def _proximas_manutencoes_frota():
+    """A página "Próximas Manutenções" calculada para todos os veículos."""
+    tipos = db.listar_tipos_manutencao()
+    for veiculo in db.listar_veiculos():
+        for tipo in tipos:
+            db.calcular_proxima_manutencao(veiculo["id"], tipo["id"])
+
+
+def _recarregar():
+    """Descarta os caches em memória, forçando a próxima leitura do disco."""
+    db.configurar_armazenamento(data_dir=db.DATA_DIR)
+    return ()
+
+
+def operacoes(aleatorio: random.Random) -> list:
+    """Lista de (nome, função, preparar) com todas as operações medidas."""
+    ids_veiculos = [v["id"] for v in db.listar_veiculos()]
+    ids_tipos = [t["id"] for t in db.listar_tipos_manutencao()]
+    hoje = date.today().isoformat()
+
+    def veiculo():
+        return aleatorio.choice(ids_veiculos)
+
+    def tipo():
+        return aleatorio.choice(ids_tipos)
+
+    def par():
+        return (veiculo(), tipo())
+
+    def registro_novo():
+        return {
+            "veiculo_id": veiculo(),
+            "tipo_manutencao_id": tipo(),
+            "km_realizada": 1000.0,
+            "data_realizada": hoje,
+            "observacao": "benchmark",
+        }
+
+    def veiculo_existente():
+        v = db.obter_veiculo(veiculo())
+        return (v["id"], v["marca"], v["modelo"], v["ano"], v["km"])
+
+    def tipo_existente():
+        t = db.obter_tipo_manutencao(tipo())
+        return (t["id"], t["nome"], t["intervalo_km"], t["intervalo_dias"])
+
+    return [
+        ("carga_fria", db.listar_registros_manutencao, _recarregar),
+        ("listar_veiculos", db.listar_veiculos, None),
+        ("obter_veiculo", db.obter_veiculo, lambda: (veiculo(),)),
+        ("adicionar_veiculo", db.adicionar_veiculo, lambda: ("Bench", "Mark", 2020, 1000.0)),
+        ("atualizar_veiculo", db.atualizar_veiculo, veiculo_existente),
+        ("excluir_veiculo", db.excluir_veiculo,
+         lambda: (db.adicionar_veiculo("Bench", "Mark", 2020, 1000.0)["id"],)),
+        ("listar_tipos_manutencao", db.listar_tipos_manutencao, None),
+        ("obter_tipo_manutencao", db.obter_tipo_manutencao, lambda: (tipo(),)),
+        ("adicionar_tipo_manutencao", db.adicionar_tipo_manutencao, lambda: ("Bench", 5000.0, 180)),
+        ("atualizar_tipo_manutencao", db.atualizar_tipo_manutencao, tipo_existente),
+        ("excluir_tipo_manutencao", db.excluir_tipo_manutencao,
+         lambda: (db.adicionar_tipo_manutencao("Bench", 5000.0, 180)["id"],)),
+        ("listar_registros_manutencao", db.listar_registros_manutencao, None),
+        ("listar_registros_manutencao_por_veiculo", db.listar_registros_manutencao, lambda: (veiculo(),)),
+        ("adicionar_registro_manutencao", db.adicionar_registro_manutencao,
+         lambda: tuple(registro_novo().values())),
+        ("excluir_registro_manutencao", db.excluir_registro_manutencao,
+         lambda: (db.adicionar_registro_manutencao(*registro_novo().values())["id"],)),
+        ("adicionar_em_lote_100", db.adicionar_em_lote,
+         lambda: ("registros_manutencao", [registro_novo() for _ in range(100)])),
+        ("ultimo_registro_manutencao", db.ultimo_registro_manutencao, par),
+        ("listar_historico_manutencao", db.listar_historico_manutencao, None),
+        ("listar_historico_manutencao_por_veiculo", db.listar_historico_manutencao, lambda: (veiculo(),)),
+        ("calcular_proxima_manutencao", db.calcular_proxima_manutencao, par),
+        ("proximas_manutencoes_frota", _proximas_manutencoes_frota, None),
+        ("proximas_manutencoes_frota_vetorizada", frota.calcular_proximas_manutencoes_frota, None),
+    ]
+
+
+def executar_escala(
+    registros: int,
+    tipos: int = TIPOS,
+    veiculos: Optional[int] = None,
+    semente: int = 0,
+    repeticoes: int = REPETICOES,
+    tempo_max: float = TEMPO_MAX,
+    filtro: Optional[list] = None,
+) -> dict:
+    """
+    Gera uma frota com cerca de `registros` registros no diretório de dados
+    atual e mede as operações. Por padrão, usa 1 veículo a cada 100 registros.
+    """
+    veiculos = veiculos or max(10, registros // 100)
+    inicio = time.perf_counter()
+    gerado = gerar_frota(veiculos, tipos, max(1, registros // veiculos), semente, referencia=DATA_REFERENCIA)
+    resultado = {**gerado, "geracao_s": round(time.perf_counter() - inicio, 3), "operacoes": {}}
+    aleatorio = random.Random(semente)
+    for nome, funcao, preparar in operacoes(aleatorio):
+        if filtro and nome not in filtro:
+            continue
+        print(f"  {nome}...", file=sys.stderr, flush=True)
+        resultado["operacoes"][nome] = medir(funcao, preparar, repeticoes, tempo_max)
+    return resultado
+
+
+def _commit_atual() -> Optional[str]:
+    """Hash do commit do repositório, se disponível."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def executar(
+    escalas: list = ESCALAS,
+    backend: str = "json",
+    journal: bool = False,
+    particionamento: str = "",
+    **kwargs,
+) -> dict:
+    """
+    Roda os benchmarks em cada escala, cada uma em um diretório temporário
+    novo. A configuração de armazenamento anterior é restaurada ao final.
+    `particionamento` vale só para o backend JSON (veja
+    database.particionar_registros).
+    """
+    data_dir_anterior, backend_anterior, journal_anterior = db.DATA_DIR, db.BACKEND, db.USAR_JOURNAL
+    relatorio = {
+        "metadados": {
+            "commit": _commit_atual(),
+            "data": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "backend": backend,
+            "journal": journal,
+            "particionamento": particionamento,
+            **{k: v for k, v in kwargs.items() if k != "filtro"},
+        },
+        "escalas": [],
+    }
+    try:
+        db.USAR_JOURNAL = journal
+        for registros in escalas:
+            with tempfile.TemporaryDirectory(prefix="bench_manutencao_") as diretorio:
+                db.configurar_armazenamento(data_dir=diretorio, backend=backend)
+                if particionamento:
+                    db.particionar_registros(particionamento)
+                print(f"Escala de {registros} registros", file=sys.stderr, flush=True)
+                relatorio["escalas"].append({"escala": registros, **executar_escala(registros, **kwargs)})
+    finally:
+        db.USAR_JOURNAL = journal_anterior
+        db.configurar_armazenamento(data_dir=data_dir_anterior, backend=backend_anterior)
+    return relatorio
+
+
+def comparar(base: dict, atual: dict, limite: float = LIMITE_REGRESSAO) -> list:
+    """
+    Compara o p50 de cada operação em cada escala presente nos dois
+    relatórios. Retorna uma lista de dicts com a variação relativa e se ela
+    passa do limite de regressão.
+    """
+    escalas_base = {e["escala"]: e for e in base["escalas"]}
+    comparacao = []
+    for escala in atual["escalas"]:
+        anterior = escalas_base.get(escala["escala"])
+        if not anterior:
+            continue
+        for nome, medida in escala["operacoes"].items():
+            if nome not in anterior["operacoes"]:
+                continue
+            p50_base = anterior["operacoes"][nome]["p50_ms"]
+            variacao = (medida["p50_ms"] - p50_base) / p50_base if p50_base else 0.0
+            comparacao.append({
+                "escala": escala["escala"],
+                "operacao": nome,
+                "p50_base_ms": p50_base,
+                "p50_atual_ms": medida["p50_ms"],
+                "variacao": round(variacao, 4),
+                "regressao": variacao > limite,
+            })
+    return comparacao
+
+
+def main(argv: Optional[list] = None):
+    """Ponto de entrada de `python -m benchmarks`."""
+    import argparse
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["comparar"]:
+        parser = argparse.ArgumentParser(prog="python -m benchmarks comparar")
+        parser.add_argument("base")
+        parser.add_argument("atual")
+        parser.add_argument("--limite", type=float, default=LIMITE_REGRESSAO,
+                            help="variação relativa do p50 considerada regressão")
+        args = parser.parse_args(argv[1:])
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.atual, encoding="utf-8") as f:
+            atual = json.load(f)
+        comparacao = comparar(base, atual, args.limite)
+        for linha in comparacao:
+            marca = "REGRESSÃO" if linha["regressao"] else ""
+            print(f"{linha['escala']:>9} {linha['operacao']:<42} {linha['p50_base_ms']:>12.4f} "
+                  f"{linha['p50_atual_ms']:>12.4f} {linha['variacao']:>+8.1%} {marca}")
+        sys.exit(1 if any(linha["regressao"] for linha in comparacao) else 0)
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--escala", type=int, nargs="+", default=ESCALAS, help="quantidades de registros")
+    # "servidor" mediria o cliente, não o armazenamento, e depende de um servidor já rodando
+    parser.add_argument("--backend", choices=[b for b in db.BACKENDS if b != "servidor"], default="json")
+    parser.add_argument("--journal", action="store_true", help="usa o modo journal do backend JSON")
+    parser.add_argument("--particionamento", choices=[p for p in db.PARTICIONAMENTOS if p], default="",
+                        help="particiona os registros do backend JSON")
+    parser.add_argument("--tipos", type=int, default=TIPOS)
+    parser.add_argument("--veiculos", type=int, help="número de veículos (padrão: registros / 100)")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES)
+    parser.add_argument("--tempo-max", type=float, default=TEMPO_MAX, help="segundos por operação")
+    parser.add_argument("--operacao", action="append", dest="filtro", help="mede só esta operação (repetível)")
+    parser.add_argument("--saida", help="arquivo JSON do relatório (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    relatorio = executar(
+        args.escala, args.backend, args.journal, args.particionamento,
+        tipos=args.tipos, veiculos=args.veiculos, semente=args.semente,
+        repeticoes=args.repeticoes, tempo_max=args.tempo_max, filtro=args.filtro,
+    )
+    conteudo = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(conteudo + "\n")
+    else:
+        print(conteudo)
@@ -0,0 +1,96 @@
+"""
+Gerador de frotas sintéticas.
+Com a mesma semente e os mesmos tamanhos, gera sempre os mesmos dados.
+"""
+import random
+from datetime import date, timedelta
+from typing import Optional
+
+import database as db
+
+MARCAS = {
+    "Fiat": ["Uno", "Palio", "Strada", "Toro"],
+    "Volkswagen": ["Gol", "Polo", "Saveiro", "Amarok"],
+    "Chevrolet": ["Onix", "S10", "Montana"],
+    "Ford": ["Ka", "Ranger", "Transit"],
+    "Mercedes-Benz": ["Sprinter", "Accelo", "Atego"],
+}
+
+TIPOS = [
+    ("Troca de óleo", 10000.0, 180),
+    ("Filtro de ar", 15000.0, 365),
+    ("Pastilhas de freio", 30000.0, None),
+    ("Alinhamento e balanceamento", 10000.0, None),
+    ("Correia dentada", 60000.0, 1460),
+    ("Fluido de freio", None, 730),
+    ("Revisão geral", 20000.0, 365),
+    ("Bateria", None, 1095),
+]
+
+OBSERVACOES = [
+    "", "", "",
+    "Óleo Mobil 5W30, filtro Mann",
+    "Óleo Shell Helix 5W40, filtro Tecfil",
+    "Pastilhas Bosch",
+    "Filtro de ar Fram",
+    "Bateria Moura 60Ah",
+    "Correia Gates",
+]
+
+
+def gerar_frota(
+    veiculos: int,
+    tipos: int,
+    registros_por_veiculo: int,
+    semente: int = 0,
+    referencia: Optional[date] = None,
+) -> dict:
+    """
+    Popula o armazenamento atual (veja database.configurar_armazenamento) com
+    uma frota sintética. Os registros de cada veículo avançam no tempo e na
+    quilometragem, terminando até a data de referência (padrão: hoje).
+    Retorna as quantidades geradas.
+    """
+    aleatorio = random.Random(semente)
+    hoje = referencia or date.today()
+
+    lista_tipos = []
+    for i in range(tipos):
+        nome, intervalo_km, intervalo_dias = TIPOS[i % len(TIPOS)]
+        if i >= len(TIPOS):
+            nome = f"{nome} {i // len(TIPOS) + 1}"
+        lista_tipos.append({"nome": nome, "intervalo_km": intervalo_km, "intervalo_dias": intervalo_dias})
+    ids_tipos = [t["id"] for t in db.adicionar_em_lote("manutencoes", lista_tipos)]
+
+    # Os registros são montados antes dos veículos para que a quilometragem
+    # atual de cada veículo fique depois da última manutenção
+    lista_veiculos, historicos = [], []
+    for _ in range(veiculos):
+        km_por_dia = aleatorio.uniform(20, 300)
+        dia = hoje - timedelta(days=registros_por_veiculo * aleatorio.randint(5, 20))
+        km = aleatorio.uniform(0, 50000)
+        historico = []
+        for _ in range(registros_por_veiculo):
+            passo = aleatorio.randint(1, 30)
+            dia = min(dia + timedelta(days=passo), hoje)
+            km += passo * km_por_dia
+            historico.append({
+                "tipo_manutencao_id": aleatorio.choice(ids_tipos),
+                "km_realizada": round(km, 1),
+                "data_realizada": dia.isoformat(),
+                "observacao": aleatorio.choice(OBSERVACOES),
+            })
+        marca = aleatorio.choice(list(MARCAS))
+        lista_veiculos.append({
+            "marca": marca,
+            "modelo": aleatorio.choice(MARCAS[marca]),
+            "ano": aleatorio.randint(2005, hoje.year),
+            "km": round(km + aleatorio.uniform(0, 5000), 1),
+        })
+        historicos.append(historico)
+
+    registros = []
+    for veiculo, historico in zip(db.adicionar_em_lote("veiculos", lista_veiculos), historicos):
+        registros.extend({"veiculo_id": veiculo["id"], **registro} for registro in historico)
+    db.adicionar_em_lote("registros_manutencao", registros)
+    return {"veiculos": veiculos, "tipos": tipos, "registros": len(registros)}
@@ -0,0 +1,373 @@
+"""
+Busca textual nos registros de manutenção: observação do registro, marca e
+modelo do veículo e nome do tipo de manutenção.
+
+O índice é invertido: cada termo (sem acentos, em minúsculas) aponta para as
+observações, os veículos e os tipos em que aparece. Os termos também ficam
+em uma lista ordenada, para que um prefixo ("filt") seja resolvido com
+bisect em vez de varrer o vocabulário. Observações repetidas ("Óleo Mobil
+5W30, filtro Mann") são indexadas uma vez só.
+
+O índice é uma visão incremental (veja visao.py), atualizada a cada escrita.
+Os termos de cada observação, a parte cara da montagem, ficam gravados em
+busca.json: eles só dependem do texto, então o arquivo nunca fica
+desatualizado e é regravado apenas quando uma montagem encontra textos que
+ainda não estavam nele.
+"""
+import bisect
+import heapq
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+from operator import itemgetter
+from typing import Optional
+
+import database as db
+import visao
+
+# Palavras ignoradas na consulta quando há outras ("troca de óleo")
+PALAVRAS_VAZIAS = frozenset({
+    "a", "o", "e", "as", "os", "de", "da", "do", "das", "dos", "em", "na", "no", "nas", "nos", "com", "para", "por",
+})
+
+# Palavras, inclusive códigos com hífen, barra ou ponto ("5W-30", "W712/75")
+_PALAVRAS = re.compile(r"\w+(?:[-/.]\w+)*")
+_SEPARADORES = re.compile(r"[-/.]")
+# Acentos e demais sinais diacríticos, separados da letra pela forma NFKD
+_DIACRITICOS = re.compile("[\u0300-\u036f]")
+
+# Muda quando termos() muda, invalidando os termos gravados
+VERSAO_TERMOS = 1
+
+# Índices de termos: observações, veículos e tipos
+_OBSERVACOES, _VEICULOS, _TIPOS = range(3)
+
+
+def _caminho() -> str:
+    """Arquivo com os termos das observações, no diretório de dados atual."""
+    return os.path.join(db.DATA_DIR, "busca.json")
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """Texto sem acentos e em minúsculas."""
+    texto = texto or ""
+    if not texto.isascii():
+        texto = _DIACRITICOS.sub("", unicodedata.normalize("NFKD", texto))
+    return texto.casefold()
+
+
+def termos(texto: Optional[str]) -> set:
+    """
+    Termos indexados de um texto: cada palavra e, nos códigos com hífen,
+    barra ou ponto, também as partes e o código sem separadores (5W-30 vira
+    5w, 30 e 5w30).
+    """
+    resultado = set()
+    for palavra in _PALAVRAS.findall(normalizar(texto)):
+        partes = _SEPARADORES.split(palavra)
+        resultado.update(partes)
+        if len(partes) > 1:
+            resultado.add("".join(partes))
+    return resultado
+
+
+def _termos_consulta(consulta: str) -> list:
+    """Termos de uma consulta; códigos são procurados sem os separadores."""
+    palavras = {_SEPARADORES.sub("", palavra) for palavra in _PALAVRAS.findall(normalizar(consulta))}
+    return sorted(palavras - PALAVRAS_VAZIAS or palavras)
+
+
+def _carregar_termos() -> dict:
+    """Termos gravados de cada observação; vazio se o arquivo não servir."""
+    try:
+        with open(_caminho(), encoding="utf-8") as f:
+            gravado = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if gravado.get("versao") != VERSAO_TERMOS:
+        return {}
+    return gravado["termos"]
+
+
+class IndiceBusca(visao.VisaoIncremental):
+    """Índice invertido dos registros, veículos e tipos, atualizado pelas escritas."""
+
+    def __init__(self):
+        super().__init__()
+        self._vocabulario: list = []     # termos em ordem, para a busca por prefixo
+        self._termos = ({}, {}, {})      # termo -> observações, veiculo_ids e tipo_ids
+        self._por_observacao: dict = {}  # observação -> ids dos registros
+        self._por_veiculo: dict = {}     # veiculo_id -> ids dos registros
+        self._por_tipo: dict = {}        # tipo_id -> ids dos registros
+        self._registros: dict = {}       # id -> (data_realizada, -id, veiculo_id, tipo_id, observação)
+        self._veiculos: dict = {}        # veiculo_id -> termos
+        self._tipos: dict = {}           # tipo_id -> termos
+
+    # ---------- termos ----------
+
+    def _adicionar_termos(self, posicao: int, chave, termos_chave) -> list:
+        """Associa os termos à chave; retorna os termos novos no vocabulário."""
+        indice = self._termos[posicao]
+        novos = []
+        for termo in termos_chave:
+            chaves = indice.get(termo)
+            if chaves is None:
+                if not any(termo in outro for outro in self._termos):
+                    novos.append(termo)
+                chaves = indice[termo] = set()
+            chaves.add(chave)
+        return novos
+
+    def _remover_termos(self, posicao: int, chave, termos_chave):
+        """Desfaz _adicionar_termos, tirando do vocabulário os termos que sobrarem vazios."""
+        indice = self._termos[posicao]
+        for termo in termos_chave:
+            chaves = indice.get(termo)
+            if chaves is None:
+                continue
+            chaves.discard(chave)
+            if not chaves:
+                del indice[termo]
+                if not any(termo in outro for outro in self._termos):
+                    del self._vocabulario[bisect.bisect_left(self._vocabulario, termo)]
+
+    def _ordenar(self, novos: list):
+        """Insere no vocabulário os termos novos de uma atualização."""
+        for termo in novos:
+            bisect.insort(self._vocabulario, termo)
+
+    # ---------- documentos ----------
+
+    def _incluir_registro(self, registro: dict, conhecidos: Optional[dict] = None) -> list:
+        """
+        Indexa um registro; retorna os termos novos no vocabulário.
+        `conhecidos` são termos já calculados, por observação.
+        """
+        registro_id = registro["id"]
+        observacao = registro.get("observacao") or ""
+        novos = []
+        ids = self._por_observacao.get(observacao)
+        if ids is None:
+            ids = self._por_observacao[observacao] = set()
+            termos_observacao = conhecidos.get(observacao) if conhecidos else None
+            if termos_observacao is None:
+                termos_observacao = termos(observacao)
+            novos = self._adicionar_termos(_OBSERVACOES, observacao, termos_observacao)
+        ids.add(registro_id)
+        veiculo_id, tipo_id = registro["veiculo_id"], registro["tipo_manutencao_id"]
+        self._por_veiculo.setdefault(veiculo_id, set()).add(registro_id)
+        self._por_tipo.setdefault(tipo_id, set()).add(registro_id)
+        # Os dois primeiros campos são a ordem do histórico (mais recente = maior)
+        self._registros[registro_id] = (registro["data_realizada"], -registro_id, veiculo_id, tipo_id, observacao)
+        return novos
+
+    def _excluir_registro(self, registro_id: int):
+        """Tira um registro do índice."""
+        registro = self._registros.pop(registro_id, None)
+        if registro is None:
+            return
+        _, _, veiculo_id, tipo_id, observacao = registro
+        for grupos, chave in ((self._por_veiculo, veiculo_id), (self._por_tipo, tipo_id)):
+            grupos[chave].discard(registro_id)
+            if not grupos[chave]:
+                del grupos[chave]
+        ids = self._por_observacao[observacao]
+        ids.discard(registro_id)
+        if not ids:
+            del self._por_observacao[observacao]
+            self._remover_termos(_OBSERVACOES, observacao, termos(observacao))
+
+    def _incluir_veiculo(self, veiculo: dict) -> list:
+        """Indexa (ou reindexa) a marca e o modelo de um veículo."""
+        self._remover_termos(_VEICULOS, veiculo["id"], self._veiculos.get(veiculo["id"], ()))
+        termos_veiculo = self._veiculos[veiculo["id"]] = termos(f"{veiculo['marca']} {veiculo['modelo']}")
+        return self._adicionar_termos(_VEICULOS, veiculo["id"], termos_veiculo)
+
+    def _incluir_tipo(self, tipo: dict) -> list:
+        """Indexa (ou reindexa) o nome de um tipo de manutenção."""
+        self._remover_termos(_TIPOS, tipo["id"], self._tipos.get(tipo["id"], ()))
+        termos_tipo = self._tipos[tipo["id"]] = termos(tipo["nome"])
+        return self._adicionar_termos(_TIPOS, tipo["id"], termos_tipo)
+
+    def _excluir_veiculo(self, veiculo_id: int):
+        """Tira do índice um veículo e os registros dele."""
+        self._remover_termos(_VEICULOS, veiculo_id, self._veiculos.pop(veiculo_id, ()))
+        for registro_id in list(self._por_veiculo.get(veiculo_id, ())):
+            self._excluir_registro(registro_id)
+
+    def _excluir_tipo(self, tipo_id: int):
+        """Tira do índice um tipo de manutenção e os registros dele."""
+        self._remover_termos(_TIPOS, tipo_id, self._tipos.pop(tipo_id, ()))
+        for registro_id in list(self._por_tipo.get(tipo_id, ())):
+            self._excluir_registro(registro_id)
+
+    # ---------- montagem e gravação ----------
+
+    def _limpar(self):
+        """Esvazia o índice."""
+        for estrutura in (*self._termos, self._por_observacao, self._por_veiculo, self._por_tipo,
+                          self._registros, self._veiculos, self._tipos):
+            estrutura.clear()
+        self._vocabulario = []
+
+    def _montar(self):
+        """Indexa veículos, tipos e registros lidos do database."""
+        self._limpar()
+        for veiculo in db.listar_veiculos():
+            self._incluir_veiculo(veiculo)
+        for tipo in db.listar_tipos_manutencao():
+            self._incluir_tipo(tipo)
+        conhecidos = _carregar_termos()
+        for registro in db.listar_registros_manutencao():
+            self._incluir_registro(registro, conhecidos)
+        # Uma ordenação no fim em vez de uma inserção ordenada por termo novo
+        self._vocabulario = sorted(set().union(*self._termos))
+        if not self._por_observacao.keys() <= conhecidos.keys():
+            self._gravar_termos()
+
+    def _gravar_termos(self):
+        """Grava os termos de cada observação indexada."""
+        de_observacoes = self._termos[_OBSERVACOES]
+        por_observacao = {observacao: [] for observacao in self._por_observacao}
+        for termo, observacoes in de_observacoes.items():
+            for observacao in observacoes:
+                por_observacao[observacao].append(termo)
+        temporario = _caminho() + ".tmp"
+        try:
+            with open(temporario, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"versao": VERSAO_TERMOS, "termos": por_observacao}, ensure_ascii=False))
+            os.replace(temporario, _caminho())
+        except OSError:
+            # Sem os termos gravados, a próxima montagem só demora mais
+            pass
+
+    # ---------- atualização incremental ----------
+
+    def _aplicar(self, operacao: str, parametros: dict, resultado) -> bool:
+        """Aplica a escrita ao índice; retorna False se for preciso remontá-lo."""
+        novos = []
+        if operacao == "adicionar_registro_manutencao":
+            novos = self._incluir_registro(resultado)
+        elif operacao == "excluir_registro_manutencao":
+            if resultado:
+                self._excluir_registro(resultado["id"])
+        elif operacao in ("adicionar_veiculo", "atualizar_veiculo"):
+            if resultado:
+                novos = self._incluir_veiculo(resultado)
+        elif operacao == "excluir_veiculo":
+            if resultado:
+                self._excluir_veiculo(parametros["veiculo_id"])
+        elif operacao in ("adicionar_tipo_manutencao", "atualizar_tipo_manutencao"):
+            if resultado:
+                novos = self._incluir_tipo(resultado)
+        elif operacao == "excluir_tipo_manutencao":
+            if resultado:
+                self._excluir_tipo(parametros["manutencao_id"])
+        elif operacao == "adicionar_em_lote":
+            incluir = {
+                "veiculos": self._incluir_veiculo,
+                "manutencoes": self._incluir_tipo,
+                "registros_manutencao": self._incluir_registro,
+            }[parametros["colecao"]]
+            for item in resultado:
+                novos.extend(incluir(item))
+        # Demais escritas (odômetro, particionamento, compactação) não mudam os textos
+        self._ordenar(novos)
+        return True
+
+    # ---------- consultas ----------
+
+    def _casar(self, prefixo: str) -> tuple:
+        """Observações, veículos e tipos com algum termo que começa com o prefixo."""
+        casados = (set(), set(), set())
+        i = bisect.bisect_left(self._vocabulario, prefixo)
+        while i < len(self._vocabulario) and self._vocabulario[i].startswith(prefixo):
+            termo = self._vocabulario[i]
+            for chaves, indice in zip(casados, self._termos):
+                chaves.update(indice.get(termo, ()))
+            i += 1
+        return casados
+
+    def _estimativa(self, casados: tuple) -> float:
+        """Registros esperados de um casamento, pela média de registros por observação, veículo e tipo."""
+        total = len(self._registros)
+        return sum(
+            len(chaves) * total / max(len(grupos), 1)
+            for grupos, chaves in zip((self._por_observacao, self._por_veiculo, self._por_tipo), casados)
+        )
+
+    def _grupos(self, casados: tuple):
+        """Conjuntos de ids dos registros das observações, veículos e tipos casados."""
+        for grupos, chaves in zip((self._por_observacao, self._por_veiculo, self._por_tipo), casados):
+            for chave in chaves:
+                if chave in grupos:
+                    yield grupos[chave]
+
+    def buscar(self, consulta: str, limite: int = 20, deslocamento: int = 0) -> dict:
+        """
+        Busca os registros em que cada termo da consulta é início de alguma
+        palavra da observação, do veículo (marca e modelo) ou do tipo. Acentos
+        e maiúsculas são ignorados, e os registros vêm do mais recente para o
+        mais antigo, no formato de database.listar_historico_manutencao.
+        Retorna {"total": ..., "registros": [...], "veiculos": [...]}, em que
+        "veiculos" são os veículos encontrados (pela marca e modelo ou por
+        algum registro), cada um com a quantidade de registros encontrados.
+        """
+        termos_consulta = _termos_consulta(consulta)
+        if not termos_consulta:
+            return {"total": 0, "registros": [], "veiculos": []}
+        with self._lock:
+            self._atualizar_versao()
+            # Só o termo com menos registros (estimados) é expandido; os demais filtram o resultado
+            casamentos = sorted((self._casar(termo) for termo in termos_consulta), key=self._estimativa)
+            registro_ids = set().union(*self._grupos(casamentos[0]))
+            for observacoes, veiculo_ids, tipo_ids in casamentos[1:]:
+                registro_ids = {
+                    registro_id for registro_id in registro_ids
+                    for _, _, veiculo_id, tipo_id, observacao in [self._registros[registro_id]]
+                    if observacao in observacoes or veiculo_id in veiculo_ids or tipo_id in tipo_ids
+                }
+            veiculo_ids = set.intersection(*(veiculo_ids for _, veiculo_ids, _ in casamentos))
+            # Tira os registros de veículos ou tipos excluídos, que o histórico não mostra
+            for grupos, existentes in ((self._por_veiculo, self._veiculos), (self._por_tipo, self._tipos)):
+                for chave in grupos.keys() - existentes.keys():
+                    registro_ids -= grupos[chave]
+            encontrados = list(map(self._registros.__getitem__, registro_ids))
+        pagina = heapq.nlargest(deslocamento + limite, encontrados)[deslocamento:]
+        por_veiculo = Counter(map(itemgetter(2), encontrados))
+        veiculos = {v["id"]: v for v in db.listar_veiculos()}
+        tipos = {t["id"]: t for t in db.listar_tipos_manutencao()}
+
+        registros = []
+        completos = {}
+        for _, menos_id, veiculo_id, tipo_id, _ in pagina:
+            if veiculo_id not in completos:
+                completos[veiculo_id] = {r["id"]: r for r in db.listar_registros_manutencao(veiculo_id)}
+            registro = completos[veiculo_id].get(-menos_id)
+            if registro is None or veiculo_id not in veiculos or tipo_id not in tipos:
+                # Excluído depois da consulta ao índice
+                continue
+            registros.append({
+                **registro,
+                "marca": veiculos[veiculo_id]["marca"],
+                "modelo": veiculos[veiculo_id]["modelo"],
+                "tipo_nome": tipos[tipo_id]["nome"],
+            })
+        encontrados_veiculos = [
+            {**veiculos[veiculo_id], "registros": por_veiculo.get(veiculo_id, 0)}
+            for veiculo_id in sorted(veiculo_ids | por_veiculo.keys(), key=lambda v: (-por_veiculo.get(v, 0), v))
+            if veiculo_id in veiculos
+        ]
+        return {"total": len(encontrados), "registros": registros, "veiculos": encontrados_veiculos}
+
+
+def obter_indice() -> IndiceBusca:
+    """Índice de busca compartilhado pelo processo, criado no primeiro uso."""
+    return IndiceBusca.compartilhada()
+
+
+def buscar(consulta: str, limite: int = 20, deslocamento: int = 0) -> dict:
+    """Busca no índice compartilhado; veja IndiceBusca.buscar."""
+    return obter_indice().buscar(consulta, limite, deslocamento)
@@ -1,15 +1,233 @@
 """
 Módulo de persistência de dados usando JSON.
+Opcionalmente, os dados podem ficar em SQLite (ver database_sqlite.py) ou
+com um servidor de dados compartilhado por vários processos (ver servidor.py
+e database_cliente.py), e os registros de manutenção podem ser particionados
+por veículo (ver particionar_registros ou `python database.py veiculo`).
 """
+import bisect
+import contextlib
+import functools
+import heapq
+import inspect
 import json
 import os
-from datetime import datetime
+import threading
+from datetime import date, datetime, timedelta
+from operator import itemgetter
 from typing import Optional
 
+import instrumentacao
+from instrumentacao import instrumentar
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 VEICULOS_FILE = os.path.join(DATA_DIR, "veiculos.json")
 MANUTENCOES_FILE = os.path.join(DATA_DIR, "manutencoes.json")
 REGISTROS_FILE = os.path.join(DATA_DIR, "registros_manutencao.json")
+ODOMETRO_FILE = os.path.join(DATA_DIR, "leituras_odometro.json")
+SEQUENCIAS_FILE = os.path.join(DATA_DIR, "sequencias.json")
+SQLITE_FILE = os.path.join(DATA_DIR, "manutencao.db")
+REGISTROS_DIR = os.path.join(DATA_DIR, "registros")
+MANIFESTO_FILE = os.path.join(REGISTROS_DIR, "manifesto.json")
+
+# Backend de armazenamento: "json" (padrão), "sqlite" ou "servidor"
+BACKENDS = ("json", "sqlite", "servidor")
+BACKEND = os.environ.get("MANUTENCAO_BACKEND", "json")
+
+# Endereço do servidor de dados no backend "servidor": caminho de um socket
+# Unix ou "host:porta"
+SERVIDOR = os.environ.get("MANUTENCAO_SERVIDOR", os.path.join(DATA_DIR, "servidor.sock"))
+
+# Quantos dias de leituras de odômetro manter no histórico de cada veículo
+ODOMETRO_DIAS = 365
+
+# Sincroniza com o disco (fsync) cada gravação. Desligar (MANUTENCAO_FSYNC=0)
+# só faz sentido em testes e benchmarks: uma queda de energia pode perder dados.
+SINCRONIZAR = os.environ.get("MANUTENCAO_FSYNC", "1") != "0"
+
+
+def configurar_armazenamento(
+    data_dir: Optional[str] = None,
+    backend: Optional[str] = None,
+    servidor: Optional[str] = None,
+):
+    """
+    Altera o diretório de dados, o backend em uso e/ou o endereço do
+    servidor de dados. Os caches em memória são descartados.
+    """
+    global DATA_DIR, VEICULOS_FILE, MANUTENCOES_FILE, REGISTROS_FILE, ODOMETRO_FILE, SEQUENCIAS_FILE, SQLITE_FILE
+    global REGISTROS_DIR, MANIFESTO_FILE, BACKEND, SERVIDOR
+    if backend is not None and backend not in BACKENDS:
+        raise ValueError(f"Backend desconhecido: {backend}")
+    with _cache_lock:
+        if data_dir is not None:
+            DATA_DIR = data_dir
+            VEICULOS_FILE = os.path.join(DATA_DIR, "veiculos.json")
+            MANUTENCOES_FILE = os.path.join(DATA_DIR, "manutencoes.json")
+            REGISTROS_FILE = os.path.join(DATA_DIR, "registros_manutencao.json")
+            ODOMETRO_FILE = os.path.join(DATA_DIR, "leituras_odometro.json")
+            SEQUENCIAS_FILE = os.path.join(DATA_DIR, "sequencias.json")
+            SQLITE_FILE = os.path.join(DATA_DIR, "manutencao.db")
+            REGISTROS_DIR = os.path.join(DATA_DIR, "registros")
+            MANIFESTO_FILE = os.path.join(REGISTROS_DIR, "manifesto.json")
+        if backend is not None:
+            BACKEND = backend
+        if servidor is not None:
+            SERVIDOR = servidor
+        _cache.clear()
+        _journal_cache.clear()
+        _listagens.clear()
+    _nova_versao()
+
+
+# Funções encaminhadas por _backend (as públicas e as internas que elas usam)
+# e, entre elas, as de escrita; são as que o servidor de dados atende
+_funcoes_backend: set = set()
+_funcoes_escrita: set = set()
+
+
+def _backend(func):
+    """
+    Encaminha a função para a implementação de mesmo nome no backend SQLite
+    ou para o servidor de dados quando um deles estiver ativo. Caso
+    contrário, usa a implementação JSON.
+    """
+    _funcoes_backend.add(func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if BACKEND == "sqlite":
+            import database_sqlite
+            return getattr(database_sqlite, func.__name__)(*args, **kwargs)
+        if BACKEND == "servidor":
+            import database_cliente
+            return database_cliente.chamar(func.__name__, *args, **kwargs)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _escrita(func):
+    """
+    Gera uma nova versão dos dados depois de cada chamada da função e, se ela
+    terminar sem erro, avisa os ouvintes registrados (veja registrar_ouvinte).
+    No backend JSON, a chamada roda em um grupo de gravação (veja
+    _executar_em_grupo) e só retorna depois que os dados estão no disco.
+    """
+    parametros_func = inspect.signature(func)
+    _funcoes_escrita.add(func.__name__)
+    # Uma função interna (ex.: _excluir_registro_manutencao) é anunciada com o
+    # nome da função pública que a usa
+    operacao = func.__name__.lstrip("_")
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        antes = _assinatura_armazenamento()
+        try:
+            if BACKEND == "json":
+                resultado = _executar_em_grupo(functools.partial(func, *args, **kwargs))
+            else:
+                resultado = func(*args, **kwargs)
+        except BaseException:
+            _nova_versao()
+            raise
+        versao = _nova_versao(antes)
+        if _ouvintes:
+            chamada = parametros_func.bind(*args, **kwargs)
+            chamada.apply_defaults()
+            for ouvinte in list(_ouvintes):
+                ouvinte(operacao, chamada.arguments, resultado, versao)
+        return resultado
+    return wrapper
+
+
+# Funções avisadas depois de cada escrita feita por este processo
+_ouvintes: list = []
+
+
+def registrar_ouvinte(ouvinte):
+    """
+    Registra `ouvinte(operacao, parametros, resultado, versao)`, chamado
+    depois de cada escrita bem-sucedida com o nome da função pública, seus
+    argumentos por nome, o que ela retornou e a versão dos dados resultante.
+    O ouvinte roda na thread de quem escreveu e não deve levantar exceções.
+    """
+    _ouvintes.append(ouvinte)
+
+
+def remover_ouvinte(ouvinte):
+    """Remove um ouvinte registrado com registrar_ouvinte."""
+    _ouvintes.remove(ouvinte)
+
+
+# Versão dos dados: cresce a cada escrita feita por este processo e sempre que
+# o armazenamento for alterado por fora (outro processo, importação pela CLI).
+# Serve de chave para caches de leitura, como os do app.py.
+_versao = 0
+_versao_assinatura: Optional[tuple] = None
+_versao_lock = threading.Lock()
+
+
+def _nova_versao(antes: Optional[tuple] = None) -> int:
+    """
+    Incrementa a versão dos dados e retorna-a. `antes` é a assinatura do
+    armazenamento antes de uma escrita deste processo: se ela era a última
+    vista, a assinatura nova é registrada para que versao_dados não conte
+    a mesma escrita de novo.
+    """
+    global _versao, _versao_assinatura
+    depois = _assinatura_armazenamento() if antes is not None else None
+    with _versao_lock:
+        _versao += 1
+        if antes is not None and antes == _versao_assinatura:
+            _versao_assinatura = depois
+        return _versao
+
+
+def _absorver_assinatura(antes: tuple):
+    """
+    Registra a assinatura atual sem mudar a versão, para gravações que não
+    alteram os dados (ex.: compactação do journal).
+    """
+    global _versao_assinatura
+    depois = _assinatura_armazenamento()
+    with _versao_lock:
+        if antes == _versao_assinatura:
+            _versao_assinatura = depois
+
+
+def _assinatura_armazenamento() -> tuple:
+    """Identifica o estado atual do armazenamento em uso."""
+    if BACKEND == "sqlite":
+        import database_sqlite
+        return (BACKEND, SQLITE_FILE, database_sqlite.versao_armazenamento())
+    if BACKEND == "servidor":
+        import database_cliente
+        return (BACKEND, SERVIDOR, database_cliente.versao_armazenamento())
+    # Toda escrita em partições de registros regrava o manifesto
+    arquivos = [ODOMETRO_FILE, MANIFESTO_FILE]
+    for arquivo in (VEICULOS_FILE, MANUTENCOES_FILE, REGISTROS_FILE):
+        arquivos += [arquivo, _arquivo_journal(arquivo)]
+    return (BACKEND,) + tuple((a, _assinatura_arquivo(a)) for a in arquivos)
+
+
+def versao_dados() -> int:
+    """
+    Retorna a versão atual dos dados. O número só cresce e muda a cada
+    alteração; enquanto ele for o mesmo, leituras repetidas dão o mesmo resultado.
+    """
+    global _versao, _versao_assinatura
+    assinatura = _assinatura_armazenamento()
+    with _versao_lock:
+        if assinatura != _versao_assinatura:
+            _versao += 1
+            _versao_assinatura = assinatura
+        return _versao
 
 
 def _garantir_diretorio():
@@ -17,185 +235,1226 @@ def _garantir_diretorio():
     os.makedirs(DATA_DIR, exist_ok=True)
 
 
+# Cache dos arquivos já lidos, compartilhado por todas as sessões do processo.
+# Cada entrada guarda a assinatura (mtime, tamanho) do arquivo no momento da
+# leitura; se o arquivo for alterado por fora, ele é relido na próxima chamada.
+_cache: dict = {}
+_cache_lock = threading.RLock()
+
+
+def _assinatura(st: os.stat_result) -> tuple:
+    """
+    Identifica uma versão do arquivo pelo mtime, tamanho e inode (as
+    gravações trocam o arquivo inteiro, que ganha um inode novo).
+    """
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+@instrumentar
+def _ler_json(arquivo: str) -> tuple:
+    """Lê um arquivo JSON do disco, retornando (assinatura, dados)."""
+    with open(arquivo, "r", encoding="utf-8") as f:
+        # A assinatura vem do arquivo aberto para corresponder ao que foi lido
+        assinatura = _assinatura(os.fstat(f.fileno()))
+        if instrumentacao.ATIVO:
+            instrumentacao.contar("io.leituras")
+            instrumentacao.contar("io.bytes_lidos", assinatura[1])
+        return assinatura, json.load(f)
+
+
+def _assinatura_arquivo(arquivo: str) -> Optional[tuple]:
+    """Retorna a assinatura atual do arquivo, ou None se ele não existir."""
+    try:
+        return _assinatura(os.stat(arquivo))
+    except FileNotFoundError:
+        return None
+
+
+@instrumentar
 def _carregar_json(arquivo: str) -> list:
-    """Carrega dados de um arquivo JSON."""
+    """
+    Carrega dados de um arquivo JSON.
+    O conteúdo fica em cache e só é relido quando o arquivo muda.
+    Retorna uma cópia rasa da lista; os dicts são compartilhados com o cache
+    e não devem ser alterados diretamente.
+    """
     _garantir_diretorio()
-    if os.path.exists(arquivo):
-        with open(arquivo, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+    with _cache_lock:
+        if arquivo in _pendente["json"]:
+            return list(_pendente["json"][arquivo])
+        assinatura = _assinatura_arquivo(arquivo)
+        if assinatura is None:
+            _cache.pop(arquivo, None)
+            return []
+        entrada = _cache.get(arquivo)
+        acerto = entrada is not None and entrada[0] == assinatura
+        if instrumentacao.ATIVO:
+            instrumentacao.registrar_cache("json", acerto)
+        if not acerto:
+            entrada = _ler_json(arquivo)
+            _cache[arquivo] = entrada
+        return list(entrada[1])
 
 
-def _salvar_json(arquivo: str, dados: list):
-    """Salva dados em um arquivo JSON."""
+def _sincronizar(descritor: int):
+    """Força a gravação em disco do arquivo ou diretório aberto, se SINCRONIZAR."""
+    if SINCRONIZAR:
+        os.fsync(descritor)
+        if instrumentacao.ATIVO:
+            instrumentacao.contar("io.fsyncs")
+
+
+@instrumentar
+def _gravar_json(arquivo: str, dados: list) -> tuple:
+    """
+    Grava os dados no arquivo JSON e retorna a assinatura resultante.
+    O conteúdo vai para um arquivo temporário que depois substitui o
+    original, então quem lê nunca vê um arquivo pela metade.
+    """
+    _garantir_diretorio()
+    # Serializa antes de abrir: é bem mais rápido que json.dump escrevendo aos poucos
+    conteudo = json.dumps(dados, ensure_ascii=False, indent=2)
+    temporario = arquivo + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        f.write(conteudo)
+        f.flush()
+        _sincronizar(f.fileno())
+    os.replace(temporario, arquivo)
+    assinatura = _assinatura(os.stat(arquivo))
+    if instrumentacao.ATIVO:
+        instrumentacao.contar("io.gravacoes")
+        instrumentacao.contar("io.bytes_gravados", assinatura[1])
+    return assinatura
+
+
+# ===================== GRUPOS DE GRAVAÇÃO =====================
+# Toda gravação do backend JSON passa por um grupo. Quem chama entra em uma
+# fila; o primeiro a encontrar o caminho livre vira o líder, pega a fila
+# inteira e, com a trava entre processos (arquivo .trava) e o _cache_lock,
+# executa cada chamada sobre o estado em memória revalidado contra o disco.
+# As gravações ficam pendentes e, no fim, cada arquivo alterado é gravado uma
+# única vez (um checkpoint regravado ou um trecho anexado ao journal, com um
+# fsync). Enquanto o líder grava, as próximas chamadas se acumulam na fila
+# para o grupo seguinte: com várias sessões escrevendo ao mesmo tempo, o
+# custo de cada gravação é dividido entre elas.
+#
+# Como a trava é tomada antes de ler o estado, nenhuma chamada decide com
+# base em dados que outro processo já alterou; as alterações de fora são
+# percebidas pela assinatura dos arquivos e relidas antes de aplicar as novas.
+
+_fila: list = []
+_fila_cond = threading.Condition()
+_lider: Optional[int] = None
+
+# Gravações pendentes do grupo em execução (só o líder mexe, com o _cache_lock)
+_pendente: dict = {"json": {}, "checkpoints": {}, "journais": {}}
+
+
+@contextlib.contextmanager
+def _trava_processos():
+    """Trava exclusiva entre processos sobre o diretório de dados."""
     _garantir_diretorio()
-    with open(arquivo, "w", encoding="utf-8") as f:
-        json.dump(dados, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(DATA_DIR, ".trava"), "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _executar_em_grupo(funcao):
+    """
+    Executa `funcao()` em um grupo de gravação e retorna o resultado (ou
+    levanta a exceção) depois que o grupo estiver gravado em disco.
+    Chamadas feitas de dentro de um grupo rodam direto nele.
+    """
+    global _lider
+    eu = threading.get_ident()
+    if _lider == eu:
+        return funcao()
+    pedido = {"funcao": funcao, "feito": False}
+    with _fila_cond:
+        _fila.append(pedido)
+        while not pedido["feito"] and _lider is not None:
+            _fila_cond.wait()
+        if not pedido["feito"]:
+            _lider = eu
+            lote = list(_fila)
+            _fila.clear()
+    if not pedido["feito"]:
+        try:
+            _confirmar_lote(lote)
+        except BaseException as e:
+            # Ex.: falha ao tomar a trava; quem não foi executado recebe o erro
+            for outro in lote:
+                if "resultado" not in outro:
+                    outro.setdefault("erro", e)
+        finally:
+            with _fila_cond:
+                _lider = None
+                for outro in lote:
+                    outro["feito"] = True
+                _fila_cond.notify_all()
+    if "erro" in pedido:
+        raise pedido["erro"]
+    return pedido["resultado"]
+
+
+def _confirmar_lote(lote: list):
+    """Executa as chamadas do lote e grava o resultado de todas de uma vez."""
+    with _trava_processos(), _cache_lock:
+        for pedido in lote:
+            try:
+                pedido["resultado"] = pedido["funcao"]()
+            except BaseException as e:
+                pedido["erro"] = e
+        try:
+            _descarregar()
+        except BaseException as e:
+            # O que está em memória pode não ter ido para o disco: relê tudo
+            _descartar_caches()
+            for pedido in lote:
+                pedido.setdefault("erro", e)
+    if instrumentacao.ATIVO:
+        instrumentacao.contar("io.grupos")
+        instrumentacao.contar("io.escritas_agrupadas", len(lote))
+
+
+def _agrupada(func):
+    """
+    Decorador para as gravações de baixo nível: a função roda dentro de um
+    grupo de gravação (no grupo atual, se já houver um).
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return _executar_em_grupo(functools.partial(func, *args, **kwargs))
+    return wrapper
+
+
+def _descartar_caches():
+    """Descarta os estados em memória, forçando a releitura do disco."""
+    with _cache_lock:
+        _cache.clear()
+        _journal_cache.clear()
+        _listagens.clear()
+        for pendentes in _pendente.values():
+            pendentes.clear()
+
+
+def _descarregar():
+    """
+    Grava o que o grupo deixou pendente: primeiro as sequências de ids,
+    depois os checkpoints (removendo os journals que eles absorveram), os
+    trechos de journal, os demais arquivos JSON e, por último, o manifesto das
+    partições.
+    """
+    with _cache_lock:
+        json_pendente = dict(_pendente["json"])
+        checkpoints = dict(_pendente["checkpoints"])
+        journais = {a: e for a, e in _pendente["journais"].items() if a not in checkpoints}
+        for pendentes in _pendente.values():
+            pendentes.clear()
+
+        diretorios = set()
+        ordem = [SEQUENCIAS_FILE] if SEQUENCIAS_FILE in json_pendente else []
+        for arquivo in ordem:
+            _cache[arquivo] = (_gravar_json(arquivo, json_pendente[arquivo]), json_pendente.pop(arquivo))
+            diretorios.add(os.path.dirname(arquivo))
+        for arquivo, estado in checkpoints.items():
+            estado["checkpoint"] = _gravar_json(arquivo, list(estado["itens"].values()))
+            try:
+                os.remove(_arquivo_journal(arquivo))
+            except FileNotFoundError:
+                pass
+            estado["offset"] = 0
+            diretorios.add(os.path.dirname(arquivo))
+        for arquivo, entradas in journais.items():
+            _gravar_journal(arquivo, entradas)
+            diretorios.add(os.path.dirname(arquivo))
+        manifesto = json_pendente.pop(MANIFESTO_FILE, None)
+        for arquivo, dados in json_pendente.items():
+            _cache[arquivo] = (_gravar_json(arquivo, dados), dados)
+            diretorios.add(os.path.dirname(arquivo))
+        if manifesto is not None:
+            _cache[MANIFESTO_FILE] = (_gravar_json(MANIFESTO_FILE, manifesto), manifesto)
+            diretorios.add(REGISTROS_DIR)
+        if SINCRONIZAR and fcntl is not None:
+            # Torna permanentes as renomeações e os arquivos criados
+            for diretorio in diretorios:
+                descritor = os.open(diretorio, os.O_RDONLY)
+                try:
+                    _sincronizar(descritor)
+                finally:
+                    os.close(descritor)
+
+
+@instrumentar
+@_agrupada
+def _salvar_json(arquivo: str, dados: list):
+    """Salva dados em um arquivo JSON ao final do grupo de gravação."""
+    _pendente["json"][arquivo] = dados
+
+
+# ===================== JOURNAL =====================
+# Veículos, tipos e registros são mantidos em memória como {id: item}, o que
+# torna as buscas por id O(1). Em vez de regravar o arquivo inteiro a cada
+# alteração, as operações podem ser anexadas a um journal em JSON lines e
+# aplicadas sobre o último checkpoint (o próprio arquivo .json). Exclusões
+# sempre viram "tombstones" no journal, mesmo fora do modo journal, para que
+# excluir não exija regravar o arquivo. Quando o journal fica grande em
+# relação ao checkpoint, ele é compactado em uma thread separada.
+#
+# Entradas do journal:
+#   {"op": "+", "item": {...}}                  inclui (ou substitui) o item com aquele id
+#   {"op": "-", "id": 5}                        exclui o item com aquele id
+#   {"op": "-veiculo", "veiculo_id": 2}         exclui os registros do veículo
+#   {"op": "-tipo", "tipo_manutencao_id": 3}    exclui os registros do tipo
+#
+# Reaplicar uma entrada é inofensivo, então um journal que sobreviva a uma
+# compactação interrompida não corrompe os dados.
+
+USAR_JOURNAL = os.environ.get("MANUTENCAO_JOURNAL", "") == "1"
+JOURNAL_MIN_BYTES = 1024 * 1024
+JOURNAL_RAZAO = 0.5
+
+# Estado em memória de cada coleção: assinatura do checkpoint, quanto do
+# journal já foi aplicado, os itens indexados por id, o maior id já usado e,
+# para os registros, o índice de últimas manutenções (criado sob demanda).
+_journal_cache: dict = {}
+
+
+def _arquivo_journal(arquivo: str) -> str:
+    """Caminho do journal associado a um arquivo de dados."""
+    return os.path.splitext(arquivo)[0] + ".journal.jsonl"
+
+
+def _novo_estado(arquivo: str, assinatura: Optional[tuple], dados: list) -> dict:
+    """Cria o estado em memória de uma coleção a partir do checkpoint."""
+    itens = {item["id"]: item for item in dados}
+    return {
+        "checkpoint": assinatura,
+        "offset": 0,
+        "itens": itens,
+        "sequencia": max(max(itens, default=0), _sequencia_salva(arquivo)),
+        "ultimos": None,
+    }
+
+
+def _aplicar_entrada(estado: dict, entrada: dict):
+    """Aplica uma entrada do journal sobre o estado e seus índices."""
+    itens = estado["itens"]
+    ultimos = estado["ultimos"]
+    if entrada["op"] == "+":
+        item = entrada["item"]
+        anterior = itens.get(item["id"])
+        itens[item["id"]] = item
+        if item["id"] > estado["sequencia"]:
+            estado["sequencia"] = item["id"]
+        if ultimos is not None:
+            if anterior is not None:
+                _desindexar_ultimo(ultimos, anterior)
+            _indexar_ultimo(ultimos, item)
+    elif entrada["op"] == "-":
+        anterior = itens.pop(entrada["id"], None)
+        if ultimos is not None and anterior is not None:
+            _desindexar_ultimo(ultimos, anterior)
+    elif entrada["op"] in ("-veiculo", "-tipo"):
+        # Exclusão em cascata: acha os registros pelo índice de últimas manutenções
+        ultimos = _indice_ultimos(estado)
+        if entrada["op"] == "-veiculo":
+            grupos = list(ultimos.get(entrada["veiculo_id"], {}).values())
+        else:
+            tipo_id = entrada["tipo_manutencao_id"]
+            grupos = [por_tipo[tipo_id] for por_tipo in ultimos.values() if tipo_id in por_tipo]
+        for registro_id in [-chave[1] for chaves in grupos for chave in chaves]:
+            _desindexar_ultimo(ultimos, itens.pop(registro_id))
+
+
+def _aplicar_journal(arquivo: str, estado: dict):
+    """Aplica ao estado as entradas do journal ainda não lidas."""
+    try:
+        tamanho = os.path.getsize(_arquivo_journal(arquivo))
+    except FileNotFoundError:
+        tamanho = 0
+    if tamanho < estado["offset"]:
+        # Journal removido ou recriado por fora: recomeça pelo checkpoint
+        estado.update(_estado_checkpoint(arquivo))
+    if tamanho == estado["offset"]:
+        return
+    with open(_arquivo_journal(arquivo), "rb") as f:
+        f.seek(estado["offset"])
+        bloco = f.read(tamanho - estado["offset"])
+    if instrumentacao.ATIVO:
+        instrumentacao.contar("io.leituras")
+        instrumentacao.contar("io.bytes_lidos", len(bloco))
+    # Só consome linhas completas; uma escrita em andamento fica para depois
+    fim = bloco.rfind(b"\n") + 1
+    for linha in bloco[:fim].splitlines():
+        try:
+            entrada = json.loads(linha)
+        except ValueError:
+            # Linha truncada por uma escrita interrompida
+            continue
+        _aplicar_entrada(estado, entrada)
+    estado["offset"] += fim
+
+
+def _estado_checkpoint(arquivo: str) -> dict:
+    """Lê o checkpoint de uma coleção, sem o journal."""
+    if os.path.exists(arquivo):
+        return _novo_estado(arquivo, *_ler_json(arquivo))
+    return _novo_estado(arquivo, None, [])
+
+
+@instrumentar
+def _estado_colecao(arquivo: str) -> dict:
+    """
+    Retorna o estado em memória de uma coleção, atualizado.
+    Só o trecho novo do journal é lido; o checkpoint é relido apenas quando
+    muda.
+    """
+    with _cache_lock:
+        estado = _journal_cache.get(arquivo)
+        acerto = estado is not None and estado["checkpoint"] == _assinatura_arquivo(arquivo)
+        if instrumentacao.ATIVO:
+            instrumentacao.registrar_cache("colecoes", acerto)
+        if not acerto:
+            estado = _estado_checkpoint(arquivo)
+            _journal_cache[arquivo] = estado
+        _aplicar_journal(arquivo, estado)
+        return estado
+
+
+def _carregar_com_journal(arquivo: str) -> dict:
+    """
+    Carrega uma coleção, retornando {id: item}.
+    O dict retornado é o do cache e não deve ser alterado.
+    """
+    return _estado_colecao(arquivo)["itens"]
+
+
+@_agrupada
+def _anexar_journal(arquivo: str, entradas: list):
+    """Aplica entradas ao estado em memória e deixa-as pendentes para o journal."""
+    estado = _estado_colecao(arquivo)
+    for entrada in entradas:
+        _aplicar_entrada(estado, entrada)
+    if arquivo not in _pendente["checkpoints"]:
+        _pendente["journais"].setdefault(arquivo, []).extend(entradas)
+
+
+@instrumentar
+def _gravar_journal(arquivo: str, entradas: list):
+    """Anexa entradas ao journal (com o grupo) e compacta se ele passou do limite."""
+    estado = _journal_cache.get(arquivo)
+    bloco = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entradas).encode("utf-8")
+    with open(_arquivo_journal(arquivo), "a+b") as f:
+        inicio = f.seek(0, os.SEEK_END)
+        if inicio:
+            f.seek(inicio - 1)
+            if f.read(1) != b"\n":
+                # Isola uma linha truncada deixada por uma escrita interrompida
+                bloco = b"\n" + bloco
+        f.write(bloco)
+        f.flush()
+        _sincronizar(f.fileno())
+    if instrumentacao.ATIVO:
+        instrumentacao.contar("io.gravacoes")
+        instrumentacao.contar("io.bytes_gravados", len(bloco))
+    if estado is None or inicio != estado["offset"]:
+        # O estado não corresponde mais ao arquivo: será relido
+        return
+    # As entradas já foram aplicadas em memória
+    estado["offset"] = inicio + len(bloco)
+    tamanho_checkpoint = (estado["checkpoint"] or (0, 0))[1]
+    if estado["offset"] >= max(JOURNAL_MIN_BYTES, tamanho_checkpoint * JOURNAL_RAZAO):
+        _agendar_compactacao(arquivo)
+
+
+@_agrupada
+def _gravar_checkpoint(arquivo: str, estado: dict):
+    """Deixa pendente a regravação do checkpoint com os itens do estado, que descarta o journal."""
+    if _nome_colecao(arquivo) in COLECOES and estado["sequencia"] > max(estado["itens"], default=0):
+        # O maior id foi excluído; sem isso ele seria reutilizado. Nas
+        # partições de registros, o maior id fica no manifesto.
+        _salvar_sequencia(arquivo, estado["sequencia"])
+    _pendente["checkpoints"][arquivo] = estado
+    _pendente["journais"].pop(arquivo, None)
+
+
+@_agrupada
+def _remover_arquivo(arquivo: str):
+    """
+    Remove o arquivo, se existir, e descarta-o do cache. O que estiver
+    pendente no grupo é gravado antes, para manter a ordem das operações.
+    """
+    _descarregar()
+    _cache.pop(arquivo, None)
+    try:
+        os.remove(arquivo)
+    except FileNotFoundError:
+        pass
 
 
-def _proximo_id(lista: list) -> int:
-    """Retorna o próximo ID disponível."""
-    if not lista:
-        return 1
-    return max(item["id"] for item in lista) + 1
+@_agrupada
+def _gravar_entradas(arquivo: str, entradas: list):
+    """
+    Aplica entradas a uma coleção. No modo journal, e sempre que forem só
+    exclusões, elas são anexadas ao journal; caso contrário, o checkpoint é
+    regravado inteiro (absorvendo também um journal que já exista).
+    """
+    if not entradas:
+        return
+    if arquivo == REGISTROS_FILE and _manifesto() is not None:
+        _gravar_entradas_particionadas(entradas)
+        return
+    if USAR_JOURNAL or all(entrada["op"] != "+" for entrada in entradas):
+        _anexar_journal(arquivo, entradas)
+        return
+    estado = _estado_colecao(arquivo)
+    for entrada in entradas:
+        _aplicar_entrada(estado, entrada)
+    _gravar_checkpoint(arquivo, estado)
+
+
+def _substituir_colecao(arquivo: str, itens: list):
+    """Substitui todo o conteúdo de uma coleção."""
+    if arquivo == REGISTROS_FILE:
+        _executar_em_grupo(lambda: _substituir_registros(itens, _particionamento()))
+    else:
+        _regravar(arquivo, itens)
+    _nova_versao()
+
+
+@_agrupada
+def _regravar(arquivo: str, itens: list):
+    """Grava os itens como o checkpoint do arquivo, descartando o journal."""
+    # Até o grupo ser gravado, o estado novo corresponde ao que está no
+    # disco; sem isso ele seria trocado pelo antigo na próxima leitura
+    estado = _novo_estado(arquivo, _assinatura_arquivo(arquivo), itens)
+    try:
+        estado["offset"] = os.path.getsize(_arquivo_journal(arquivo))
+    except FileNotFoundError:
+        pass
+    _journal_cache[arquivo] = estado
+    _gravar_checkpoint(arquivo, estado)
+
+
+@_agrupada
+def _compactar_journal(arquivo: str):
+    """Incorpora o journal ao checkpoint; os dados continuam os mesmos."""
+    if not os.path.exists(_arquivo_journal(arquivo)):
+        # Já compactado, ou partição removida enquanto a thread esperava
+        return
+    antes = _assinatura_armazenamento()
+    _gravar_checkpoint(arquivo, _estado_colecao(arquivo))
+    _descarregar()
+    _absorver_assinatura(antes)
+
+
+# Compactações em andamento, por arquivo. As threads não são daemon para que
+# o processo espere o checkpoint terminar de ser gravado antes de sair.
+_compactacoes: dict = {}
+
+
+def _agendar_compactacao(arquivo: str):
+    """Compacta o journal do arquivo em uma thread, se já não houver uma rodando."""
+    with _cache_lock:
+        thread = _compactacoes.get(arquivo)
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(
+            target=_compactar_journal, args=(arquivo,), name=f"compactacao-{_nome_colecao(arquivo)}"
+        )
+        _compactacoes[arquivo] = thread
+        thread.start()
+
+
+# ===================== SEQUÊNCIAS DE IDS =====================
+# O próximo id de uma coleção é o maior id já usado + 1, mantido no estado em
+# memória. Quando o maior id é excluído, ele é guardado em sequencias.json
+# para não ser reutilizado depois que o arquivo for regravado.
+
+def _nome_colecao(arquivo: str) -> str:
+    """Nome da coleção gravada no arquivo (ex.: "veiculos")."""
+    return os.path.splitext(os.path.basename(arquivo))[0]
+
+
+def _sequencia_salva(arquivo: str) -> int:
+    """Maior id guardado em sequencias.json para a coleção, ou 0."""
+    nome = _nome_colecao(arquivo)
+    for sequencia in _carregar_json(SEQUENCIAS_FILE):
+        if sequencia["colecao"] == nome:
+            return sequencia["ultimo_id"]
+    return 0
+
+
+def _salvar_sequencia(arquivo: str, ultimo_id: int):
+    """Guarda o maior id já usado na coleção, se ele cresceu."""
+    sequencias = {s["colecao"]: s["ultimo_id"] for s in _carregar_json(SEQUENCIAS_FILE)}
+    nome = _nome_colecao(arquivo)
+    if sequencias.get(nome, 0) < ultimo_id:
+        sequencias[nome] = ultimo_id
+        _salvar_json(SEQUENCIAS_FILE, [{"colecao": c, "ultimo_id": u} for c, u in sorted(sequencias.items())])
+
+
+def _proximo_id(arquivo: str) -> int:
+    """Retorna o próximo ID da coleção; ids excluídos não são reutilizados."""
+    if arquivo == REGISTROS_FILE:
+        manifesto = _manifesto()
+        if manifesto is not None:
+            return manifesto["ultimo_id"] + 1
+    return _estado_colecao(arquivo)["sequencia"] + 1
+
+
+# ===================== ÍNDICE DE ÚLTIMAS MANUTENÇÕES =====================
+# Para cada veículo e tipo, guarda as chaves (data_realizada, -id) dos
+# registros em ordem crescente; a última chave é a manutenção mais recente
+# (em caso de empate na data, a de menor id). O índice é montado uma vez por
+# carga do arquivo e depois mantido a cada entrada aplicada: incluir um
+# registro mais novo que os existentes (o caso comum) custa O(1), e excluir
+# só percorre os registros daquele par.
+
+def _chave_ultimo(registro: dict) -> tuple:
+    """Chave de ordenação de um registro no índice de últimas manutenções."""
+    return (registro["data_realizada"], -registro["id"])
+
+
+def _indexar_ultimo(ultimos: dict, registro: dict):
+    """Inclui o registro no índice de últimas manutenções."""
+    chaves = ultimos.setdefault(registro["veiculo_id"], {}).setdefault(registro["tipo_manutencao_id"], [])
+    chave = _chave_ultimo(registro)
+    if not chaves or chaves[-1] < chave:
+        chaves.append(chave)
+    else:
+        bisect.insort(chaves, chave)
+
+
+def _desindexar_ultimo(ultimos: dict, registro: dict):
+    """Remove o registro do índice de últimas manutenções."""
+    por_tipo = ultimos.get(registro["veiculo_id"], {})
+    chaves = por_tipo.get(registro["tipo_manutencao_id"])
+    if not chaves:
+        return
+    chave = _chave_ultimo(registro)
+    i = bisect.bisect_left(chaves, chave)
+    if i < len(chaves) and chaves[i] == chave:
+        del chaves[i]
+    if not chaves:
+        del por_tipo[registro["tipo_manutencao_id"]]
+        if not por_tipo:
+            del ultimos[registro["veiculo_id"]]
+
+
+def _indice_ultimos(estado: dict) -> dict:
+    """Retorna o índice de últimas manutenções do estado, montando-o se preciso."""
+    if estado["ultimos"] is None:
+        ultimos = {}
+        for registro in estado["itens"].values():
+            _indexar_ultimo(ultimos, registro)
+        estado["ultimos"] = ultimos
+    return estado["ultimos"]
+
+
+def _registros_veiculo(veiculo_id: int) -> list:
+    """Registros do veículo, pelo índice de últimas manutenções (sem ordem definida)."""
+    registros = []
+    for estado in _estados_registros(veiculo_id):
+        por_tipo = _indice_ultimos(estado).get(veiculo_id, {})
+        registros += [estado["itens"][-chave[1]] for chaves in por_tipo.values() for chave in chaves]
+    return registros
+
+
+def _todos_registros() -> list:
+    """Todos os registros de manutenção; se particionados, em ordem de id."""
+    with _cache_lock:
+        if _manifesto() is None:
+            return list(_carregar_com_journal(REGISTROS_FILE).values())
+        return sorted(
+            (registro for estado in _estados_registros() for registro in estado["itens"].values()),
+            key=itemgetter("id")
+        )
+
+
+# ===================== PARTIÇÕES DE REGISTROS =====================
+# Opcionalmente, os registros de manutenção ficam em um arquivo por veículo
+# (registros/veiculo_<id>.json) ou por veículo e ano
+# (registros/veiculo_<id>/<ano>.json) em vez do registros_manutencao.json
+# único. Cada partição é uma coleção como as outras, com journal próprio;
+# consultar ou alterar um veículo só lê e grava as partições dele, e excluir
+# um veículo apaga seus arquivos. Operações sobre a frota inteira (listar
+# tudo, excluir um tipo ou um registro pelo id) percorrem todas as partições.
+#
+# O manifesto (registros/manifesto.json) indica o particionamento em uso e o
+# maior id de registro já usado. Ele é regravado a cada escrita nas
+# partições, o que faz versao_dados perceber alterações de outros processos.
+# Sem manifesto, vale o arquivo único. Veja particionar_registros.
+
+PARTICIONAMENTOS = ("", "veiculo", "veiculo_ano")
+
+# Listagens de diretórios de partições, com a assinatura do diretório
+_listagens: dict = {}
+
+
+def _manifesto() -> Optional[dict]:
+    """Manifesto das partições de registros, ou None se não houver particionamento."""
+    with _cache_lock:
+        if MANIFESTO_FILE in _pendente["json"]:
+            return _pendente["json"][MANIFESTO_FILE]
+        assinatura = _assinatura_arquivo(MANIFESTO_FILE)
+        if assinatura is None:
+            _cache.pop(MANIFESTO_FILE, None)
+            return None
+        entrada = _cache.get(MANIFESTO_FILE)
+        if entrada is None or entrada[0] != assinatura:
+            entrada = _ler_json(MANIFESTO_FILE)
+            _cache[MANIFESTO_FILE] = entrada
+        return entrada[1]
+
+
+def _salvar_manifesto(manifesto: dict):
+    """Grava o manifesto das partições ao final do grupo de gravação."""
+    os.makedirs(REGISTROS_DIR, exist_ok=True)
+    _salvar_json(MANIFESTO_FILE, manifesto)
+
+
+def _particionamento() -> str:
+    """Particionamento dos registros em uso ("" para o arquivo único)."""
+    manifesto = _manifesto()
+    return manifesto["particionamento"] if manifesto is not None else ""
+
+
+def _diretorio_veiculo(veiculo_id: int) -> str:
+    """Diretório das partições anuais do veículo."""
+    return os.path.join(REGISTROS_DIR, f"veiculo_{veiculo_id}")
+
+
+def _arquivo_particao(registro: dict, particionamento: str) -> str:
+    """Partição onde o registro deve ficar."""
+    if particionamento == "veiculo_ano":
+        return os.path.join(_diretorio_veiculo(registro["veiculo_id"]), f"{registro['data_realizada'][:4]}.json")
+    return os.path.join(REGISTROS_DIR, f"veiculo_{registro['veiculo_id']}.json")
+
+
+def _listar_diretorio(diretorio: str) -> list:
+    """Nomes no diretório, em cache até ele mudar; [] se ele não existir."""
+    with _cache_lock:
+        assinatura = _assinatura_arquivo(diretorio)
+        if assinatura is None:
+            _listagens.pop(diretorio, None)
+            return []
+        entrada = _listagens.get(diretorio)
+        if entrada is None or entrada[0] != assinatura:
+            entrada = (assinatura, sorted(os.listdir(diretorio)))
+            _listagens[diretorio] = entrada
+        return entrada[1]
+
+
+def _particoes_diretorio(diretorio: str) -> list:
+    """Partições de um diretório, incluindo as que só têm journal ou ainda não foram gravadas."""
+    sufixo_journal = ".journal.jsonl"
+    nomes = {
+        os.path.basename(arquivo)
+        for pendentes in (_pendente["checkpoints"], _pendente["journais"]) for arquivo in pendentes
+        if os.path.dirname(arquivo) == diretorio
+    }
+    for nome in _listar_diretorio(diretorio):
+        if nome.endswith(sufixo_journal):
+            nomes.add(nome[:-len(sufixo_journal)] + ".json")
+        elif nome.endswith(".json") and nome != os.path.basename(MANIFESTO_FILE):
+            nomes.add(nome)
+    return [os.path.join(diretorio, nome) for nome in sorted(nomes)]
+
+
+def _arquivos_registros(veiculo_id: Optional[int] = None) -> list:
+    """
+    Arquivos com os registros de manutenção: o único, ou as partições
+    existentes (só as do veículo, se informado).
+    """
+    particionamento = _particionamento()
+    if not particionamento:
+        return [REGISTROS_FILE]
+    if particionamento == "veiculo":
+        if veiculo_id is not None:
+            return [_arquivo_particao({"veiculo_id": veiculo_id}, particionamento)]
+        return _particoes_diretorio(REGISTROS_DIR)
+    if veiculo_id is not None:
+        return _particoes_diretorio(_diretorio_veiculo(veiculo_id))
+    return [
+        arquivo
+        for nome in _listar_diretorio(REGISTROS_DIR) if nome.startswith("veiculo_") and "." not in nome
+        for arquivo in _particoes_diretorio(os.path.join(REGISTROS_DIR, nome))
+    ]
+
+
+def _estados_registros(veiculo_id: Optional[int] = None) -> list:
+    """Estados em memória dos arquivos de _arquivos_registros."""
+    with _cache_lock:
+        return [_estado_colecao(arquivo) for arquivo in _arquivos_registros(veiculo_id)]
+
+
+def _remover_particao(arquivo: str):
+    """Apaga uma partição (checkpoint e journal) e seu diretório, se ficar vazio."""
+    with _cache_lock:
+        _remover_arquivo(arquivo)
+        _remover_arquivo(_arquivo_journal(arquivo))
+        _journal_cache.pop(arquivo, None)
+        diretorio = os.path.dirname(arquivo)
+        if diretorio != REGISTROS_DIR and os.path.isdir(diretorio) and not os.listdir(diretorio):
+            os.rmdir(diretorio)
+
+
+def _gravar_entradas_particionadas(entradas: list):
+    """
+    Aplica entradas de registros às partições: cada inclusão vai para a
+    partição do registro, a exclusão de um veículo apaga as partições dele e
+    as demais exclusões vão para as partições que têm os registros afetados.
+    """
+    with _cache_lock:
+        manifesto = dict(_manifesto())
+        por_arquivo: dict = {}
+        for entrada in entradas:
+            if entrada["op"] == "+":
+                item = entrada["item"]
+                manifesto["ultimo_id"] = max(manifesto["ultimo_id"], item["id"])
+                arquivos = [_arquivo_particao(item, manifesto["particionamento"])]
+            elif entrada["op"] == "-":
+                arquivos = [a for a in _arquivos_registros() if entrada["id"] in _estado_colecao(a)["itens"]]
+            elif entrada["op"] == "-veiculo":
+                for arquivo in _arquivos_registros(entrada["veiculo_id"]):
+                    _remover_particao(arquivo)
+                    por_arquivo.pop(arquivo, None)
+                continue
+            else:
+                tipo_id = entrada["tipo_manutencao_id"]
+                arquivos = [
+                    a for a in _arquivos_registros()
+                    if any(tipo_id in por_tipo for por_tipo in _indice_ultimos(_estado_colecao(a)).values())
+                ]
+            for arquivo in arquivos:
+                por_arquivo.setdefault(arquivo, []).append(entrada)
+
+        for arquivo, entradas_particao in por_arquivo.items():
+            os.makedirs(os.path.dirname(arquivo), exist_ok=True)
+            _gravar_entradas(arquivo, entradas_particao)
+        manifesto["geracao"] += 1
+        _salvar_manifesto(manifesto)
+
+
+def _substituir_registros(registros: list, particionamento: str):
+    """
+    Grava os registros no particionamento pedido e apaga os arquivos do
+    anterior. O manifesto é gravado (ou removido) depois dos novos arquivos e
+    antes de apagar os antigos, de modo que uma interrupção deixe os dados
+    completos em um dos dois formatos.
+    """
+    with _cache_lock:
+        manifesto = _manifesto()
+        ultimo_id = max(_proximo_id(REGISTROS_FILE) - 1, max((r["id"] for r in registros), default=0))
+        antigos = set(_arquivos_registros())
+
+        particoes: dict = {}
+        if particionamento:
+            for registro in registros:
+                particoes.setdefault(_arquivo_particao(registro, particionamento), []).append(registro)
+        else:
+            # Antes de regravar, para que o estado novo já parta desta sequência
+            _salvar_sequencia(REGISTROS_FILE, ultimo_id)
+            particoes[REGISTROS_FILE] = registros
+        for arquivo, itens in particoes.items():
+            os.makedirs(os.path.dirname(arquivo), exist_ok=True)
+            _regravar(arquivo, itens)
+
+        if particionamento:
+            _salvar_manifesto({
+                "particionamento": particionamento,
+                "ultimo_id": ultimo_id,
+                "geracao": (manifesto or {}).get("geracao", 0) + 1,
+            })
+        else:
+            _remover_arquivo(MANIFESTO_FILE)
+
+        for arquivo in antigos - set(particoes):
+            if arquivo == REGISTROS_FILE:
+                _remover_arquivo(arquivo)
+                _remover_arquivo(_arquivo_journal(arquivo))
+                _journal_cache.pop(arquivo, None)
+            else:
+                _remover_particao(arquivo)
+        if not particionamento and os.path.isdir(REGISTROS_DIR) and not os.listdir(REGISTROS_DIR):
+            os.rmdir(REGISTROS_DIR)
+
+
+@instrumentar
+@_escrita
+def particionar_registros(particionamento: str) -> dict:
+    """
+    Reorganiza os registros de manutenção do backend JSON: "veiculo" grava
+    um arquivo por veículo, "veiculo_ano" um por veículo e ano, e "" volta ao
+    arquivo único. Retorna {"registros": ..., "particoes": ...}.
+    """
+    if particionamento not in PARTICIONAMENTOS:
+        raise ValueError(f"Particionamento desconhecido: {particionamento}")
+    if BACKEND != "json":
+        raise ValueError("O particionamento de registros só se aplica ao backend JSON")
+    with _cache_lock:
+        registros = _todos_registros()
+        _substituir_registros(registros, particionamento)
+        return {"registros": len(registros), "particoes": len(_arquivos_registros())}
+
+
+COLECOES = ("veiculos", "manutencoes", "registros_manutencao")
+
+
+def _arquivo_colecao(colecao: str) -> str:
+    """Arquivo JSON de uma das COLECOES."""
+    if colecao not in COLECOES:
+        raise ValueError(f"Coleção desconhecida: {colecao}")
+    return {"veiculos": VEICULOS_FILE, "manutencoes": MANUTENCOES_FILE, "registros_manutencao": REGISTROS_FILE}[colecao]
+
+
+@instrumentar
+@_escrita
+@_backend
+def adicionar_em_lote(colecao: str, itens: list) -> list:
+    """
+    Adiciona vários itens (sem id) a uma coleção com uma única gravação.
+    Os ids são atribuídos em bloco e "criado_em" é preenchido quando ausente.
+    Os dados não são validados; veja importacao.py.
+    """
+    arquivo = _arquivo_colecao(colecao)
+    criado_em = datetime.now().isoformat()
+    with _cache_lock:
+        inicio = _proximo_id(arquivo)
+        novos = [
+            {"id": inicio + i, **item, "criado_em": item.get("criado_em") or criado_em}
+            for i, item in enumerate(itens)
+        ]
+        _gravar_entradas(arquivo, [{"op": "+", "item": item} for item in novos])
+    return novos
 
 
 # ===================== VEÍCULOS =====================
 
+@instrumentar
+@_backend
 def listar_veiculos() -> list:
     """Lista todos os veículos."""
-    return _carregar_json(VEICULOS_FILE)
+    return list(_carregar_com_journal(VEICULOS_FILE).values())
 
 
+@instrumentar
+@_backend
 def obter_veiculo(veiculo_id: int) -> Optional[dict]:
     """Obtém um veículo pelo ID."""
-    veiculos = listar_veiculos()
-    for v in veiculos:
-        if v["id"] == veiculo_id:
-            return v
-    return None
+    return _carregar_com_journal(VEICULOS_FILE).get(veiculo_id)
 
 
+@instrumentar
+@_escrita
+@_backend
 def adicionar_veiculo(marca: str, modelo: str, ano: int, km: float) -> dict:
     """Adiciona um novo veículo."""
-    veiculos = listar_veiculos()
-    novo = {
-        "id": _proximo_id(veiculos),
-        "marca": marca,
-        "modelo": modelo,
-        "ano": ano,
-        "km": km,
-        "criado_em": datetime.now().isoformat()
-    }
-    veiculos.append(novo)
-    _salvar_json(VEICULOS_FILE, veiculos)
+    with _cache_lock:
+        novo = {
+            "id": _proximo_id(VEICULOS_FILE),
+            "marca": marca,
+            "modelo": modelo,
+            "ano": ano,
+            "km": km,
+            "criado_em": datetime.now().isoformat()
+        }
+        _gravar_entradas(VEICULOS_FILE, [{"op": "+", "item": novo}])
     return novo
 
 
+@instrumentar
+@_escrita
+@_backend
 def atualizar_veiculo(veiculo_id: int, marca: str, modelo: str, ano: int, km: float) -> Optional[dict]:
     """Atualiza um veículo existente."""
-    veiculos = listar_veiculos()
-    for v in veiculos:
-        if v["id"] == veiculo_id:
-            v["marca"] = marca
-            v["modelo"] = modelo
-            v["ano"] = ano
-            v["km"] = km
-            v["atualizado_em"] = datetime.now().isoformat()
-            _salvar_json(VEICULOS_FILE, veiculos)
-            return v
-    return None
+    with _cache_lock:
+        v = obter_veiculo(veiculo_id)
+        if v is None:
+            return None
+        # Cria um novo dict para não alterar o objeto que está no cache
+        v = dict(v)
+        v["marca"] = marca
+        v["modelo"] = modelo
+        v["ano"] = ano
+        v["km"] = km
+        v["atualizado_em"] = datetime.now().isoformat()
+        _gravar_entradas(VEICULOS_FILE, [{"op": "+", "item": v}])
+    return v
 
 
+@instrumentar
+@_escrita
+@_backend
 def excluir_veiculo(veiculo_id: int) -> bool:
     """Exclui um veículo e seus registros de manutenção."""
-    veiculos = listar_veiculos()
-    veiculos_filtrados = [v for v in veiculos if v["id"] != veiculo_id]
-    if len(veiculos_filtrados) < len(veiculos):
-        _salvar_json(VEICULOS_FILE, veiculos_filtrados)
-        # Remove registros de manutenção do veículo
-        registros = listar_registros_manutencao()
-        registros_filtrados = [r for r in registros if r["veiculo_id"] != veiculo_id]
-        _salvar_json(REGISTROS_FILE, registros_filtrados)
-        return True
-    return False
+    with _cache_lock:
+        if obter_veiculo(veiculo_id) is None:
+            return False
+        _gravar_entradas(VEICULOS_FILE, [{"op": "-", "id": veiculo_id}])
+        # Um único tombstone exclui todos os registros do veículo; o histórico
+        # de odômetro deixa de ser listado e é removido em compactar()
+        _gravar_entradas(REGISTROS_FILE, [{"op": "-veiculo", "veiculo_id": veiculo_id}])
+    return True
+
+
+# ===================== ODÔMETRO =====================
+
+def _podar_leituras(pontos: dict) -> list:
+    """Ordena as leituras diárias e descarta as anteriores a ODOMETRO_DIAS dias da mais recente."""
+    limite = (date.fromisoformat(max(pontos)) - timedelta(days=ODOMETRO_DIAS)).isoformat()
+    return [[dia, pontos[dia]] for dia in sorted(pontos) if dia >= limite]
+
+
+@instrumentar
+@_escrita
+@_backend
+def atualizar_odometros(leituras: dict) -> int:
+    """
+    Grava de uma vez leituras de odômetro de vários veículos.
+    `leituras` é {veiculo_id: {"AAAA-MM-DD": km}}; o km do dia mais recente
+    passa a ser a quilometragem do veículo e todos os dias entram no histórico
+    (uma leitura por dia). As leituras não são validadas; veja odometro.py.
+    Veículos inexistentes são ignorados. Retorna quantos foram atualizados.
+    """
+    atualizado_em = datetime.now().isoformat()
+    with _cache_lock:
+        veiculos = _carregar_com_journal(VEICULOS_FILE)
+        atualizados = [veiculo_id for veiculo_id, dias in leituras.items() if dias and veiculo_id in veiculos]
+        if not atualizados:
+            return 0
+        # Cria novos dicts para não alterar os objetos que estão no cache
+        _gravar_entradas(VEICULOS_FILE, [
+            {"op": "+", "item": {**veiculos[veiculo_id], "km": leituras[veiculo_id][max(leituras[veiculo_id])],
+                                 "atualizado_em": atualizado_em}}
+            for veiculo_id in atualizados
+        ])
+
+        historico = {h["veiculo_id"]: h for h in _carregar_json(ODOMETRO_FILE)}
+        for veiculo_id in atualizados:
+            pontos = dict(historico[veiculo_id]["leituras"]) if veiculo_id in historico else {}
+            pontos.update(leituras[veiculo_id])
+            historico[veiculo_id] = {"veiculo_id": veiculo_id, "leituras": _podar_leituras(pontos)}
+        _salvar_json(ODOMETRO_FILE, [historico[v] for v in sorted(historico)])
+    return len(atualizados)
+
+
+@instrumentar
+@_backend
+def listar_leituras_odometro(veiculo_id: Optional[int] = None) -> list:
+    """
+    Lista o histórico diário de odômetro ({"veiculo_id", "data", "km"}),
+    ordenado por veículo e data, opcionalmente filtrado por veículo.
+    """
+    veiculos = _carregar_com_journal(VEICULOS_FILE)
+    return [
+        {"veiculo_id": h["veiculo_id"], "data": dia, "km": km}
+        for h in _carregar_json(ODOMETRO_FILE)
+        if (not veiculo_id or h["veiculo_id"] == veiculo_id) and h["veiculo_id"] in veiculos
+        for dia, km in h["leituras"]
+    ]
 
 
 # ===================== TIPOS DE MANUTENÇÃO =====================
 
+@instrumentar
+@_backend
 def listar_tipos_manutencao() -> list:
     """Lista todos os tipos de manutenção."""
-    return _carregar_json(MANUTENCOES_FILE)
+    return list(_carregar_com_journal(MANUTENCOES_FILE).values())
 
 
+@instrumentar
+@_backend
 def obter_tipo_manutencao(manutencao_id: int) -> Optional[dict]:
     """Obtém um tipo de manutenção pelo ID."""
-    manutencoes = listar_tipos_manutencao()
-    for m in manutencoes:
-        if m["id"] == manutencao_id:
-            return m
-    return None
+    return _carregar_com_journal(MANUTENCOES_FILE).get(manutencao_id)
 
 
+@instrumentar
+@_escrita
+@_backend
 def adicionar_tipo_manutencao(nome: str, intervalo_km: Optional[float], intervalo_dias: Optional[int]) -> dict:
     """Adiciona um novo tipo de manutenção."""
-    manutencoes = listar_tipos_manutencao()
-    novo = {
-        "id": _proximo_id(manutencoes),
-        "nome": nome,
-        "intervalo_km": intervalo_km,
-        "intervalo_dias": intervalo_dias,
-        "criado_em": datetime.now().isoformat()
-    }
-    manutencoes.append(novo)
-    _salvar_json(MANUTENCOES_FILE, manutencoes)
+    with _cache_lock:
+        novo = {
+            "id": _proximo_id(MANUTENCOES_FILE),
+            "nome": nome,
+            "intervalo_km": intervalo_km,
+            "intervalo_dias": intervalo_dias,
+            "criado_em": datetime.now().isoformat()
+        }
+        _gravar_entradas(MANUTENCOES_FILE, [{"op": "+", "item": novo}])
     return novo
 
 
+@instrumentar
+@_escrita
+@_backend
 def atualizar_tipo_manutencao(manutencao_id: int, nome: str, intervalo_km: Optional[float], intervalo_dias: Optional[int]) -> Optional[dict]:
     """Atualiza um tipo de manutenção existente."""
-    manutencoes = listar_tipos_manutencao()
-    for m in manutencoes:
-        if m["id"] == manutencao_id:
-            m["nome"] = nome
-            m["intervalo_km"] = intervalo_km
-            m["intervalo_dias"] = intervalo_dias
-            m["atualizado_em"] = datetime.now().isoformat()
-            _salvar_json(MANUTENCOES_FILE, manutencoes)
-            return m
-    return None
+    with _cache_lock:
+        m = obter_tipo_manutencao(manutencao_id)
+        if m is None:
+            return None
+        # Cria um novo dict para não alterar o objeto que está no cache
+        m = dict(m)
+        m["nome"] = nome
+        m["intervalo_km"] = intervalo_km
+        m["intervalo_dias"] = intervalo_dias
+        m["atualizado_em"] = datetime.now().isoformat()
+        _gravar_entradas(MANUTENCOES_FILE, [{"op": "+", "item": m}])
+    return m
 
 
+@instrumentar
+@_escrita
+@_backend
 def excluir_tipo_manutencao(manutencao_id: int) -> bool:
-    """Exclui um tipo de manutenção."""
-    manutencoes = listar_tipos_manutencao()
-    manutencoes_filtradas = [m for m in manutencoes if m["id"] != manutencao_id]
-    if len(manutencoes_filtradas) < len(manutencoes):
-        _salvar_json(MANUTENCOES_FILE, manutencoes_filtradas)
-        return True
-    return False
+    """Exclui um tipo de manutenção e seus registros de manutenção."""
+    with _cache_lock:
+        if obter_tipo_manutencao(manutencao_id) is None:
+            return False
+        _gravar_entradas(MANUTENCOES_FILE, [{"op": "-", "id": manutencao_id}])
+        _gravar_entradas(REGISTROS_FILE, [{"op": "-tipo", "tipo_manutencao_id": manutencao_id}])
+    return True
 
 
 # ===================== REGISTROS DE MANUTENÇÃO =====================
 
+@instrumentar
+@_backend
 def listar_registros_manutencao(veiculo_id: Optional[int] = None) -> list:
     """Lista registros de manutenção, opcionalmente filtrados por veículo."""
-    registros = _carregar_json(REGISTROS_FILE)
-    if veiculo_id:
-        return [r for r in registros if r["veiculo_id"] == veiculo_id]
-    return registros
+    with _cache_lock:
+        if veiculo_id:
+            return sorted(_registros_veiculo(veiculo_id), key=itemgetter("id"))
+        return _todos_registros()
 
 
+@instrumentar
+@_escrita
+@_backend
 def adicionar_registro_manutencao(veiculo_id: int, tipo_manutencao_id: int, km_realizada: float, data_realizada: str, observacao: str = "") -> dict:
     """Adiciona um registro de manutenção realizada."""
-    registros = listar_registros_manutencao()
-    novo = {
-        "id": _proximo_id(registros),
-        "veiculo_id": veiculo_id,
-        "tipo_manutencao_id": tipo_manutencao_id,
-        "km_realizada": km_realizada,
-        "data_realizada": data_realizada,
-        "observacao": observacao,
-        "criado_em": datetime.now().isoformat()
-    }
-    registros.append(novo)
-    _salvar_json(REGISTROS_FILE, registros)
+    with _cache_lock:
+        novo = {
+            "id": _proximo_id(REGISTROS_FILE),
+            "veiculo_id": veiculo_id,
+            "tipo_manutencao_id": tipo_manutencao_id,
+            "km_realizada": km_realizada,
+            "data_realizada": data_realizada,
+            "observacao": observacao,
+            "criado_em": datetime.now().isoformat()
+        }
+        _gravar_entradas(REGISTROS_FILE, [{"op": "+", "item": novo}])
     return novo
 
 
+@_escrita
+@_backend
+def _excluir_registro_manutencao(registro_id: int) -> Optional[dict]:
+    """
+    Exclui um registro de manutenção e retorna-o, ou None se ele não existir.
+    Os ouvintes recebem o registro excluído como resultado de
+    "excluir_registro_manutencao".
+    """
+    with _cache_lock:
+        registro = next(
+            (estado["itens"][registro_id] for estado in _estados_registros() if registro_id in estado["itens"]), None
+        )
+        if registro is None:
+            return None
+        _gravar_entradas(REGISTROS_FILE, [{"op": "-", "id": registro_id}])
+    return registro
+
+
+@instrumentar
 def excluir_registro_manutencao(registro_id: int) -> bool:
     """Exclui um registro de manutenção."""
-    registros = listar_registros_manutencao()
-    registros_filtrados = [r for r in registros if r["id"] != registro_id]
-    if len(registros_filtrados) < len(registros):
-        _salvar_json(REGISTROS_FILE, registros_filtrados)
-        return True
-    return False
+    return _excluir_registro_manutencao(registro_id) is not None
+
+
+@instrumentar
+@_backend
+def listar_historico_manutencao(
+    veiculo_id: Optional[int] = None,
+    tipo_manutencao_id: Optional[int] = None,
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    limite: int = 20,
+    deslocamento: int = 0,
+) -> dict:
+    """
+    Lista uma página do histórico, da manutenção mais recente para a mais
+    antiga, com os filtros opcionais (datas no formato AAAA-MM-DD, inclusivas).
+    Cada registro vem acompanhado de "marca", "modelo" e "tipo_nome";
+    registros de veículos ou tipos que não existem mais são omitidos.
+    Retorna {"total": <registros que atendem aos filtros>, "registros": [...]}.
+    """
+    with _cache_lock:
+        # Cópias: os filtros abaixo rodam fora do lock
+        veiculos = dict(_carregar_com_journal(VEICULOS_FILE))
+        tipos = dict(_carregar_com_journal(MANUTENCOES_FILE))
+        if veiculo_id is not None:
+            candidatos = _registros_veiculo(veiculo_id)
+        else:
+            candidatos = _todos_registros()
+    filtrados = [
+        r for r in candidatos
+        if r["veiculo_id"] in veiculos
+        and r["tipo_manutencao_id"] in tipos
+        and (tipo_manutencao_id is None or r["tipo_manutencao_id"] == tipo_manutencao_id)
+        and (data_inicio is None or r["data_realizada"][:10] >= data_inicio)
+        and (data_fim is None or r["data_realizada"][:10] <= data_fim)
+    ]
+    # Só ordena o necessário para chegar à página pedida
+    pagina = heapq.nlargest(deslocamento + limite, filtrados, key=_chave_ultimo)[deslocamento:]
+    registros = []
+    for r in pagina:
+        veiculo = veiculos[r["veiculo_id"]]
+        registros.append({
+            **r,
+            "marca": veiculo["marca"],
+            "modelo": veiculo["modelo"],
+            "tipo_nome": tipos[r["tipo_manutencao_id"]]["nome"],
+        })
+    return {"total": len(filtrados), "registros": registros}
 
 
-def calcular_proxima_manutencao(veiculo_id: int, tipo_manutencao_id: int) -> Optional[dict]:
+@instrumentar
+@_backend
+def ultimo_registro_manutencao(veiculo_id: int, tipo_manutencao_id: int) -> Optional[dict]:
     """
-    Calcula quando será a próxima manutenção.
+    Retorna o registro mais recente de um tipo de manutenção para o veículo.
+    Em caso de empate na data, vale o de menor id.
+    """
+    with _cache_lock:
+        ultimo = None
+        for estado in _estados_registros(veiculo_id):
+            chaves = _indice_ultimos(estado).get(veiculo_id, {}).get(tipo_manutencao_id)
+            if chaves and (ultimo is None or chaves[-1] > _chave_ultimo(ultimo)):
+                ultimo = estado["itens"][-chaves[-1][1]]
+        return ultimo
+
+
+@instrumentar
+def calcular_proxima_manutencao(veiculo_id: int, tipo_manutencao_id: int, agora: Optional[datetime] = None) -> Optional[dict]:
+    """
+    Calcula quando será a próxima manutenção, em relação a `agora` (padrão: o momento atual).
     Retorna dict com 'km_faltante' e/ou 'dias_faltantes'.
     """
     veiculo = obter_veiculo(veiculo_id)
@@ -205,8 +1464,7 @@ def calcular_proxima_manutencao(veiculo_id: int, tipo_manutencao_id: int) -> Opt
         return None
 
     # Busca último registro dessa manutenção para o veículo
-    registros = listar_registros_manutencao(veiculo_id)
-    registros_tipo = [r for r in registros if r["tipo_manutencao_id"] == tipo_manutencao_id]
+    ultimo = ultimo_registro_manutencao(veiculo_id, tipo_manutencao_id)
 
     resultado = {
         "tipo_nome": tipo["nome"],
@@ -215,16 +1473,12 @@ def calcular_proxima_manutencao(veiculo_id: int, tipo_manutencao_id: int) -> Opt
         "status": "ok"
     }
 
-    if not registros_tipo:
+    if not ultimo:
         # Nunca fez essa manutenção
         resultado["status"] = "pendente"
         resultado["mensagem"] = "Manutenção nunca realizada"
         return resultado
 
-    # Ordena por data e pega o mais recente
-    registros_tipo.sort(key=lambda x: x["data_realizada"], reverse=True)
-    ultimo = registros_tipo[0]
-
     # Calcula por KM
     if tipo["intervalo_km"]:
         km_proxima = ultimo["km_realizada"] + tipo["intervalo_km"]
@@ -239,10 +1493,75 @@ def calcular_proxima_manutencao(veiculo_id: int, tipo_manutencao_id: int) -> Opt
         from datetime import datetime, timedelta
         data_ultima = datetime.fromisoformat(ultimo["data_realizada"])
         data_proxima = data_ultima + timedelta(days=tipo["intervalo_dias"])
-        dias_faltantes = (data_proxima - datetime.now()).days
+        dias_faltantes = (data_proxima - (agora or datetime.now())).days
         resultado["dias_faltantes"] = dias_faltantes
         resultado["data_proxima"] = data_proxima.strftime("%d/%m/%Y")
         if dias_faltantes <= 0:
             resultado["status"] = "vencida"
 
     return resultado
+
+
+# ===================== COMPACTAÇÃO =====================
+
+@instrumentar
+@_escrita
+@_backend
+def compactar() -> dict:
+    """
+    Incorpora journals e tombstones aos arquivos, regravando cada arquivo
+    alterado uma única vez, e remove registros e leituras de odômetro órfãos
+    (de veículos ou tipos que não existem mais). Retorna quantos órfãos foram
+    removidos em cada coleção.
+    """
+    with _cache_lock:
+        veiculos = _carregar_com_journal(VEICULOS_FILE)
+        tipos = _carregar_com_journal(MANUTENCOES_FILE)
+        particionado = _manifesto() is not None
+        total_orfaos = 0
+        for arquivo in _arquivos_registros():
+            estado = _estado_colecao(arquivo)
+            orfaos = [
+                registro_id for registro_id, r in estado["itens"].items()
+                if r["veiculo_id"] not in veiculos or r["tipo_manutencao_id"] not in tipos
+            ]
+            for registro_id in orfaos:
+                _aplicar_entrada(estado, {"op": "-", "id": registro_id})
+            total_orfaos += len(orfaos)
+            if particionado and not estado["itens"]:
+                # Partição sem registros: não precisa mais existir
+                _remover_particao(arquivo)
+            elif estado["offset"] or orfaos:
+                _gravar_checkpoint(arquivo, estado)
+        if particionado and total_orfaos:
+            _salvar_manifesto({**_manifesto(), "geracao": _manifesto()["geracao"] + 1})
+
+        for arquivo in (VEICULOS_FILE, MANUTENCOES_FILE):
+            estado = _estado_colecao(arquivo)
+            if estado["offset"]:
+                _gravar_checkpoint(arquivo, estado)
+
+        historico = _carregar_json(ODOMETRO_FILE)
+        historico_filtrado = [h for h in historico if h["veiculo_id"] in veiculos]
+        if len(historico_filtrado) < len(historico):
+            _salvar_json(ODOMETRO_FILE, historico_filtrado)
+    return {"registros_manutencao": total_orfaos, "leituras_odometro": len(historico) - len(historico_filtrado)}
+
+
+def compactar_em_segundo_plano() -> threading.Thread:
+    """Executa compactar() em uma thread e retorna-a."""
+    thread = threading.Thread(target=compactar, name="compactacao")
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Reorganiza os registros de manutenção do backend JSON.")
+    parser.add_argument("particionamento", choices=["unico", *(p for p in PARTICIONAMENTOS if p)],
+                        help="unico: registros_manutencao.json; veiculo: um arquivo por veículo; "
+                             "veiculo_ano: um arquivo por veículo e ano")
+    args = parser.parse_args()
+    resultado = particionar_registros("" if args.particionamento == "unico" else args.particionamento)
+    print(f"{resultado['registros']} registros em {resultado['particoes']} arquivo(s)")
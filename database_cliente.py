@@ -0,0 +1,129 @@
+"""
+Cliente do servidor de dados (servidor.py).
+É usado por database.py quando MANUTENCAO_BACKEND=servidor (ou
+database.configurar_armazenamento(backend="servidor")): as funções públicas
+são executadas pelo servidor no endereço database.SERVIDOR
+(MANUTENCAO_SERVIDOR), o caminho de um socket Unix ou "host:porta".
+
+Cada thread usa a sua própria conexão, aberta no primeiro uso e refeita
+depois de uma falha ou de uma troca de endereço.
+"""
+import builtins
+import json
+import socket
+import threading
+from typing import Optional
+
+import database
+
+_local = threading.local()
+
+_MARCA_ITENS = b'"$itens"'
+
+
+def endereco_tcp(endereco: str) -> Optional[tuple]:
+    """(host, porta) de um endereço "host:porta", ou None se for um socket Unix."""
+    host, _, porta = endereco.rpartition(":")
+    if host and porta.isdigit() and "/" not in endereco:
+        return host.strip("[]"), int(porta)
+    return None
+
+
+def _abrir(endereco: str) -> socket.socket:
+    """Conecta ao servidor de dados."""
+    tcp = endereco_tcp(endereco)
+    if tcp is not None:
+        conexao = socket.create_connection(tcp)
+        # Requisições pequenas e uma resposta por vez: sem o atraso de Nagle
+        conexao.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conexao
+    conexao = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conexao.connect(endereco)
+    except OSError:
+        conexao.close()
+        raise
+    return conexao
+
+
+def fechar():
+    """Fecha a conexão da thread atual, se houver."""
+    aberta = getattr(_local, "conexao", None)
+    _local.conexao = None
+    if aberta is not None:
+        _, conexao, leitor = aberta
+        leitor.close()
+        conexao.close()
+
+
+def codificar(valor):
+    """
+    Prepara um valor para o JSON sem perder o tipo das chaves: dicts com
+    chaves que não são texto (ex.: {veiculo_id: ...}) viram {"$itens": [[chave, valor], ...]}.
+    """
+    if isinstance(valor, dict):
+        if all(isinstance(chave, str) for chave in valor):
+            return {chave: codificar(v) for chave, v in valor.items()}
+        return {"$itens": [[codificar(chave), codificar(v)] for chave, v in valor.items()]}
+    if isinstance(valor, (list, tuple)):
+        return [codificar(v) for v in valor]
+    return valor
+
+
+def decodificar(valor):
+    """Desfaz codificar."""
+    if isinstance(valor, dict):
+        if list(valor) == ["$itens"]:
+            return {decodificar(chave): decodificar(v) for chave, v in valor["$itens"]}
+        return {chave: decodificar(v) for chave, v in valor.items()}
+    if isinstance(valor, list):
+        return [decodificar(v) for v in valor]
+    return valor
+
+
+def _excecao(nome: str, mensagem: str) -> Exception:
+    """Recria a exceção levantada no servidor (as embutidas, como ValueError, mantêm o tipo)."""
+    tipo = getattr(builtins, nome, None)
+    if isinstance(tipo, type) and issubclass(tipo, Exception):
+        return tipo(mensagem)
+    return RuntimeError(f"{nome} no servidor de dados: {mensagem}")
+
+
+def _requisitar(requisicao: dict):
+    """Envia uma requisição pela conexão da thread e retorna o resultado."""
+    aberta = getattr(_local, "conexao", None)
+    if aberta is None or aberta[0] != database.SERVIDOR:
+        fechar()
+        conexao = _abrir(database.SERVIDOR)
+        aberta = _local.conexao = (database.SERVIDOR, conexao, conexao.makefile("rb"))
+    _, conexao, leitor = aberta
+    try:
+        conexao.sendall(json.dumps(requisicao, ensure_ascii=False).encode("utf-8") + b"\n")
+        linha = leitor.readline()
+    except OSError:
+        fechar()
+        raise
+    if not linha:
+        fechar()
+        raise ConnectionError("O servidor de dados encerrou a conexão")
+    resposta = json.loads(linha)
+    if "erro" in resposta:
+        raise _excecao(resposta["erro"], resposta["mensagem"])
+    if _MARCA_ITENS in linha:
+        # Só percorre o resultado se ele tiver dicts codificados
+        return decodificar(resposta["resultado"])
+    return resposta["resultado"]
+
+
+def chamar(funcao: str, *args, **kwargs):
+    """Executa uma função pública de database.py no servidor de dados."""
+    return _requisitar({"funcao": funcao, "args": codificar(args), "kwargs": codificar(kwargs)})
+
+
+def versao_armazenamento() -> tuple:
+    """
+    Identifica o estado dos dados no servidor: a instância (muda quando ele
+    é reiniciado) e a versão dos dados dele. As escritas deste processo são
+    contadas em database.py.
+    """
+    return tuple(_requisitar({"funcao": "versao"}))
@@ -0,0 +1,479 @@
+"""
+Backend de persistência em SQLite.
+Implementa as mesmas funções públicas de database.py; é usado por ele quando
+MANUTENCAO_BACKEND=sqlite (ou database.configurar_armazenamento(backend="sqlite")).
+
+Para migrar os arquivos JSON existentes:
+    python database_sqlite.py
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional
+
+import database
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS veiculos (
+    id INTEGER PRIMARY KEY,
+    marca TEXT NOT NULL,
+    modelo TEXT NOT NULL,
+    ano INTEGER NOT NULL,
+    km REAL NOT NULL,
+    criado_em TEXT,
+    atualizado_em TEXT
+);
+CREATE TABLE IF NOT EXISTS manutencoes (
+    id INTEGER PRIMARY KEY,
+    nome TEXT NOT NULL,
+    intervalo_km REAL,
+    intervalo_dias INTEGER,
+    criado_em TEXT,
+    atualizado_em TEXT
+);
+CREATE TABLE IF NOT EXISTS registros_manutencao (
+    id INTEGER PRIMARY KEY,
+    veiculo_id INTEGER NOT NULL,
+    tipo_manutencao_id INTEGER NOT NULL,
+    km_realizada REAL NOT NULL,
+    data_realizada TEXT NOT NULL,
+    observacao TEXT,
+    criado_em TEXT
+);
+CREATE TABLE IF NOT EXISTS leituras_odometro (
+    veiculo_id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    km REAL NOT NULL,
+    PRIMARY KEY (veiculo_id, data)
+) WITHOUT ROWID;
+-- Maior id já usado em cada tabela, para que ids excluídos não sejam reutilizados
+CREATE TABLE IF NOT EXISTS sequencias (
+    colecao TEXT PRIMARY KEY,
+    ultimo_id INTEGER NOT NULL
+);
+-- O prefixo (veiculo_id) deste índice também atende às consultas por veículo
+CREATE INDEX IF NOT EXISTS idx_registros_veiculo_tipo_data
+    ON registros_manutencao (veiculo_id, tipo_manutencao_id, data_realizada);
+"""
+
+# Uma conexão por processo, compartilhada entre as threads (sessões do
+# Streamlit) e protegida por um lock.
+_conexao: Optional[sqlite3.Connection] = None
+_conexao_chave: Optional[tuple] = None
+_lock = threading.RLock()
+
+
+def _conectar() -> sqlite3.Connection:
+    """Retorna a conexão do processo, abrindo-a se necessário."""
+    global _conexao, _conexao_chave
+    chave = (os.getpid(), database.SQLITE_FILE)
+    if _conexao is None or _conexao_chave != chave:
+        os.makedirs(os.path.dirname(database.SQLITE_FILE), exist_ok=True)
+        conexao = sqlite3.connect(database.SQLITE_FILE, check_same_thread=False)
+        conexao.row_factory = sqlite3.Row
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        conexao.executescript(SCHEMA)
+        # A conexão antiga pode ter vindo de um fork; apenas a abandonamos
+        _conexao, _conexao_chave = conexao, chave
+    return _conexao
+
+
+def _para_dict(linha: sqlite3.Row) -> dict:
+    """Converte uma linha no mesmo formato de dict usado pelos arquivos JSON."""
+    item = dict(linha)
+    if "atualizado_em" in item and item["atualizado_em"] is None:
+        del item["atualizado_em"]
+    return item
+
+
+def _consultar(sql: str, parametros: tuple = ()) -> list:
+    """Executa uma consulta e retorna as linhas como dicts."""
+    with _lock:
+        return [_para_dict(linha) for linha in _conectar().execute(sql, parametros)]
+
+
+def _consultar_um(sql: str, parametros: tuple = ()) -> Optional[dict]:
+    """Executa uma consulta e retorna a primeira linha, se houver."""
+    linhas = _consultar(sql, parametros)
+    return linhas[0] if linhas else None
+
+
+def _reservar_ids(conexao: sqlite3.Connection, tabela: str, quantidade: int) -> int:
+    """
+    Reserva `quantidade` ids seguidos na tabela e retorna o primeiro.
+    Deve ser chamada dentro da transação que insere os itens.
+    """
+    ultimo = conexao.execute(
+        f"SELECT MAX(COALESCE((SELECT ultimo_id FROM sequencias WHERE colecao = ?), 0),"
+        f" COALESCE((SELECT MAX(id) FROM {tabela}), 0))",
+        (tabela,)
+    ).fetchone()[0]
+    conexao.execute(
+        "INSERT OR REPLACE INTO sequencias (colecao, ultimo_id) VALUES (?, ?)", (tabela, ultimo + quantidade)
+    )
+    return ultimo + 1
+
+
+def _inserir(tabela: str, item: dict) -> dict:
+    """Insere o item (sem id) e retorna-o com o id atribuído."""
+    colunas = ", ".join(item)
+    marcadores = ", ".join("?" for _ in item)
+    with _lock:
+        conexao = _conectar()
+        with conexao:
+            item = {"id": _reservar_ids(conexao, tabela, 1), **item}
+            conexao.execute(
+                f"INSERT INTO {tabela} (id, {colunas}) VALUES (?, {marcadores})", tuple(item.values())
+            )
+        return item
+
+
+def _atualizar(tabela: str, item_id: int, campos: dict) -> Optional[dict]:
+    """Atualiza os campos do item e retorna-o, ou None se não existir."""
+    atribuicoes = ", ".join(f"{c} = ?" for c in campos)
+    with _lock:
+        conexao = _conectar()
+        with conexao:
+            cursor = conexao.execute(
+                f"UPDATE {tabela} SET {atribuicoes} WHERE id = ?", (*campos.values(), item_id)
+            )
+        if cursor.rowcount == 0:
+            return None
+        return _consultar_um(f"SELECT * FROM {tabela} WHERE id = ?", (item_id,))
+
+
+def _excluir(tabela: str, item_id: int) -> bool:
+    """Exclui o item pelo id."""
+    with _lock:
+        conexao = _conectar()
+        with conexao:
+            cursor = conexao.execute(f"DELETE FROM {tabela} WHERE id = ?", (item_id,))
+        return cursor.rowcount > 0
+
+
+def versao_armazenamento() -> tuple:
+    """
+    Identifica as alterações feitas no banco por outras conexões (PRAGMA
+    data_version). As escritas desta conexão são contadas em database.py.
+    """
+    with _lock:
+        conexao = _conectar()
+        return _conexao_chave, conexao.execute("PRAGMA data_version").fetchone()[0]
+
+
+# ===================== VEÍCULOS =====================
+
+def listar_veiculos() -> list:
+    """Lista todos os veículos."""
+    return _consultar("SELECT * FROM veiculos ORDER BY id")
+
+
+def obter_veiculo(veiculo_id: int) -> Optional[dict]:
+    """Obtém um veículo pelo ID."""
+    return _consultar_um("SELECT * FROM veiculos WHERE id = ?", (veiculo_id,))
+
+
+def adicionar_veiculo(marca: str, modelo: str, ano: int, km: float) -> dict:
+    """Adiciona um novo veículo."""
+    return _inserir("veiculos", {
+        "marca": marca,
+        "modelo": modelo,
+        "ano": ano,
+        "km": km,
+        "criado_em": datetime.now().isoformat()
+    })
+
+
+def atualizar_veiculo(veiculo_id: int, marca: str, modelo: str, ano: int, km: float) -> Optional[dict]:
+    """Atualiza um veículo existente."""
+    return _atualizar("veiculos", veiculo_id, {
+        "marca": marca,
+        "modelo": modelo,
+        "ano": ano,
+        "km": km,
+        "atualizado_em": datetime.now().isoformat()
+    })
+
+
+def excluir_veiculo(veiculo_id: int) -> bool:
+    """Exclui um veículo e seus registros de manutenção."""
+    with _lock:
+        conexao = _conectar()
+        with conexao:
+            cursor = conexao.execute("DELETE FROM veiculos WHERE id = ?", (veiculo_id,))
+            if cursor.rowcount == 0:
+                return False
+            conexao.execute("DELETE FROM registros_manutencao WHERE veiculo_id = ?", (veiculo_id,))
+            conexao.execute("DELETE FROM leituras_odometro WHERE veiculo_id = ?", (veiculo_id,))
+        return True
+
+
+# ===================== ODÔMETRO =====================
+
+def atualizar_odometros(leituras: dict) -> int:
+    """
+    Grava de uma vez leituras de odômetro de vários veículos, em uma única
+    transação. Mesmo formato e retorno de database.atualizar_odometros.
+    """
+    atualizado_em = datetime.now().isoformat()
+    with _lock:
+        conexao = _conectar()
+        existentes = {linha[0] for linha in conexao.execute("SELECT id FROM veiculos")}
+        leituras = {veiculo_id: dias for veiculo_id, dias in leituras.items() if dias and veiculo_id in existentes}
+        with conexao:
+            conexao.executemany(
+                "UPDATE veiculos SET km = ?, atualizado_em = ? WHERE id = ?",
+                ((dias[max(dias)], atualizado_em, veiculo_id) for veiculo_id, dias in leituras.items())
+            )
+            conexao.executemany(
+                "INSERT OR REPLACE INTO leituras_odometro (veiculo_id, data, km) VALUES (?, ?, ?)",
+                ((veiculo_id, dia, km) for veiculo_id, dias in leituras.items() for dia, km in dias.items())
+            )
+            # Mantém só os últimos ODOMETRO_DIAS dias de cada veículo atualizado
+            conexao.executemany(
+                "DELETE FROM leituras_odometro WHERE veiculo_id = ? AND data < ("
+                " SELECT date(MAX(data), ?) FROM leituras_odometro WHERE veiculo_id = ?)",
+                ((veiculo_id, f"-{database.ODOMETRO_DIAS} days", veiculo_id) for veiculo_id in leituras)
+            )
+    return len(leituras)
+
+
+def listar_leituras_odometro(veiculo_id: Optional[int] = None) -> list:
+    """Lista o histórico diário de odômetro, opcionalmente filtrado por veículo."""
+    if veiculo_id:
+        return _consultar(
+            "SELECT * FROM leituras_odometro WHERE veiculo_id = ? ORDER BY data", (veiculo_id,)
+        )
+    return _consultar("SELECT * FROM leituras_odometro ORDER BY veiculo_id, data")
+
+
+# ===================== TIPOS DE MANUTENÇÃO =====================
+
+def listar_tipos_manutencao() -> list:
+    """Lista todos os tipos de manutenção."""
+    return _consultar("SELECT * FROM manutencoes ORDER BY id")
+
+
+def obter_tipo_manutencao(manutencao_id: int) -> Optional[dict]:
+    """Obtém um tipo de manutenção pelo ID."""
+    return _consultar_um("SELECT * FROM manutencoes WHERE id = ?", (manutencao_id,))
+
+
+def adicionar_tipo_manutencao(nome: str, intervalo_km: Optional[float], intervalo_dias: Optional[int]) -> dict:
+    """Adiciona um novo tipo de manutenção."""
+    return _inserir("manutencoes", {
+        "nome": nome,
+        "intervalo_km": intervalo_km,
+        "intervalo_dias": intervalo_dias,
+        "criado_em": datetime.now().isoformat()
+    })
+
+
+def atualizar_tipo_manutencao(manutencao_id: int, nome: str, intervalo_km: Optional[float], intervalo_dias: Optional[int]) -> Optional[dict]:
+    """Atualiza um tipo de manutenção existente."""
+    return _atualizar("manutencoes", manutencao_id, {
+        "nome": nome,
+        "intervalo_km": intervalo_km,
+        "intervalo_dias": intervalo_dias,
+        "atualizado_em": datetime.now().isoformat()
+    })
+
+
+def excluir_tipo_manutencao(manutencao_id: int) -> bool:
+    """Exclui um tipo de manutenção e seus registros de manutenção."""
+    with _lock:
+        conexao = _conectar()
+        with conexao:
+            cursor = conexao.execute("DELETE FROM manutencoes WHERE id = ?", (manutencao_id,))
+            if cursor.rowcount == 0:
+                return False
+            conexao.execute("DELETE FROM registros_manutencao WHERE tipo_manutencao_id = ?", (manutencao_id,))
+        return True
+
+
+# ===================== REGISTROS DE MANUTENÇÃO =====================
+
+def listar_registros_manutencao(veiculo_id: Optional[int] = None) -> list:
+    """Lista registros de manutenção, opcionalmente filtrados por veículo."""
+    if veiculo_id:
+        return _consultar(
+            "SELECT * FROM registros_manutencao WHERE veiculo_id = ? ORDER BY id", (veiculo_id,)
+        )
+    return _consultar("SELECT * FROM registros_manutencao ORDER BY id")
+
+
+def adicionar_registro_manutencao(veiculo_id: int, tipo_manutencao_id: int, km_realizada: float, data_realizada: str, observacao: str = "") -> dict:
+    """Adiciona um registro de manutenção realizada."""
+    return _inserir("registros_manutencao", {
+        "veiculo_id": veiculo_id,
+        "tipo_manutencao_id": tipo_manutencao_id,
+        "km_realizada": km_realizada,
+        "data_realizada": data_realizada,
+        "observacao": observacao,
+        "criado_em": datetime.now().isoformat()
+    })
+
+
+def _excluir_registro_manutencao(registro_id: int) -> Optional[dict]:
+    """Exclui um registro de manutenção e retorna-o, ou None se ele não existir. Veja database.py."""
+    with _lock:
+        conexao = _conectar()
+        with conexao:
+            linhas = conexao.execute("DELETE FROM registros_manutencao WHERE id = ? RETURNING *", (registro_id,)).fetchall()
+        return _para_dict(linhas[0]) if linhas else None
+
+
+def listar_historico_manutencao(
+    veiculo_id: Optional[int] = None,
+    tipo_manutencao_id: Optional[int] = None,
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    limite: int = 20,
+    deslocamento: int = 0,
+) -> dict:
+    """
+    Lista uma página do histórico, da manutenção mais recente para a mais
+    antiga, com marca, modelo e nome do tipo. Veja database.py.
+    """
+    condicoes, parametros = [], []
+    if veiculo_id is not None:
+        condicoes.append("r.veiculo_id = ?")
+        parametros.append(veiculo_id)
+    if tipo_manutencao_id is not None:
+        condicoes.append("r.tipo_manutencao_id = ?")
+        parametros.append(tipo_manutencao_id)
+    if data_inicio is not None:
+        condicoes.append("substr(r.data_realizada, 1, 10) >= ?")
+        parametros.append(data_inicio)
+    if data_fim is not None:
+        condicoes.append("substr(r.data_realizada, 1, 10) <= ?")
+        parametros.append(data_fim)
+    juncao = (
+        " FROM registros_manutencao r"
+        " JOIN veiculos v ON v.id = r.veiculo_id"
+        " JOIN manutencoes m ON m.id = r.tipo_manutencao_id"
+    )
+    if condicoes:
+        juncao += " WHERE " + " AND ".join(condicoes)
+    with _lock:
+        total = _conectar().execute("SELECT COUNT(*)" + juncao, parametros).fetchone()[0]
+        registros = _consultar(
+            "SELECT r.*, v.marca, v.modelo, m.nome AS tipo_nome" + juncao
+            + " ORDER BY r.data_realizada DESC, r.id LIMIT ? OFFSET ?",
+            (*parametros, limite, deslocamento)
+        )
+    return {"total": total, "registros": registros}
+
+
+def ultimo_registro_manutencao(veiculo_id: int, tipo_manutencao_id: int) -> Optional[dict]:
+    """Retorna o registro mais recente de um tipo de manutenção para o veículo."""
+    return _consultar_um(
+        "SELECT * FROM registros_manutencao"
+        " WHERE veiculo_id = ? AND tipo_manutencao_id = ?"
+        " ORDER BY data_realizada DESC, id LIMIT 1",
+        (veiculo_id, tipo_manutencao_id)
+    )
+
+
+def adicionar_em_lote(colecao: str, itens: list) -> list:
+    """
+    Adiciona vários itens (sem id) a uma tabela em uma única transação.
+    Os ids são atribuídos em bloco e "criado_em" é preenchido quando ausente.
+    """
+    if colecao not in database.COLECOES:
+        raise ValueError(f"Coleção desconhecida: {colecao}")
+    criado_em = datetime.now().isoformat()
+    with _lock:
+        conexao = _conectar()
+        colunas = [linha["name"] for linha in conexao.execute(f"PRAGMA table_info({colecao})")]
+        with conexao:
+            inicio = _reservar_ids(conexao, colecao, len(itens))
+            novos = [
+                {"id": inicio + i, **item, "criado_em": item.get("criado_em") or criado_em}
+                for i, item in enumerate(itens)
+            ]
+            conexao.executemany(
+                f"INSERT INTO {colecao} ({', '.join(colunas)}) VALUES ({', '.join('?' for _ in colunas)})",
+                (tuple(item.get(c) for c in colunas) for item in novos)
+            )
+    return novos
+
+
+# ===================== COMPACTAÇÃO =====================
+
+def compactar() -> dict:
+    """
+    Remove registros e leituras de odômetro órfãos e incorpora o WAL ao
+    banco. Mesmo retorno de database.compactar.
+    """
+    with _lock:
+        conexao = _conectar()
+        with conexao:
+            registros = conexao.execute(
+                "DELETE FROM registros_manutencao"
+                " WHERE veiculo_id NOT IN (SELECT id FROM veiculos)"
+                " OR tipo_manutencao_id NOT IN (SELECT id FROM manutencoes)"
+            ).rowcount
+            leituras = conexao.execute(
+                "DELETE FROM leituras_odometro WHERE veiculo_id NOT IN (SELECT id FROM veiculos)"
+            ).rowcount
+        conexao.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return {"registros_manutencao": registros, "leituras_odometro": leituras}
+
+
+# ===================== MIGRAÇÃO =====================
+
+def migrar_de_json(substituir: bool = False) -> dict:
+    """
+    Copia os dados dos arquivos JSON de database.DATA_DIR para o SQLite,
+    preservando os ids. Recusa-se a rodar sobre um banco com dados, a menos
+    que substituir=True. Retorna a quantidade migrada por tabela.
+    """
+    origens = {
+        "veiculos": list(database._carregar_com_journal(database.VEICULOS_FILE).values()),
+        "manutencoes": list(database._carregar_com_journal(database.MANUTENCOES_FILE).values()),
+        "registros_manutencao": database._todos_registros(),
+        "leituras_odometro": [
+            {"veiculo_id": h["veiculo_id"], "data": dia, "km": km}
+            for h in database._carregar_json(database.ODOMETRO_FILE)
+            for dia, km in h["leituras"]
+        ],
+    }
+    with _lock:
+        conexao = _conectar()
+        colunas_por_tabela = {
+            tabela: [linha["name"] for linha in conexao.execute(f"PRAGMA table_info({tabela})")]
+            for tabela in origens
+        }
+        with conexao:
+            for tabela in origens:
+                if not substituir and conexao.execute(f"SELECT 1 FROM {tabela} LIMIT 1").fetchone():
+                    raise ValueError(f"O banco já possui dados na tabela {tabela}")
+                conexao.execute(f"DELETE FROM {tabela}")
+            for tabela, itens in origens.items():
+                colunas = colunas_por_tabela[tabela]
+                conexao.executemany(
+                    f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' for _ in colunas)})",
+                    (tuple(item.get(c) for c in colunas) for item in itens)
+                )
+            # Mantém os ids já excluídos no JSON fora de uso também aqui
+            conexao.execute("DELETE FROM sequencias")
+            conexao.executemany(
+                "INSERT INTO sequencias (colecao, ultimo_id) VALUES (?, ?)",
+                ((colecao, database._proximo_id(database._arquivo_colecao(colecao)) - 1) for colecao in database.COLECOES)
+            )
+    database._nova_versao()
+    return {tabela: len(itens) for tabela, itens in origens.items()}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migra os dados JSON para o SQLite.")
+    parser.add_argument("--substituir", action="store_true", help="apaga os dados já existentes no banco")
+    args = parser.parse_args()
+    for tabela, quantidade in migrar_de_json(args.substituir).items():
+        print(f"{tabela}: {quantidade}")
+    print(f"Banco gerado em {database.SQLITE_FILE}")
@@ -0,0 +1,117 @@
+"""
+Cálculos em lote sobre a frota inteira.
+Equivalem a chamar database.calcular_proxima_manutencao para cada par
+(veículo, tipo de manutenção), mas leem os dados uma única vez e fazem as
+contas de forma vetorizada com pandas.
+"""
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import database as db
+from snapshot_colunar import SnapshotRegistros
+
+CHAVES = ["veiculo_id", "tipo_manutencao_id"]
+
+
+def ultimos_registros(registros: pd.DataFrame) -> pd.DataFrame:
+    """
+    Retorna o registro mais recente de cada par (veículo, tipo).
+    Em caso de empate na data, vale o de menor id, como em
+    database.ultimo_registro_manutencao.
+    """
+    maior_data = registros.groupby(CHAVES)["data_realizada"].transform("max")
+    mais_recentes = registros[registros["data_realizada"] == maior_data]
+    return mais_recentes.sort_values("id", kind="stable").drop_duplicates(CHAVES)
+
+
+def _carregar_registros(snapshot: Optional[SnapshotRegistros]) -> pd.DataFrame:
+    """Registros como DataFrame, com data_realizada em datetime64."""
+    colunas = ["id", "veiculo_id", "tipo_manutencao_id", "km_realizada", "data_realizada"]
+    if snapshot is not None:
+        return snapshot.para_dataframe()[colunas]
+    registros = pd.DataFrame(db.listar_registros_manutencao(), columns=colunas)
+    registros["data_realizada"] = pd.to_datetime(registros["data_realizada"], format="ISO8601")
+    return registros
+
+
+def calcular_proximas_manutencoes_frota(
+    agora: Optional[datetime] = None,
+    snapshot: Optional[SnapshotRegistros] = None,
+) -> pd.DataFrame:
+    """
+    Calcula a situação de todos os pares (veículo, tipo de manutenção).
+    Retorna um DataFrame com uma linha por par, na ordem de listar_veiculos()
+    e listar_tipos_manutencao(), com as colunas veiculo_id,
+    tipo_manutencao_id, tipo_nome, km_faltante, km_proxima, dias_faltantes,
+    data_proxima e status. Valores não aplicáveis ficam nulos.
+    Se um snapshot colunar for passado, os registros vêm dele em vez do
+    backend; cabe a quem chama garantir que ele esteja atualizado.
+    """
+    agora = agora or datetime.now()
+    veiculos = pd.DataFrame(db.listar_veiculos(), columns=["id", "km"])
+    tipos = pd.DataFrame(db.listar_tipos_manutencao(), columns=["id", "nome", "intervalo_km", "intervalo_dias"])
+    registros = _carregar_registros(snapshot)
+
+    matriz = veiculos.rename(columns={"id": "veiculo_id", "km": "km_atual"}).merge(
+        tipos.rename(columns={"id": "tipo_manutencao_id", "nome": "tipo_nome"}), how="cross"
+    )
+    matriz = matriz.merge(ultimos_registros(registros).drop(columns="id"), on=CHAVES, how="left")
+
+    realizada = matriz["data_realizada"].notna().to_numpy()
+    intervalo_km = pd.to_numeric(matriz["intervalo_km"]).fillna(0).to_numpy(dtype=float)
+    intervalo_dias = pd.to_numeric(matriz["intervalo_dias"]).fillna(0).to_numpy(dtype=float)
+
+    # Por KM
+    por_km = realizada & (intervalo_km != 0)
+    km_realizada = pd.to_numeric(matriz["km_realizada"]).to_numpy(dtype=float)
+    km_proxima = np.where(por_km, km_realizada + intervalo_km, np.nan)
+    km_faltante = km_proxima - pd.to_numeric(matriz["km_atual"]).to_numpy(dtype=float)
+
+    # Por dias
+    por_dias = realizada & (intervalo_dias != 0)
+    data_ultima = matriz["data_realizada"].where(por_dias)
+    data_proxima = data_ultima + pd.to_timedelta(intervalo_dias, unit="D")
+    dias_faltantes = (data_proxima - pd.Timestamp(agora)).dt.days.astype("Int64")
+
+    vencida = (km_faltante <= 0) | (dias_faltantes.fillna(1).to_numpy() <= 0)
+    status = np.select([~realizada, vencida], ["pendente", "vencida"], "ok")
+
+    return pd.DataFrame({
+        "veiculo_id": matriz["veiculo_id"],
+        "tipo_manutencao_id": matriz["tipo_manutencao_id"],
+        "tipo_nome": matriz["tipo_nome"],
+        "km_faltante": km_faltante,
+        "km_proxima": km_proxima,
+        "dias_faltantes": dias_faltantes,
+        "data_proxima": data_proxima.dt.strftime("%d/%m/%Y").where(por_dias, None),
+        "status": status,
+    })
+
+
+def para_resultados(situacao: pd.DataFrame) -> dict:
+    """
+    Converte o DataFrame de calcular_proximas_manutencoes_frota em
+    {(veiculo_id, tipo_manutencao_id): resultado}, com cada resultado no mesmo
+    formato retornado por database.calcular_proxima_manutencao.
+    """
+    resultados = {}
+    for linha in situacao.itertuples(index=False):
+        resultado = {
+            "tipo_nome": linha.tipo_nome,
+            "km_faltante": None,
+            "dias_faltantes": None,
+            "status": linha.status,
+        }
+        if linha.status == "pendente":
+            resultado["mensagem"] = "Manutenção nunca realizada"
+        if not pd.isna(linha.km_proxima):
+            resultado["km_faltante"] = float(linha.km_faltante)
+            resultado["km_proxima"] = float(linha.km_proxima)
+        if not pd.isna(linha.dias_faltantes):
+            resultado["dias_faltantes"] = int(linha.dias_faltantes)
+            resultado["data_proxima"] = linha.data_proxima
+        resultados[(int(linha.veiculo_id), int(linha.tipo_manutencao_id))] = resultado
+    return resultados
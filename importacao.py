@@ -0,0 +1,279 @@
+"""
+Importação em massa de veículos, tipos de manutenção e histórico.
+
+Os arquivos (CSV com cabeçalho ou JSON lines) são lidos em blocos, validados
+contra os ids já conhecidos e gravados com uma única escrita por coleção,
+em vez de uma chamada a adicionar_* por linha.
+
+Uma coluna "id" opcional nos arquivos de veículos e tipos serve apenas de
+referência dentro da importação: os registros podem apontar para ela em
+veiculo_id/tipo_manutencao_id, e ela é traduzida para o id atribuído. Ids
+que não estejam no arquivo são procurados entre os já cadastrados.
+
+Uso:
+    python importacao.py --veiculos veiculos.csv --tipos tipos.csv --registros historico.jsonl
+"""
+import csv
+import json
+import math
+import os
+from datetime import date
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional
+
+import database as db
+
+TAMANHO_BLOCO = 10000
+
+# Limites dos campos numéricos: valores fora deles são erros de digitação ou
+# de unidade e, gravados, quebrariam os cálculos de prazo (datas, inteiros do C)
+MAX_KM = 10_000_000
+MIN_ANO = 1900
+# Cem anos: a data da próxima manutenção continua dentro do intervalo de date
+MAX_INTERVALO_DIAS = 36500
+
+
+def ler_linhas(caminho: str) -> Iterator:
+    """
+    Lê um arquivo CSV ou JSON lines, uma linha por vez: um dict por linha do
+    CSV ou o texto de cada linha do JSON lines, convertido por como_dict na
+    validação da linha (assim uma linha malformada é rejeitada sem
+    interromper a leitura das demais).
+    """
+    extensao = os.path.splitext(caminho)[1].lower()
+    with open(caminho, "r", encoding="utf-8", newline="") as f:
+        if extensao == ".csv":
+            yield from csv.DictReader(f)
+        elif extensao in (".jsonl", ".ndjson"):
+            for linha in f:
+                if linha.strip():
+                    yield linha
+        else:
+            raise ValueError(f"Formato não suportado: {caminho} (use .csv ou .jsonl)")
+
+
+def como_dict(linha) -> dict:
+    """Converte uma linha de ler_linhas em dict, ou levanta ValueError."""
+    if isinstance(linha, str):
+        try:
+            linha = json.loads(linha)
+        except ValueError as e:
+            raise ValueError(f"JSON inválido: {e}")
+    if not isinstance(linha, dict):
+        raise ValueError(f"a linha deve ser um objeto, não {type(linha).__name__}")
+    return linha
+
+
+def em_blocos(linhas: Iterable[dict], tamanho: int) -> Iterator[list]:
+    """Agrupa as linhas em listas de até `tamanho` itens."""
+    linhas = iter(linhas)
+    while True:
+        bloco = list(islice(linhas, tamanho))
+        if not bloco:
+            return
+        yield bloco
+
+
+def _vazio(valor) -> bool:
+    """Indica se o valor veio em branco."""
+    return valor is None or (isinstance(valor, str) and not valor.strip())
+
+
+def _texto(linha: dict, campo: str) -> str:
+    """Lê um campo de texto obrigatório."""
+    valor = linha.get(campo)
+    if _vazio(valor):
+        raise ValueError(f"{campo} é obrigatório")
+    return str(valor).strip()
+
+
+def _numero(
+    linha: dict,
+    campo: str,
+    tipo=float,
+    opcional: bool = False,
+    minimo: float = 0,
+    maximo: float = MAX_KM,
+):
+    """Lê um campo numérico entre `minimo` e `maximo`; se `tipo` for int, sem casas decimais."""
+    valor = linha.get(campo)
+    if _vazio(valor):
+        if opcional:
+            return None
+        raise ValueError(f"{campo} é obrigatório")
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"{campo} inválido: {valor!r}")
+    if not math.isfinite(numero):
+        raise ValueError(f"{campo} inválido: {valor!r}")
+    if tipo is int and not numero.is_integer():
+        raise ValueError(f"{campo} deve ser inteiro: {valor!r}")
+    if numero < minimo:
+        raise ValueError(f"{campo} não pode ser negativo" if minimo == 0 else f"{campo} deve ser no mínimo {minimo}")
+    if numero > maximo:
+        raise ValueError(f"{campo} deve ser no máximo {maximo}")
+    return tipo(numero)
+
+
+def _referencia(linha: dict, campo: str):
+    """Chave de referência de uma linha (a coluna "id" ou o veiculo_id etc.)."""
+    valor = linha.get(campo)
+    if _vazio(valor):
+        return None
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError, OverflowError):
+        return str(valor).strip()
+
+
+def _validar_veiculo(linha: dict) -> dict:
+    """Converte uma linha em veículo, ou levanta ValueError."""
+    return {
+        "marca": _texto(linha, "marca"),
+        "modelo": _texto(linha, "modelo"),
+        "ano": _numero(linha, "ano", int, minimo=MIN_ANO, maximo=date.today().year + 1),
+        "km": _numero(linha, "km"),
+    }
+
+
+def _validar_tipo(linha: dict) -> dict:
+    """Converte uma linha em tipo de manutenção, ou levanta ValueError."""
+    tipo = {
+        "nome": _texto(linha, "nome"),
+        "intervalo_km": _numero(linha, "intervalo_km", opcional=True) or None,
+        "intervalo_dias": _numero(linha, "intervalo_dias", int, opcional=True, maximo=MAX_INTERVALO_DIAS) or None,
+    }
+    if tipo["intervalo_km"] is None and tipo["intervalo_dias"] is None:
+        raise ValueError("informe pelo menos um intervalo")
+    return tipo
+
+
+def _validar_registro(linha: dict, veiculos: dict, tipos: dict) -> dict:
+    """Converte uma linha em registro, resolvendo as referências, ou levanta ValueError."""
+    veiculo_id = veiculos.get(_referencia(linha, "veiculo_id"))
+    if veiculo_id is None:
+        raise ValueError(f"veículo inexistente: {linha.get('veiculo_id')!r}")
+    tipo_id = tipos.get(_referencia(linha, "tipo_manutencao_id"))
+    if tipo_id is None:
+        raise ValueError(f"tipo de manutenção inexistente: {linha.get('tipo_manutencao_id')!r}")
+    data = _texto(linha, "data_realizada")
+    try:
+        # Normaliza para AAAA-MM-DD, o mesmo formato gravado pelo app
+        data = date.fromisoformat(data).isoformat()
+    except ValueError:
+        raise ValueError(f"data_realizada inválida: {data!r}")
+    return {
+        "veiculo_id": veiculo_id,
+        "tipo_manutencao_id": tipo_id,
+        "km_realizada": _numero(linha, "km_realizada"),
+        "data_realizada": data,
+        "observacao": "" if _vazio(linha.get("observacao")) else str(linha["observacao"]),
+    }
+
+
+def _importar_colecao(
+    colecao: str,
+    linhas: Iterable[dict],
+    validar: Callable[[dict], dict],
+    tamanho_bloco: int,
+    progresso: Optional[Callable[[str, int], None]],
+) -> tuple:
+    """
+    Valida as linhas em blocos e grava as aceitas de uma só vez.
+    Retorna (relatório, {referência do arquivo: id atribuído}).
+    """
+    aceitos, referencias, rejeitados = [], [], []
+    lidas = 0
+    for bloco in em_blocos(linhas, tamanho_bloco):
+        for linha in bloco:
+            lidas += 1
+            try:
+                linha = como_dict(linha)
+                aceitos.append(validar(linha))
+                referencias.append(_referencia(linha, "id"))
+            except ValueError as e:
+                rejeitados.append({"linha": lidas, "motivo": str(e)})
+        if progresso:
+            progresso(colecao, lidas)
+    novos = db.adicionar_em_lote(colecao, aceitos)
+    mapa = {ref: novo["id"] for ref, novo in zip(referencias, novos) if ref is not None}
+    relatorio = {"lidas": lidas, "importadas": len(novos), "rejeitadas": rejeitados}
+    return relatorio, mapa
+
+
+def importar(
+    veiculos: Optional[Iterable[dict]] = None,
+    tipos: Optional[Iterable[dict]] = None,
+    registros: Optional[Iterable[dict]] = None,
+    tamanho_bloco: int = TAMANHO_BLOCO,
+    progresso: Optional[Callable[[str, int], None]] = None,
+) -> dict:
+    """
+    Importa linhas (dicts ou textos JSON, como as de ler_linhas) de veículos,
+    tipos de manutenção e registros, nessa ordem. `progresso(colecao,
+    linhas_lidas)` é chamado a cada bloco. Retorna um relatório por coleção com as quantidades
+    lidas e importadas e as linhas rejeitadas com o motivo (a linha 1 é a
+    primeira linha de dados, sem contar o cabeçalho do CSV).
+    """
+    relatorio = {}
+    ids_veiculos = {v["id"]: v["id"] for v in db.listar_veiculos()}
+    ids_tipos = {t["id"]: t["id"] for t in db.listar_tipos_manutencao()}
+
+    if veiculos is not None:
+        relatorio["veiculos"], mapa = _importar_colecao(
+            "veiculos", veiculos, _validar_veiculo, tamanho_bloco, progresso
+        )
+        ids_veiculos.update(mapa)
+    if tipos is not None:
+        relatorio["manutencoes"], mapa = _importar_colecao(
+            "manutencoes", tipos, _validar_tipo, tamanho_bloco, progresso
+        )
+        ids_tipos.update(mapa)
+    if registros is not None:
+        relatorio["registros_manutencao"], _ = _importar_colecao(
+            "registros_manutencao", registros,
+            lambda linha: _validar_registro(linha, ids_veiculos, ids_tipos),
+            tamanho_bloco, progresso
+        )
+    return relatorio
+
+
+def importar_arquivos(
+    veiculos: Optional[str] = None,
+    tipos: Optional[str] = None,
+    registros: Optional[str] = None,
+    **kwargs,
+) -> dict:
+    """Atalho para importar() a partir de caminhos de arquivos CSV/JSON lines."""
+    return importar(
+        veiculos=ler_linhas(veiculos) if veiculos else None,
+        tipos=ler_linhas(tipos) if tipos else None,
+        registros=ler_linhas(registros) if registros else None,
+        **kwargs,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Importa veículos, tipos de manutenção e histórico em massa.")
+    parser.add_argument("--veiculos", help="arquivo .csv/.jsonl com marca, modelo, ano, km")
+    parser.add_argument("--tipos", help="arquivo .csv/.jsonl com nome, intervalo_km, intervalo_dias")
+    parser.add_argument("--registros", help="arquivo .csv/.jsonl com veiculo_id, tipo_manutencao_id, km_realizada, data_realizada, observacao")
+    parser.add_argument("--tamanho-bloco", type=int, default=TAMANHO_BLOCO)
+    parser.add_argument("--max-rejeicoes", type=int, default=20, help="quantas rejeições listar por coleção")
+    args = parser.parse_args()
+    if not (args.veiculos or args.tipos or args.registros):
+        parser.error("informe pelo menos um arquivo")
+
+    relatorio = importar_arquivos(
+        args.veiculos, args.tipos, args.registros,
+        tamanho_bloco=args.tamanho_bloco,
+        progresso=lambda colecao, lidas: print(f"{colecao}: {lidas} linhas lidas", file=sys.stderr),
+    )
+    for colecao, resumo in relatorio.items():
+        print(f"{colecao}: {resumo['importadas']} importadas, {len(resumo['rejeitadas'])} rejeitadas de {resumo['lidas']}")
+        for rejeicao in resumo["rejeitadas"][:args.max_rejeicoes]:
+            print(f"  linha {rejeicao['linha']}: {rejeicao['motivo']}")
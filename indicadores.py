@@ -0,0 +1,278 @@
+"""
+Indicadores da frota, mantidos como tabelas pré-agregadas:
+
+- manutenções por tipo e mês: {(tipo_id, "AAAA-MM"): quantidade};
+- km entre serviços: para cada par (veículo, tipo), a quantidade de registros
+  e a menor e a maior quilometragem. Em ordem de km, a soma dos intervalos
+  entre serviços do par é maior - menor, então a média de cada tipo sai de
+  soma(maior - menor) / soma(quantidade - 1), também mantidas por tipo;
+- taxa de vencidas por marca e modelo, calculada a partir da agenda
+  (agenda.py), que já mantém a situação de cada par.
+
+As tabelas são montadas com groupby do pandas e depois atualizadas a cada
+inclusão ou exclusão de registro, sem reler o histórico (veja visao.py). No
+backend JSON elas também são gravadas em indicadores.json com a assinatura
+dos dados de origem, para que o app reiniciado ou outro processo as
+reaproveite.
+"""
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+import agenda
+import database as db
+import visao
+
+
+def _caminho() -> str:
+    """Arquivo com as tabelas gravadas, no diretório de dados atual."""
+    return os.path.join(db.DATA_DIR, "indicadores.json")
+
+
+def _assinatura_origem() -> Optional[str]:
+    """Assinatura dos dados de origem, ou None se ela não valer entre processos."""
+    if db.BACKEND != "json":
+        # O PRAGMA data_version do SQLite só vale para a conexão que o leu
+        return None
+    return json.dumps(db._assinatura_armazenamento())
+
+
+def _existentes() -> tuple:
+    """Ids dos veículos e dos tipos de manutenção cadastrados."""
+    return {v["id"] for v in db.listar_veiculos()}, {t["id"] for t in db.listar_tipos_manutencao()}
+
+
+class Indicadores(visao.VisaoIncremental):
+    """Tabelas pré-agregadas dos indicadores, atualizadas pelas escritas."""
+
+    def __init__(self):
+        super().__init__()
+        self._por_tipo_mes: dict = {}   # (tipo_id, "AAAA-MM") -> quantidade
+        self._pares: dict = {}          # (veiculo_id, tipo_id) -> [quantidade, km_menor, km_maior]
+        self._km_por_tipo: dict = {}    # tipo_id -> [soma dos intervalos em km, intervalos]
+        # Ids de veículos e de tipos inexistentes citados por registros (órfãos),
+        # que entram nas tabelas se o veículo ou o tipo passar a existir
+        self._orfaos: tuple = (set(), set())
+        self._gravado = False
+
+    # ---------- montagem e gravação ----------
+
+    def _agregar(self):
+        """Agrega o histórico inteiro com pandas."""
+        registros = pd.DataFrame(
+            db.listar_registros_manutencao(),
+            columns=["veiculo_id", "tipo_manutencao_id", "km_realizada", "data_realizada"],
+        )
+        veiculos, tipos = _existentes()
+        # Só os registros de veículos e tipos existentes, os que listar_historico_manutencao mostra
+        existentes = registros["veiculo_id"].isin(veiculos) & registros["tipo_manutencao_id"].isin(tipos)
+        orfaos = registros[~existentes]
+        self._orfaos = (set(map(int, orfaos["veiculo_id"])), set(map(int, orfaos["tipo_manutencao_id"])))
+        registros = registros[existentes]
+        meses = registros["data_realizada"].str[:7].rename("mes")
+        por_tipo_mes = registros.groupby(["tipo_manutencao_id", meses]).size()
+        pares = registros.groupby(["veiculo_id", "tipo_manutencao_id"])["km_realizada"].agg(["size", "min", "max"])
+        self._por_tipo_mes = {(int(tipo_id), mes): int(n) for (tipo_id, mes), n in por_tipo_mes.items()}
+        self._pares = {
+            (int(veiculo_id), int(tipo_id)): [int(n), float(menor), float(maior)]
+            for (veiculo_id, tipo_id), n, menor, maior in zip(pares.index, pares["size"], pares["min"], pares["max"])
+        }
+
+    def _carregar(self, assinatura: Optional[str]) -> bool:
+        """Carrega as tabelas gravadas, se forem dos dados atuais."""
+        if assinatura is None:
+            return False
+        try:
+            with open(_caminho(), encoding="utf-8") as f:
+                gravado = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        if gravado.get("assinatura") != assinatura or "orfaos" not in gravado:
+            return False
+        self._por_tipo_mes = {(tipo_id, mes): n for tipo_id, mes, n in gravado["por_tipo_mes"]}
+        self._pares = {(veiculo_id, tipo_id): [n, menor, maior] for veiculo_id, tipo_id, n, menor, maior in gravado["pares"]}
+        self._orfaos = tuple(set(ids) for ids in gravado["orfaos"])
+        return True
+
+    def _gravar(self):
+        """
+        Grava as tabelas com a assinatura atual, desde que não haja alteração
+        de outro processo ainda não acompanhada (assinatura lida antes da versão).
+        """
+        assinatura = _assinatura_origem()
+        if assinatura is None or self._gravado or db.versao_dados() != self._versao:
+            return
+        conteudo = {
+            "assinatura": assinatura,
+            "por_tipo_mes": [[tipo_id, mes, n] for (tipo_id, mes), n in sorted(self._por_tipo_mes.items())],
+            "pares": [[veiculo_id, tipo_id, *valores] for (veiculo_id, tipo_id), valores in sorted(self._pares.items())],
+            "orfaos": [sorted(ids) for ids in self._orfaos],
+        }
+        temporario = _caminho() + ".tmp"
+        try:
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(conteudo, f, ensure_ascii=False)
+            os.replace(temporario, _caminho())
+            self._gravado = True
+        except OSError:
+            # As tabelas em memória continuam valendo; grava na próxima consulta
+            pass
+
+    def _montar(self):
+        """Recarrega as tabelas gravadas ou, se não servirem, agrega-as de novo."""
+        assinatura = _assinatura_origem()
+        if not self._carregar(assinatura):
+            self._agregar()
+            self._gravado = False
+        else:
+            self._gravado = True
+        self._km_por_tipo = {}
+        for (_, tipo_id), par in self._pares.items():
+            self._somar_par(tipo_id, par, 1)
+
+    # ---------- atualização incremental ----------
+
+    def _somar_par(self, tipo_id: int, par: list, sinal: int):
+        """Soma (ou subtrai) a contribuição de um par à média de km do tipo."""
+        quantidade, menor, maior = par
+        if quantidade < 2:
+            return
+        km = self._km_por_tipo.setdefault(tipo_id, [0.0, 0])
+        km[0] += sinal * (maior - menor)
+        km[1] += sinal * (quantidade - 1)
+        if not km[1]:
+            del self._km_por_tipo[tipo_id]
+
+    def _trocar_par(self, chave: tuple, novo: Optional[list]):
+        """Substitui os valores de um par, atualizando a média de km do tipo."""
+        antigo = self._pares.pop(chave, None)
+        if antigo:
+            self._somar_par(chave[1], antigo, -1)
+        if novo:
+            self._pares[chave] = novo
+            self._somar_par(chave[1], novo, 1)
+
+    def _incluir(self, registro: dict, veiculos: set, tipos: set):
+        """Acrescenta um registro às tabelas, exceto se for órfão (como em _agregar)."""
+        if registro["veiculo_id"] not in veiculos or registro["tipo_manutencao_id"] not in tipos:
+            self._orfaos[0].add(registro["veiculo_id"])
+            self._orfaos[1].add(registro["tipo_manutencao_id"])
+            return
+        tipo_mes = (registro["tipo_manutencao_id"], registro["data_realizada"][:7])
+        self._por_tipo_mes[tipo_mes] = self._por_tipo_mes.get(tipo_mes, 0) + 1
+        chave = (registro["veiculo_id"], registro["tipo_manutencao_id"])
+        km = float(registro["km_realizada"])
+        par = self._pares.get(chave)
+        self._trocar_par(chave, [par[0] + 1, min(par[1], km), max(par[2], km)] if par else [1, km, km])
+
+    def _excluir(self, registro: dict):
+        """Retira um registro excluído das tabelas."""
+        tipo_mes = (registro["tipo_manutencao_id"], registro["data_realizada"][:7])
+        if self._por_tipo_mes.get(tipo_mes, 0) > 1:
+            self._por_tipo_mes[tipo_mes] -= 1
+        else:
+            self._por_tipo_mes.pop(tipo_mes, None)
+        chave = (registro["veiculo_id"], registro["tipo_manutencao_id"])
+        km = float(registro["km_realizada"])
+        par = self._pares.get(chave)
+        if par is None or par[0] <= 1:
+            self._trocar_par(chave, None)
+        elif par[1] < km < par[2]:
+            self._trocar_par(chave, [par[0] - 1, par[1], par[2]])
+        else:
+            # Era o menor ou o maior km: relê só os registros do par
+            kms = [
+                float(r["km_realizada"]) for r in db.listar_registros_manutencao(chave[0])
+                if r["tipo_manutencao_id"] == chave[1]
+            ]
+            self._trocar_par(chave, [len(kms), min(kms), max(kms)] if kms else None)
+
+    def _aplicar(self, operacao: str, parametros: dict, resultado) -> bool:
+        """Aplica a escrita às tabelas; retorna False se for preciso remontá-las."""
+        self._gravado = False
+        if operacao == "adicionar_registro_manutencao":
+            self._incluir(resultado, *_existentes())
+        elif operacao == "adicionar_em_lote" and parametros["colecao"] == "registros_manutencao":
+            veiculos, tipos = _existentes()
+            for registro in resultado:
+                self._incluir(registro, veiculos, tipos)
+        elif operacao == "excluir_registro_manutencao":
+            veiculos, tipos = _existentes()
+            # Um registro órfão não foi contado
+            if resultado and resultado["veiculo_id"] in veiculos and resultado["tipo_manutencao_id"] in tipos:
+                self._excluir(resultado)
+        elif operacao in ("adicionar_veiculo", "adicionar_tipo_manutencao"):
+            # Registros órfãos que apontavam para o novo id passam a contar
+            orfaos = self._orfaos[0 if operacao == "adicionar_veiculo" else 1]
+            return not resultado or resultado["id"] not in orfaos
+        elif operacao == "adicionar_em_lote" and parametros["colecao"] in ("veiculos", "manutencoes"):
+            orfaos = self._orfaos[0 if parametros["colecao"] == "veiculos" else 1]
+            return orfaos.isdisjoint(item["id"] for item in resultado)
+        elif operacao == "excluir_tipo_manutencao":
+            if resultado:
+                tipo_id = parametros["manutencao_id"]
+                self._por_tipo_mes = {chave: n for chave, n in self._por_tipo_mes.items() if chave[0] != tipo_id}
+                for chave in [chave for chave in self._pares if chave[1] == tipo_id]:
+                    self._trocar_par(chave, None)
+        elif operacao == "excluir_veiculo":
+            # Os registros do veículo somem sem que se saiba os meses deles
+            return not resultado or not any(chave[0] == parametros["veiculo_id"] for chave in self._pares)
+        elif operacao == "particionar_registros":
+            return False
+        return True
+
+    # ---------- consultas ----------
+
+    def _consultar(self):
+        """Prepara as tabelas para uma consulta (com o lock) e grava-as se mudaram."""
+        self._atualizar_versao()
+        self._gravar()
+
+    def manutencoes_por_mes(self) -> pd.DataFrame:
+        """Quantidade de manutenções por tipo e mês: colunas tipo, mes ("AAAA-MM") e quantidade."""
+        nomes = {t["id"]: t["nome"] for t in db.listar_tipos_manutencao()}
+        with self._lock:
+            self._consultar()
+            linhas = [
+                {"tipo": nomes.get(tipo_id, ""), "mes": mes, "quantidade": n}
+                for (tipo_id, mes), n in sorted(self._por_tipo_mes.items(), key=lambda item: (item[0][1], item[0][0]))
+            ]
+        return pd.DataFrame(linhas, columns=["tipo", "mes", "quantidade"])
+
+    def km_entre_servicos(self) -> pd.DataFrame:
+        """Km médio entre serviços de cada tipo: colunas tipo, km_medio e intervalos."""
+        tipos = db.listar_tipos_manutencao()
+        with self._lock:
+            self._consultar()
+            linhas = [
+                {"tipo": t["nome"], "km_medio": soma / intervalos, "intervalos": intervalos}
+                for t in tipos
+                for soma, intervalos in [self._km_por_tipo.get(t["id"], (0.0, 0))] if intervalos
+            ]
+        return pd.DataFrame(linhas, columns=["tipo", "km_medio", "intervalos"])
+
+
+def vencidas_por_modelo(agora: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    Situação dos pares (veículo, tipo) por marca e modelo, a partir da agenda:
+    colunas marca, modelo, pares, vencidas, pendentes e taxa_vencidas (0 a 1).
+    """
+    situacao = pd.DataFrame(agenda.obter_agenda().todas(agora), columns=["marca", "modelo", "status"])
+    colunas = ["marca", "modelo", "pares", "vencidas", "pendentes", "taxa_vencidas"]
+    if situacao.empty:
+        return pd.DataFrame(columns=colunas)
+    situacao["vencida"] = situacao["status"] == "vencida"
+    situacao["pendente"] = situacao["status"] == "pendente"
+    resumo = situacao.groupby(["marca", "modelo"], as_index=False).agg(
+        pares=("status", "size"), vencidas=("vencida", "sum"), pendentes=("pendente", "sum")
+    )
+    resumo["taxa_vencidas"] = resumo["vencidas"] / resumo["pares"]
+    return resumo.sort_values(["taxa_vencidas", "pares"], ascending=False, kind="stable")[colunas]
+
+
+def obter_indicadores() -> Indicadores:
+    """Indicadores compartilhados pelo processo, criados no primeiro uso."""
+    return Indicadores.compartilhada()
@@ -0,0 +1,145 @@
+"""
+Instrumentação opcional da camada de persistência.
+
+Quando ativa (MANUTENCAO_INSTRUMENTACAO=1 ou ativar()), registra para cada
+função decorada com @instrumentar o número de chamadas e as latências, além
+de contadores de I/O e de acertos de cache alimentados por database.py.
+Desativada, cada chamada instrumentada custa apenas o teste de uma flag.
+
+As latências são inclusivas: o tempo de uma função inclui o das funções
+instrumentadas que ela chama.
+"""
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+
+ATIVO = os.environ.get("MANUTENCAO_INSTRUMENTACAO", "") == "1"
+
+# Quantas latências recentes guardar por função para os percentis
+AMOSTRAS_POR_FUNCAO = 10000
+
+_lock = threading.Lock()
+_chamadas: dict = defaultdict(int)
+_tempo_total: dict = defaultdict(float)
+_tempo_maximo: dict = defaultdict(float)
+_amostras: dict = defaultdict(lambda: deque(maxlen=AMOSTRAS_POR_FUNCAO))
+_contadores: dict = defaultdict(int)
+_desde = datetime.now()
+
+
+def ativar():
+    """Liga a coleta de métricas."""
+    global ATIVO
+    ATIVO = True
+
+
+def desativar():
+    """Desliga a coleta de métricas, mantendo o que já foi coletado."""
+    global ATIVO
+    ATIVO = False
+
+
+def zerar():
+    """Descarta todas as métricas coletadas."""
+    global _desde
+    with _lock:
+        _chamadas.clear()
+        _tempo_total.clear()
+        _tempo_maximo.clear()
+        _amostras.clear()
+        _contadores.clear()
+        _desde = datetime.now()
+
+
+def instrumentar(func):
+    """Decorador que mede chamadas e latência da função quando ATIVO."""
+    nome = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not ATIVO:
+            return func(*args, **kwargs)
+        inicio = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duracao = time.perf_counter() - inicio
+            with _lock:
+                _chamadas[nome] += 1
+                _tempo_total[nome] += duracao
+                if duracao > _tempo_maximo[nome]:
+                    _tempo_maximo[nome] = duracao
+                _amostras[nome].append(duracao)
+    return wrapper
+
+
+def contar(chave: str, quantidade: int = 1):
+    """Soma `quantidade` ao contador `chave` (ex.: "io.bytes_lidos")."""
+    with _lock:
+        _contadores[chave] += quantidade
+
+
+def registrar_cache(nome: str, acerto: bool):
+    """Registra um acerto ou uma falha do cache `nome`."""
+    contar(f"cache.{nome}.{'acertos' if acerto else 'falhas'}")
+
+
+def _percentil(ordenadas: list, fracao: float) -> float:
+    """Percentil pelo método do posto mais próximo."""
+    return ordenadas[max(0, min(len(ordenadas) - 1, math.ceil(fracao * len(ordenadas)) - 1))]
+
+
+def resumo() -> dict:
+    """
+    Retorna as métricas coletadas: por função (chamadas e latências em ms,
+    com percentis sobre as últimas AMOSTRAS_POR_FUNCAO chamadas), contadores
+    de I/O e taxas de acerto de cada cache.
+    """
+    with _lock:
+        funcoes = {}
+        for nome, chamadas in sorted(_chamadas.items()):
+            ordenadas = sorted(_amostras[nome])
+            funcoes[nome] = {
+                "chamadas": chamadas,
+                "total_ms": round(_tempo_total[nome] * 1000, 3),
+                "media_ms": round(_tempo_total[nome] / chamadas * 1000, 4),
+                "p50_ms": round(_percentil(ordenadas, 0.50) * 1000, 4),
+                "p95_ms": round(_percentil(ordenadas, 0.95) * 1000, 4),
+                "p99_ms": round(_percentil(ordenadas, 0.99) * 1000, 4),
+                "max_ms": round(_tempo_maximo[nome] * 1000, 4),
+            }
+        contadores = dict(_contadores)
+        desde = _desde
+
+    caches = {}
+    for chave, valor in contadores.items():
+        if chave.startswith("cache."):
+            nome, tipo = chave[len("cache."):].rsplit(".", 1)
+            caches.setdefault(nome, {"acertos": 0, "falhas": 0})[tipo] = valor
+    for cache in caches.values():
+        total = cache["acertos"] + cache["falhas"]
+        cache["taxa_acerto"] = round(cache["acertos"] / total, 4) if total else None
+
+    return {
+        "ativo": ATIVO,
+        "desde": desde.isoformat(),
+        "funcoes": funcoes,
+        "io": {k[len("io."):]: v for k, v in sorted(contadores.items()) if k.startswith("io.")},
+        "cache": caches,
+    }
+
+
+def para_json() -> str:
+    """Métricas de resumo() serializadas em JSON."""
+    return json.dumps(resumo(), ensure_ascii=False, indent=2)
+
+
+def salvar_json(caminho: str):
+    """Grava as métricas de resumo() em um arquivo JSON."""
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write(para_json())
@@ -0,0 +1,280 @@
+"""
+Ingestão de leituras de odômetro vindas da telemetria.
+
+As leituras chegam em lotes de (veiculo_id, km, instante). O coletor rejeita
+regressões de quilometragem e leituras anteriores à última aceita do veículo,
+mesmo que ela já tenha sido gravada, e guarda até a próxima gravação a última
+leitura de cada dia, para o histórico. As leituras acumuladas são gravadas com uma única chamada a db.atualizar_odometros
+quando há MAX_PENDENTES veículos pendentes ou quando a leitura pendente mais
+antiga passa de INTERVALO_GRAVACAO segundos.
+
+Uso:
+    with ColetorOdometro() as coletor:
+        coletor.registrar([(1, 15230.5, "2026-10-17T08:00:00"), ...])
+
+    python odometro.py leituras.csv    # colunas veiculo_id, km, instante
+"""
+import math
+import threading
+import time
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+import database as db
+
+MAX_PENDENTES = 10000
+INTERVALO_GRAVACAO = 60.0
+
+# Janela padrão, em dias, para calcular a média de km rodados por dia
+JANELA_TAXA_DIAS = 30
+
+# Janela, em dias, do histórico usado quando não há leituras recentes de odômetro
+JANELA_HISTORICO_DIAS = 730
+
+
+def _instante(valor) -> datetime:
+    """Converte o instante da leitura (datetime ou texto ISO) em datetime local sem fuso."""
+    instante = valor if isinstance(valor, datetime) else datetime.fromisoformat(str(valor).strip())
+    if instante.tzinfo is not None:
+        instante = instante.astimezone().replace(tzinfo=None)
+    return instante
+
+
+class ColetorOdometro:
+    """
+    Acumula leituras de odômetro e grava-as em lote. Pode ser compartilhado
+    entre threads; use como context manager (ou chame gravar()) para não
+    perder as leituras pendentes ao final.
+    """
+
+    def __init__(self, max_pendentes: int = MAX_PENDENTES, intervalo: float = INTERVALO_GRAVACAO):
+        self.max_pendentes = max_pendentes
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._ultimas: dict = {}    # veiculo_id -> (instante, km) da última leitura aceita
+        self._diarias: dict = {}    # veiculo_id -> {"AAAA-MM-DD": km} ainda não gravados
+        self._pendente_desde: Optional[float] = None
+        self._kms: dict = {}
+        self._versao: Optional[int] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.gravar()
+
+    @property
+    def pendentes(self) -> int:
+        """Quantos veículos têm leituras ainda não gravadas."""
+        return len(self._diarias)
+
+    def _kms_gravados(self) -> dict:
+        """Quilometragem gravada de cada veículo, relida quando os dados mudam."""
+        versao = db.versao_dados()
+        if versao != self._versao:
+            self._kms = {v["id"]: v["km"] for v in db.listar_veiculos()}
+            self._versao = versao
+        return self._kms
+
+    def registrar(self, leituras: Iterable[tuple]) -> dict:
+        """
+        Registra um lote de leituras (veiculo_id, km, instante), processadas
+        em ordem cronológica. Grava as pendentes se algum limite for atingido.
+        Retorna {"aceitas", "rejeitadas": [{"posicao", "motivo"}], "gravados"},
+        onde posicao é o índice da leitura no lote e gravados é quantos
+        veículos foram atualizados por esta chamada.
+        """
+        rejeitadas = []
+        validas = []
+        for posicao, leitura in enumerate(leituras):
+            try:
+                veiculo_id, km, instante = leitura
+                km = float(km)
+                if not math.isfinite(km):
+                    raise ValueError(f"km inválido: {km}")
+                if km < 0:
+                    raise ValueError("km não pode ser negativo")
+                validas.append((_instante(instante), posicao, int(veiculo_id), km))
+            except (TypeError, ValueError, OverflowError) as e:
+                rejeitadas.append({"posicao": posicao, "motivo": f"leitura inválida: {e}"})
+
+        aceitas = 0
+        with self._lock:
+            kms = self._kms_gravados()
+            for instante, posicao, veiculo_id, km in sorted(validas):
+                if veiculo_id not in kms:
+                    rejeitadas.append({"posicao": posicao, "motivo": f"veículo inexistente: {veiculo_id}"})
+                    continue
+                ultima = self._ultimas.get(veiculo_id)
+                if ultima and instante < ultima[0]:
+                    rejeitadas.append({"posicao": posicao, "motivo": f"leitura anterior a {ultima[0].isoformat()}"})
+                    continue
+                # Já gravada, a última leitura está em kms (que pode ter sido corrigido no app)
+                km_atual = ultima[1] if veiculo_id in self._diarias else kms[veiculo_id]
+                if km < km_atual:
+                    rejeitadas.append({"posicao": posicao, "motivo": f"regressão: {km:,.1f} km < {km_atual:,.1f} km"})
+                    continue
+                self._ultimas[veiculo_id] = (instante, km)
+                self._diarias.setdefault(veiculo_id, {})[instante.date().isoformat()] = km
+                aceitas += 1
+            if self._diarias and self._pendente_desde is None:
+                self._pendente_desde = time.monotonic()
+            gravados = self._gravar_se_preciso()
+
+        rejeitadas.sort(key=lambda r: r["posicao"])
+        return {"aceitas": aceitas, "rejeitadas": rejeitadas, "gravados": gravados}
+
+    def _gravar_se_preciso(self) -> int:
+        """Grava as leituras pendentes se algum limite foi atingido (com o lock)."""
+        if not self._diarias:
+            return 0
+        if (len(self._diarias) >= self.max_pendentes
+                or time.monotonic() - self._pendente_desde >= self.intervalo):
+            return self._gravar()
+        return 0
+
+    def _gravar(self) -> int:
+        """Grava as leituras pendentes (com o lock)."""
+        if not self._diarias:
+            return 0
+        gravados = db.atualizar_odometros(self._diarias)
+        self._diarias, self._pendente_desde = {}, None
+        return gravados
+
+    def gravar_se_preciso(self) -> int:
+        """Grava as pendentes se o intervalo expirou; útil para chamadas periódicas."""
+        with self._lock:
+            return self._gravar_se_preciso()
+
+    def gravar(self) -> int:
+        """Grava imediatamente as leituras pendentes. Retorna quantos veículos foram atualizados."""
+        with self._lock:
+            return self._gravar()
+
+
+def _taxa(leituras: list, dias: int) -> Optional[float]:
+    """Km por dia entre a leitura mais recente e a mais antiga da janela."""
+    if not leituras:
+        return None
+    fim = date.fromisoformat(leituras[-1]["data"])
+    janela = [l for l in leituras if (fim - date.fromisoformat(l["data"])).days <= dias]
+    if len(janela) < 2:
+        return None
+    decorridos = (fim - date.fromisoformat(janela[0]["data"])).days
+    return (janela[-1]["km"] - janela[0]["km"]) / decorridos
+
+
+def taxa_diaria_km(veiculo_id: int, dias: int = JANELA_TAXA_DIAS) -> Optional[float]:
+    """
+    Média de km rodados por dia pelo veículo nos últimos `dias` dias de
+    histórico de odômetro, ou None se houver menos de dois dias com leitura.
+    """
+    return _taxa(db.listar_leituras_odometro(veiculo_id), dias)
+
+
+def taxas_diarias_km(dias: int = JANELA_TAXA_DIAS) -> dict:
+    """Como taxa_diaria_km, para todos os veículos com histórico: {veiculo_id: km/dia}."""
+    por_veiculo = {}
+    for leitura in db.listar_leituras_odometro():
+        por_veiculo.setdefault(leitura["veiculo_id"], []).append(leitura)
+    taxas = {veiculo_id: _taxa(leituras, dias) for veiculo_id, leituras in por_veiculo.items()}
+    return {veiculo_id: taxa for veiculo_id, taxa in taxas.items() if taxa is not None}
+
+
+def _taxa_historico(pontos: list) -> Optional[float]:
+    """
+    Km por dia pela reta de mínimos quadrados dos pontos (ordinal do dia, km)
+    dos últimos JANELA_HISTORICO_DIAS dias, ou None se eles caírem todos no
+    mesmo dia ou a quilometragem não crescer.
+    """
+    if not pontos:
+        return None
+    fim = max(dia for dia, _ in pontos)
+    janela = [(dia, km) for dia, km in pontos if fim - dia <= JANELA_HISTORICO_DIAS]
+    media_dia = sum(dia for dia, _ in janela) / len(janela)
+    media_km = sum(km for _, km in janela) / len(janela)
+    variancia = sum((dia - media_dia) ** 2 for dia, _ in janela)
+    if not variancia:
+        return None
+    taxa = sum((dia - media_dia) * (km - media_km) for dia, km in janela) / variancia
+    return taxa if taxa > 0 else None
+
+
+def _pontos_uso(veiculo: dict, registros: list, leituras: list) -> list:
+    """
+    Pontos (ordinal do dia, km) conhecidos do veículo: as manutenções
+    registradas, o histórico de odômetro e a quilometragem atual.
+    """
+    pontos = [(date.fromisoformat(r["data_realizada"][:10]).toordinal(), r["km_realizada"]) for r in registros]
+    pontos += [(date.fromisoformat(l["data"]).toordinal(), l["km"]) for l in leituras]
+    instante = veiculo.get("atualizado_em") or veiculo.get("criado_em")
+    if instante:
+        pontos.append((date.fromisoformat(instante[:10]).toordinal(), veiculo["km"]))
+    return pontos
+
+
+def _taxa_uso(veiculo: dict, registros: list, leituras: list, dias: int) -> Optional[float]:
+    """Média de uso de um veículo: pelo odômetro recente ou, sem ele, pelo histórico."""
+    taxa = _taxa(leituras, dias)
+    if taxa is None:
+        taxa = _taxa_historico(_pontos_uso(veiculo, registros, leituras))
+    return taxa
+
+
+def taxa_uso_km(veiculo_id: int, dias: int = JANELA_TAXA_DIAS) -> Optional[float]:
+    """
+    Média de km rodados por dia pelo veículo: a do odômetro (taxa_diaria_km)
+    ou, sem leituras suficientes, a estimada pela quilometragem das
+    manutenções registradas, do odômetro e do cadastro. None se nenhuma
+    das duas puder ser calculada.
+    """
+    veiculo = db.obter_veiculo(veiculo_id)
+    if veiculo is None:
+        return None
+    return _taxa_uso(veiculo, db.listar_registros_manutencao(veiculo_id), db.listar_leituras_odometro(veiculo_id), dias)
+
+
+def taxas_uso_km(dias: int = JANELA_TAXA_DIAS) -> dict:
+    """Como taxa_uso_km, para todos os veículos: {veiculo_id: km/dia}, só os com média conhecida."""
+    registros, leituras = {}, {}
+    for registro in db.listar_registros_manutencao():
+        registros.setdefault(registro["veiculo_id"], []).append(registro)
+    for leitura in db.listar_leituras_odometro():
+        leituras.setdefault(leitura["veiculo_id"], []).append(leitura)
+    taxas = {
+        v["id"]: _taxa_uso(v, registros.get(v["id"], []), leituras.get(v["id"], []), dias)
+        for v in db.listar_veiculos()
+    }
+    return {veiculo_id: taxa for veiculo_id, taxa in taxas.items() if taxa is not None}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from importacao import como_dict, em_blocos, ler_linhas
+
+    parser = argparse.ArgumentParser(description="Registra leituras de odômetro a partir de um arquivo.")
+    parser.add_argument("arquivo", help="arquivo .csv/.jsonl com veiculo_id, km, instante")
+    parser.add_argument("--max-rejeicoes", type=int, default=20, help="quantas rejeições listar")
+    args = parser.parse_args()
+
+    aceitas, rejeitadas, lidas = 0, [], 0
+    with ColetorOdometro() as coletor:
+        for bloco in em_blocos(ler_linhas(args.arquivo), MAX_PENDENTES):
+            leituras, numeros = [], []
+            for numero, linha in enumerate(bloco, lidas + 1):
+                try:
+                    linha = como_dict(linha)
+                except ValueError as e:
+                    rejeitadas.append((numero, str(e)))
+                    continue
+                leituras.append((linha.get("veiculo_id"), linha.get("km"), linha.get("instante")))
+                numeros.append(numero)
+            resultado = coletor.registrar(leituras)
+            aceitas += resultado["aceitas"]
+            rejeitadas.extend((numeros[r["posicao"]], r["motivo"]) for r in resultado["rejeitadas"])
+            lidas += len(bloco)
+    rejeitadas.sort()
+    print(f"{aceitas} leituras aceitas, {len(rejeitadas)} rejeitadas")
+    for numero, motivo in rejeitadas[:args.max_rejeicoes]:
+        print(f"  linha {numero}: {motivo}")
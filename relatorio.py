@@ -0,0 +1,249 @@
+"""
+Relatório da frota: cada veículo, a situação de cada tipo de manutenção
+(database.calcular_proxima_manutencao) e o histórico completo, em CSV, XLSX
+ou HTML, como uma única tabela.
+
+Os veículos são divididos em lotes de TAMANHO_LOTE, montados em paralelo por
+um pool de processos. O arquivo é gravado à medida que os lotes ficam
+prontos, na ordem dos ids: só alguns lotes por processo ficam em memória, e
+o resultado é o mesmo com qualquer número de processos (a data de referência
+da situação é fixada no início).
+
+Uso:
+    python relatorio.py frota.xlsx [--processos 4] [--formato csv|xlsx|html]
+"""
+import csv
+import html
+import math
+import multiprocessing
+import os
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from operator import itemgetter
+from typing import Iterable, Iterator, Optional
+
+import database as db
+
+TAMANHO_LOTE = 100
+
+# Formatos suportados e seus tipos MIME
+FORMATOS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "html": "text/html",
+}
+
+CABECALHO = [
+    "veiculo_id", "veiculo", "km_atual", "secao", "manutencao", "status", "km_faltante",
+    "km_proxima", "dias_faltantes", "data_proxima", "data_realizada", "km_realizada", "observacao",
+]
+
+
+# ===================== MONTAGEM DOS LOTES =====================
+
+def _iniciar_processo(data_dir: str, backend: str, servidor: str):
+    """Aponta o processo do pool para o mesmo armazenamento de quem o criou."""
+    db.configurar_armazenamento(data_dir=data_dir, backend=backend, servidor=servidor)
+
+
+def _linhas_lote(veiculo_ids: list, agora: datetime) -> list:
+    """
+    Linhas do relatório para um lote de veículos: primeiro a situação de cada
+    tipo de manutenção, depois o histórico em ordem cronológica.
+    """
+    tipos = db.listar_tipos_manutencao()
+    nomes = {tipo["id"]: tipo["nome"] for tipo in tipos}
+    linhas = []
+    for veiculo_id in veiculo_ids:
+        veiculo = db.obter_veiculo(veiculo_id)
+        if veiculo is None:
+            # Excluído depois do início do relatório
+            continue
+        base = [veiculo_id, f"{veiculo['marca']} {veiculo['modelo']} ({veiculo['ano']})", veiculo["km"]]
+        for tipo in tipos:
+            situacao = db.calcular_proxima_manutencao(veiculo_id, tipo["id"], agora)
+            if situacao is None:
+                continue
+            linhas.append(base + [
+                "situacao", situacao["tipo_nome"], situacao["status"], situacao["km_faltante"],
+                situacao.get("km_proxima"), situacao["dias_faltantes"], situacao.get("data_proxima"),
+                None, None, None,
+            ])
+        for registro in sorted(db.listar_registros_manutencao(veiculo_id), key=itemgetter("data_realizada", "id")):
+            linhas.append(base + [
+                "historico", nomes.get(registro["tipo_manutencao_id"], ""), None, None, None, None, None,
+                registro["data_realizada"][:10], registro["km_realizada"], registro["observacao"],
+            ])
+    return linhas
+
+
+def _lotes_em_ordem(lotes: list, processos: int, agora: datetime) -> Iterator[list]:
+    """
+    Monta os lotes em um pool de processos e devolve-os na ordem original,
+    com no máximo dois lotes em andamento ou à espera por processo.
+    """
+    if processos <= 1:
+        for lote in lotes:
+            yield _linhas_lote(lote, agora)
+        return
+    # spawn: o fork de um processo com threads (ex.: o servidor do Streamlit) não é seguro
+    with ProcessPoolExecutor(
+        processos,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_iniciar_processo,
+        initargs=(db.DATA_DIR, db.BACKEND, db.SERVIDOR),
+    ) as pool:
+        pendentes = deque()
+        for lote in lotes:
+            pendentes.append(pool.submit(_linhas_lote, lote, agora))
+            if len(pendentes) >= 2 * processos:
+                yield pendentes.popleft().result()
+        while pendentes:
+            yield pendentes.popleft().result()
+
+
+# ===================== FORMATOS =====================
+
+def _escrever_csv(caminho: str, linhas: Iterable[list]):
+    """Grava as linhas em CSV, com cabeçalho."""
+    with open(caminho, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(CABECALHO)
+        escritor.writerows(linhas)
+
+
+def _escrever_html(caminho: str, linhas: Iterable[list], agora: datetime):
+    """Grava as linhas como uma tabela em uma página HTML."""
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write('<!DOCTYPE html>\n<html lang="pt-BR">\n<head><meta charset="utf-8">'
+                f"<title>Relatório da frota em {agora:%d/%m/%Y}</title></head>\n<body>\n"
+                f"<h1>Relatório da frota em {agora:%d/%m/%Y}</h1>\n<table>\n<thead><tr>")
+        f.write("".join(f"<th>{coluna}</th>" for coluna in CABECALHO))
+        f.write("</tr></thead>\n<tbody>\n")
+        for linha in linhas:
+            f.write("<tr>" + "".join(f"<td>{html.escape(str(v)) if v is not None else ''}</td>" for v in linha) + "</tr>\n")
+        f.write("</tbody>\n</table>\n</body>\n</html>\n")
+
+
+# Partes fixas de uma planilha XLSX mínima, com uma única aba
+_XLSX_FIXOS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Frota" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/></Relationships>'
+    ),
+}
+
+# Caracteres de controle que não podem aparecer em XML
+_INVALIDOS_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _entrada_zip(nome: str) -> zipfile.ZipInfo:
+    """Entrada compactada com data fixa, para que o arquivo gerado seja sempre o mesmo."""
+    entrada = zipfile.ZipInfo(nome, date_time=(1980, 1, 1, 0, 0, 0))
+    entrada.compress_type = zipfile.ZIP_DEFLATED
+    return entrada
+
+
+def _celula_xlsx(valor) -> str:
+    """Célula da planilha: vazia, numérica ou com o texto embutido."""
+    if valor is None or (isinstance(valor, float) and not math.isfinite(valor)):
+        # NaN e infinito não são números válidos no SpreadsheetML
+        return "<c/>"
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f"<c><v>{valor!r}</v></c>"
+    texto = html.escape(_INVALIDOS_XML.sub("", str(valor)), quote=False)
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _escrever_xlsx(caminho: str, linhas: Iterable[list]):
+    """Grava a planilha direto no zip, linha a linha, sem montá-la em memória."""
+    with zipfile.ZipFile(caminho, "w") as arquivo_zip:
+        for nome, conteudo in _XLSX_FIXOS.items():
+            arquivo_zip.writestr(_entrada_zip(nome), conteudo)
+        with arquivo_zip.open(_entrada_zip("xl/worksheets/sheet1.xml"), "w", force_zip64=True) as planilha:
+            planilha.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>\n'
+            )
+            planilha.write(("<row>" + "".join(map(_celula_xlsx, CABECALHO)) + "</row>\n").encode("utf-8"))
+            for linha in linhas:
+                planilha.write(("<row>" + "".join(map(_celula_xlsx, linha)) + "</row>\n").encode("utf-8"))
+            planilha.write(b"</sheetData></worksheet>\n")
+
+
+# ===================== EXPORTAÇÃO =====================
+
+def exportar(
+    caminho: str,
+    formato: Optional[str] = None,
+    processos: Optional[int] = None,
+    agora: Optional[datetime] = None,
+) -> dict:
+    """
+    Grava o relatório da frota em `caminho`. O formato vem da extensão, se
+    não for informado; `processos` é o tamanho do pool (padrão: um por CPU,
+    limitado ao número de lotes) e `agora` a referência para a situação.
+    Retorna {"veiculos": ..., "linhas": ...}.
+    """
+    formato = formato or os.path.splitext(caminho)[1].lstrip(".").lower()
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato}")
+    agora = agora or datetime.now()
+    veiculo_ids = sorted(v["id"] for v in db.listar_veiculos())
+    lotes = [veiculo_ids[i:i + TAMANHO_LOTE] for i in range(0, len(veiculo_ids), TAMANHO_LOTE)]
+    processos = min(processos or os.cpu_count() or 1, len(lotes))
+
+    total = {"veiculos": len(veiculo_ids), "linhas": 0}
+
+    def linhas():
+        for lote in _lotes_em_ordem(lotes, processos, agora):
+            total["linhas"] += len(lote)
+            yield from lote
+
+    if formato == "csv":
+        _escrever_csv(caminho, linhas())
+    elif formato == "xlsx":
+        _escrever_xlsx(caminho, linhas())
+    else:
+        _escrever_html(caminho, linhas(), agora)
+    return total
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exporta o relatório da frota (situação e histórico de cada veículo).")
+    parser.add_argument("arquivo", help="arquivo de saída (.csv, .xlsx ou .html)")
+    parser.add_argument("--formato", choices=list(FORMATOS), help="formato, se diferente da extensão")
+    parser.add_argument("--processos", type=int, help="processos do pool (padrão: um por CPU)")
+    args = parser.parse_args()
+    resultado = exportar(args.arquivo, args.formato, args.processos)
+    print(f"{resultado['veiculos']} veículos, {resultado['linhas']} linhas gravadas em {args.arquivo}")
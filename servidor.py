@@ -0,0 +1,212 @@
+"""
+Servidor de dados: um processo que mantém os dados de database.py em memória
+e atende os demais por um socket Unix ou TCP local.
+
+Não há autenticação: o socket Unix só aceita o próprio usuário, e o TCP só
+pode ser aberto em endereços de loopback (127.0.0.1, ::1, localhost).
+
+Com vários processos do Streamlit (ex.: atrás de um balanceador), cada um lê
+e guarda a sua cópia dos arquivos, e as gravações de um invalidam os caches
+dos outros. Com o servidor, os dados são lidos uma vez, por ele, e os
+processos do app usam o backend "servidor" (database_cliente.py), que só
+repassa as chamadas.
+
+Protocolo: uma requisição JSON por linha, {"funcao": ..., "args": [...],
+"kwargs": {...}}, respondida na ordem com {"resultado": ...} ou
+{"erro": <nome da exceção>, "mensagem": ...}; argumentos e resultados passam
+por database_cliente.codificar.
+A função "versao" retorna [instância do servidor, versão dos dados].
+
+As chamadas rodam em um pool de threads: leituras de conexões diferentes
+correm em paralelo, e as gravações são serializadas pelos grupos de gravação
+do próprio database.py. A resposta de uma leitura já codificada é
+reaproveitada para quem fizer a mesma requisição enquanto os dados não mudarem.
+
+Uso:
+    python servidor.py [--endereco data/servidor.sock | --endereco 127.0.0.1:8765]
+    MANUTENCAO_BACKEND=servidor MANUTENCAO_SERVIDOR=data/servidor.sock streamlit run app.py
+"""
+import asyncio
+import functools
+import ipaddress
+import json
+import os
+import signal
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import database as db
+import database_cliente
+import instrumentacao
+
+# Identifica esta execução: a versão dos dados recomeça a cada início
+INSTANCIA = uuid.uuid4().hex
+
+# Quantas respostas de leitura guardar para a versão atual dos dados
+RESPOSTAS_GUARDADAS = 64
+
+# Maior requisição aceita (ex.: adicionar_em_lote com muitos itens)
+LIMITE_LINHA = 256 * 1024 * 1024
+
+_respostas: dict = {}  # linha da requisição -> resposta codificada
+_versao_respostas: Optional[int] = None
+_respostas_lock = threading.Lock()
+
+
+def _codificar(resposta: dict) -> bytes:
+    """Resposta em uma linha JSON."""
+    return json.dumps(resposta, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def _executar(requisicao: dict):
+    """Chama a função pública de database.py pedida."""
+    args = database_cliente.decodificar(requisicao.get("args", []))
+    kwargs = database_cliente.decodificar(requisicao.get("kwargs", {}))
+    return database_cliente.codificar(getattr(db, requisicao["funcao"])(*args, **kwargs))
+
+
+def _ler(linha: bytes, requisicao: dict) -> bytes:
+    """
+    Executa uma leitura, reaproveitando a resposta de uma requisição igual
+    feita na mesma versão dos dados. A versão é lida antes da leitura: a
+    resposta guardada nunca é mais antiga que a versão a que ela pertence.
+    """
+    global _versao_respostas
+    versao = db.versao_dados()
+    chave = linha.strip()
+    with _respostas_lock:
+        if versao != _versao_respostas:
+            _respostas.clear()
+            _versao_respostas = versao
+        resposta = _respostas.get(chave)
+    if instrumentacao.ATIVO:
+        instrumentacao.registrar_cache("servidor.respostas", resposta is not None)
+    if resposta is None:
+        resposta = _codificar({"resultado": _executar(requisicao)})
+        with _respostas_lock:
+            if versao == _versao_respostas:
+                if len(_respostas) >= RESPOSTAS_GUARDADAS:
+                    del _respostas[next(iter(_respostas))]
+                _respostas[chave] = resposta
+    return resposta
+
+
+def atender(linha: bytes) -> bytes:
+    """Executa uma requisição (uma linha JSON) e retorna a resposta codificada."""
+    try:
+        requisicao = json.loads(linha)
+        funcao = requisicao["funcao"]
+        if funcao == "versao":
+            return _codificar({"resultado": [INSTANCIA, db.versao_dados()]})
+        if funcao not in db._funcoes_backend:
+            raise ValueError(f"Função desconhecida: {funcao}")
+        if funcao in db._funcoes_escrita:
+            return _codificar({"resultado": _executar(requisicao)})
+        return _ler(linha, requisicao)
+    except Exception as erro:
+        return _codificar({"erro": type(erro).__name__, "mensagem": str(erro)})
+
+
+async def _atender_conexao(leitor: asyncio.StreamReader, escritor: asyncio.StreamWriter, executor: ThreadPoolExecutor):
+    """Atende as requisições de uma conexão, uma de cada vez e na ordem."""
+    loop = asyncio.get_running_loop()
+    try:
+        while linha := await leitor.readline():
+            escritor.write(await loop.run_in_executor(executor, atender, linha))
+            await escritor.drain()
+    except (ConnectionError, ValueError, asyncio.CancelledError):
+        # Cliente que caiu, requisição acima de LIMITE_LINHA ou servidor parando
+        pass
+    finally:
+        escritor.close()
+
+
+def _loopback(host: str) -> bool:
+    """Indica se todos os endereços do host são de loopback (só a própria máquina os alcança)."""
+    try:
+        enderecos = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return False
+    return bool(enderecos) and all(ipaddress.ip_address(endereco.split("%")[0]).is_loopback for endereco in enderecos)
+
+
+def _liberar_socket(caminho: str):
+    """Remove o socket Unix deixado por um servidor que não está mais rodando."""
+    if not os.path.exists(caminho):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as teste:
+        try:
+            teste.connect(caminho)
+        except OSError:
+            os.remove(caminho)
+            return
+    raise RuntimeError(f"Já existe um servidor de dados em {caminho}")
+
+
+async def servir(endereco: str, threads: int = 8, pronto: Optional[threading.Event] = None):
+    """
+    Atende no endereço (socket Unix ou "host:porta" de loopback) até receber
+    SIGINT ou SIGTERM. Os dados são carregados antes de aceitar conexões.
+    """
+    tcp = database_cliente.endereco_tcp(endereco)
+    if tcp is not None and not _loopback(tcp[0]):
+        raise ValueError(f"O servidor de dados não tem autenticação e só atende em loopback, não em {tcp[0]}")
+    for listar in (db.listar_veiculos, db.listar_tipos_manutencao, db.listar_registros_manutencao):
+        listar()
+    executor = ThreadPoolExecutor(threads, thread_name_prefix="servidor")
+    atender_conexao = functools.partial(_atender_conexao, executor=executor)
+    if tcp is not None:
+        servidor = await asyncio.start_server(atender_conexao, *tcp, limit=LIMITE_LINHA)
+    else:
+        _liberar_socket(endereco)
+        # O socket já nasce só do dono: um chmod depois do bind deixaria uma
+        # janela em que ele aceita conexões com as permissões do umask
+        umask = os.umask(0o077)
+        try:
+            servidor = await asyncio.start_unix_server(atender_conexao, endereco, limit=LIMITE_LINHA)
+        finally:
+            os.umask(umask)
+        os.chmod(endereco, 0o600)
+
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sinal, parar.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows, ou fora da thread principal
+            pass
+    try:
+        async with servidor:
+            if pronto is not None:
+                pronto.set()
+            await parar.wait()
+    finally:
+        executor.shutdown(wait=True)
+        if tcp is None and os.path.exists(endereco):
+            os.remove(endereco)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servidor de dados compartilhado pelos processos do app.")
+    parser.add_argument("--endereco", help=f"socket Unix ou host:porta de loopback (padrão: {db.SERVIDOR})")
+    parser.add_argument("--dados", help=f"diretório de dados (padrão: {db.DATA_DIR})")
+    parser.add_argument("--backend", choices=[b for b in db.BACKENDS if b != "servidor"],
+                        help="armazenamento usado pelo servidor (padrão: MANUTENCAO_BACKEND ou json)")
+    parser.add_argument("--threads", type=int, default=8, help="threads que executam as chamadas")
+    args = parser.parse_args()
+    db.configurar_armazenamento(
+        data_dir=args.dados,
+        backend=args.backend or (db.BACKEND if db.BACKEND != "servidor" else "json"),
+    )
+    endereco = args.endereco or db.SERVIDOR
+    tcp = database_cliente.endereco_tcp(endereco)
+    if tcp is not None and not _loopback(tcp[0]):
+        parser.error(f"--endereco deve ser um socket Unix ou um endereço de loopback, não {tcp[0]}")
+    print(f"Servidor de dados ({db.BACKEND}, {db.DATA_DIR}) em {endereco}")
+    asyncio.run(servir(endereco, args.threads))
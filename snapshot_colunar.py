@@ -0,0 +1,233 @@
+"""
+Snapshot binário e colunar dos registros de manutenção.
+
+Guarda cada campo dos registros em um array tipado contíguo, em vez de um
+dict por registro com datas em texto. O arquivo é lido com mmap: os arrays
+numpy apontam direto para o arquivo, sem parse nem cópia.
+
+Layout (little-endian, colunas alinhadas em 8 bytes):
+    MAGICO (8 bytes)
+    n_registros, n_textos, tamanho_textos (uint64 cada)
+    km_realizada    float64[n]
+    criado_em       int64[n]    microssegundos desde 0001-01-01; -1 se ausente
+    offsets_textos  uint64[n_textos + 1]
+    id              int32[n]
+    veiculo_id      int32[n]
+    tipo_manutencao_id int32[n]
+    data_realizada  int32[n]    ordinal da data (date.toordinal)
+    observacao      int32[n]    índice na tabela de textos
+    textos          bytes UTF-8 concatenados (cada observação aparece uma vez)
+
+Uso:
+    python snapshot_colunar.py exportar    # registros atuais -> snapshot
+    python snapshot_colunar.py restaurar   # snapshot -> registros_manutencao.json
+"""
+import mmap
+import os
+import struct
+from datetime import date, datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+import database as db
+
+MAGICO = b"MNTREG01"
+_CABECALHO = struct.Struct("<8sQQQ")
+_INICIO_MICROS = datetime(1, 1, 1)
+_EPOCA_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def caminho_padrao() -> str:
+    """Caminho do snapshot no diretório de dados atual."""
+    return os.path.join(db.DATA_DIR, "registros_manutencao.snap")
+
+
+def _alinhar(tamanho: int) -> int:
+    """Bytes de preenchimento para alinhar em 8."""
+    return -tamanho % 8
+
+
+def _data_para_ordinal(valor: str) -> int:
+    """Converte 'AAAA-MM-DD' no ordinal da data."""
+    data = date.fromisoformat(valor)
+    if data.isoformat() != valor:
+        raise ValueError(f"data_realizada fora do formato AAAA-MM-DD: {valor!r}")
+    return data.toordinal()
+
+
+def _instante_para_micros(valor: Optional[str]) -> int:
+    """Converte um datetime ISO (sem fuso) em microssegundos desde 0001-01-01."""
+    if not valor:
+        return -1
+    instante = datetime.fromisoformat(valor)
+    if instante.tzinfo is not None or instante.isoformat() != valor:
+        raise ValueError(f"criado_em não suportado no snapshot: {valor!r}")
+    return (instante - _INICIO_MICROS) // timedelta(microseconds=1)
+
+
+def gravar(registros: Iterable[dict], caminho: Optional[str] = None) -> int:
+    """
+    Grava os registros no formato colunar e retorna quantos foram gravados.
+    O arquivo é escrito em um temporário e renomeado ao final.
+    """
+    caminho = caminho or caminho_padrao()
+    registros = list(registros)
+    n = len(registros)
+    textos = {"": 0}
+    colunas_8 = [
+        np.fromiter((r["km_realizada"] for r in registros), dtype=np.float64, count=n),
+        np.fromiter((_instante_para_micros(r.get("criado_em")) for r in registros), dtype=np.int64, count=n),
+    ]
+    colunas_4 = [
+        np.array([r["id"] for r in registros], dtype=np.int32),
+        np.array([r["veiculo_id"] for r in registros], dtype=np.int32),
+        np.array([r["tipo_manutencao_id"] for r in registros], dtype=np.int32),
+        np.fromiter((_data_para_ordinal(r["data_realizada"]) for r in registros), dtype=np.int32, count=n),
+        np.fromiter(
+            (textos.setdefault(r.get("observacao") or "", len(textos)) for r in registros),
+            dtype=np.int32, count=n
+        ),
+    ]
+    codificados = [texto.encode("utf-8") for texto in textos]
+    offsets = np.zeros(len(codificados) + 1, dtype=np.uint64)
+    np.cumsum([len(c) for c in codificados], out=offsets[1:])
+    blob = b"".join(codificados)
+
+    temporario = caminho + ".tmp"
+    with open(temporario, "wb") as f:
+        f.write(_CABECALHO.pack(MAGICO, n, len(codificados), len(blob)))
+        for coluna in colunas_8 + [offsets] + colunas_4:
+            f.write(coluna.astype(coluna.dtype.newbyteorder("<"), copy=False).tobytes())
+        f.write(b"\0" * _alinhar(4 * n * len(colunas_4)))
+        f.write(blob)
+    os.replace(temporario, caminho)
+    return n
+
+
+class SnapshotRegistros:
+    """
+    Snapshot aberto via mmap. As colunas são arrays numpy somente leitura que
+    apontam para o arquivo; nada é lido até ser usado.
+    """
+
+    def __init__(self, caminho: Optional[str] = None):
+        self.caminho = caminho or caminho_padrao()
+        with open(self.caminho, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magico, n, n_textos, tamanho_textos = _CABECALHO.unpack_from(self._mmap, 0)
+        if magico != MAGICO:
+            raise ValueError(f"{self.caminho} não é um snapshot de registros")
+        self._n = n
+        offset = _CABECALHO.size
+
+        def coluna(dtype, quantidade):
+            nonlocal offset
+            array = np.frombuffer(self._mmap, dtype=np.dtype(dtype).newbyteorder("<"), count=quantidade, offset=offset)
+            offset += array.nbytes
+            return array
+
+        self.km_realizada = coluna(np.float64, n)
+        self.criado_em = coluna(np.int64, n)
+        self._offsets_textos = coluna(np.uint64, n_textos + 1)
+        self.ids = coluna(np.int32, n)
+        self.veiculo_ids = coluna(np.int32, n)
+        self.tipo_manutencao_ids = coluna(np.int32, n)
+        self.data_ordinal = coluna(np.int32, n)
+        self.observacao_idx = coluna(np.int32, n)
+        offset += _alinhar(offset)
+        self._inicio_textos = offset
+        self._textos: Optional[list] = None
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Libera o mmap. Os arrays obtidos deste snapshot deixam de valer."""
+        for nome in ("km_realizada", "criado_em", "_offsets_textos", "ids", "veiculo_ids",
+                     "tipo_manutencao_ids", "data_ordinal", "observacao_idx"):
+            setattr(self, nome, None)
+        self._mmap.close()
+
+    @property
+    def textos(self) -> list:
+        """Tabela de textos (observações distintas), decodificada sob demanda."""
+        if self._textos is None:
+            offsets = self._offsets_textos.tolist()
+            blob = self._mmap[self._inicio_textos:self._inicio_textos + offsets[-1]]
+            self._textos = [blob[a:b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+        return self._textos
+
+    def datas(self) -> np.ndarray:
+        """Datas de realização como datetime64[D]."""
+        return (self.data_ordinal.astype(np.int64) - _EPOCA_ORDINAL).astype("datetime64[D]")
+
+    def registro(self, i: int) -> dict:
+        """Monta o registro da posição i no mesmo formato dos arquivos JSON."""
+        criado_em = int(self.criado_em[i])
+        return {
+            "id": int(self.ids[i]),
+            "veiculo_id": int(self.veiculo_ids[i]),
+            "tipo_manutencao_id": int(self.tipo_manutencao_ids[i]),
+            "km_realizada": float(self.km_realizada[i]),
+            "data_realizada": date.fromordinal(int(self.data_ordinal[i])).isoformat(),
+            "observacao": self.textos[self.observacao_idx[i]],
+            "criado_em": None if criado_em < 0 else (_INICIO_MICROS + timedelta(microseconds=criado_em)).isoformat(),
+        }
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(self._n):
+            yield self.registro(i)
+
+    def para_dataframe(self) -> pd.DataFrame:
+        """
+        DataFrame com as colunas do snapshot. data_realizada vem como
+        datetime64 e observacao como Categorical sobre a tabela de textos.
+        """
+        return pd.DataFrame({
+            "id": self.ids,
+            "veiculo_id": self.veiculo_ids,
+            "tipo_manutencao_id": self.tipo_manutencao_ids,
+            "km_realizada": self.km_realizada,
+            "data_realizada": self.datas(),
+            "observacao": pd.Categorical.from_codes(self.observacao_idx, categories=self.textos),
+        })
+
+
+def exportar(caminho: Optional[str] = None) -> int:
+    """Grava os registros atuais (de qualquer backend) em um snapshot."""
+    return gravar(db.listar_registros_manutencao(), caminho)
+
+
+def restaurar(caminho: Optional[str] = None) -> int:
+    """
+    Substitui os registros do backend JSON pelos do snapshot, regravando
+    registros_manutencao.json (ou as partições, se os registros estiverem
+    particionados). Retorna quantos registros foram restaurados.
+    """
+    if db.BACKEND != "json":
+        raise ValueError("A restauração do snapshot só é suportada no backend JSON")
+    with SnapshotRegistros(caminho) as snapshot:
+        registros = list(snapshot)
+    db._substituir_colecao(db.REGISTROS_FILE, registros)
+    return len(registros)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Converte os registros de manutenção de/para o snapshot colunar.")
+    parser.add_argument("acao", choices=["exportar", "restaurar"])
+    parser.add_argument("--arquivo", help=f"caminho do snapshot (padrão: {caminho_padrao()})")
+    args = parser.parse_args()
+    if args.acao == "exportar":
+        print(f"{exportar(args.arquivo)} registros gravados em {args.arquivo or caminho_padrao()}")
+    else:
+        print(f"{restaurar(args.arquivo)} registros restaurados em {db.DATA_DIR}")
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db  # noqa: E402
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def armazenamento(request, tmp_path):
+    """Armazenamento vazio em um diretório temporário, em cada backend."""
+    anterior = (db.DATA_DIR, db.BACKEND)
+    db.configurar_armazenamento(data_dir=str(tmp_path), backend=request.param)
+    yield request.param
+    db.configurar_armazenamento(data_dir=anterior[0], backend=anterior[1])
@@ -0,0 +1,65 @@
+from datetime import date
+
+import agenda
+import database as db
+import importacao
+
+
+def _motivos(resumo: dict) -> dict:
+    return {rejeicao["linha"]: rejeicao["motivo"] for rejeicao in resumo["rejeitadas"]}
+
+
+def test_rejeita_numeros_fora_dos_limites(armazenamento):
+    relatorio = importacao.importar(
+        veiculos=[
+            {"id": 1, "marca": "Fiat", "modelo": "Uno", "ano": 2010, "km": 1000},
+            {"marca": "Fiat", "modelo": "Uno", "ano": 1e30, "km": 1000},
+            {"marca": "Fiat", "modelo": "Uno", "ano": 1850, "km": 1000},
+            {"marca": "Fiat", "modelo": "Uno", "ano": date.today().year + 2, "km": 1000},
+            {"marca": "Fiat", "modelo": "Uno", "ano": 2010, "km": 1e30},
+            {"marca": "Fiat", "modelo": "Uno", "ano": 10 ** 400, "km": 1000},
+        ],
+        tipos=[
+            {"id": 1, "nome": "Troca de óleo", "intervalo_km": 10000, "intervalo_dias": 180},
+            {"nome": "Revisão", "intervalo_dias": "1e30"},
+            {"nome": "Revisão", "intervalo_dias": importacao.MAX_INTERVALO_DIAS + 1},
+            {"nome": "Revisão", "intervalo_km": "1e30"},
+        ],
+        registros=[
+            {"veiculo_id": 1, "tipo_manutencao_id": 1, "km_realizada": 900, "data_realizada": "2026-01-10"},
+            {"veiculo_id": 1, "tipo_manutencao_id": 1, "km_realizada": 1e30, "data_realizada": "2026-01-10"},
+        ],
+    )
+    assert relatorio["veiculos"]["importadas"] == 1
+    assert set(_motivos(relatorio["veiculos"])) == {2, 3, 4, 5, 6}
+    assert relatorio["manutencoes"]["importadas"] == 1
+    assert set(_motivos(relatorio["manutencoes"])) == {2, 3, 4}
+    assert relatorio["registros_manutencao"]["importadas"] == 1
+    assert set(_motivos(relatorio["registros_manutencao"])) == {2}
+
+    # Os prazos continuam calculáveis com o que foi importado
+    assert db.calcular_proxima_manutencao(1, 1) is not None
+    visao = agenda.AgendaFrota()
+    try:
+        assert len(visao.todas()) == 1
+    finally:
+        visao.fechar()
+
+
+def test_rejeita_inteiros_com_casas_decimais(armazenamento):
+    relatorio = importacao.importar(
+        veiculos=[
+            {"marca": "Fiat", "modelo": "Uno", "ano": "2010.0", "km": "1000.5"},
+            {"marca": "Fiat", "modelo": "Uno", "ano": "2010.7", "km": 1000},
+        ],
+        tipos=[
+            {"nome": "Revisão", "intervalo_dias": "1.7"},
+            {"nome": "Revisão", "intervalo_dias": "30"},
+        ],
+    )
+    assert relatorio["veiculos"]["importadas"] == 1
+    assert "inteiro" in _motivos(relatorio["veiculos"])[2]
+    assert relatorio["manutencoes"]["importadas"] == 1
+    assert "inteiro" in _motivos(relatorio["manutencoes"])[1]
+    assert db.listar_veiculos()[0]["ano"] == 2010
+    assert db.listar_tipos_manutencao()[0]["intervalo_dias"] == 30
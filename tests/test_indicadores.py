@@ -0,0 +1,50 @@
+import database as db
+import indicadores
+
+
+def _confere_com_agregacao(visao: indicadores.Indicadores):
+    """As tabelas mantidas pelas escritas devem ser as de uma agregação do zero."""
+    visao._consultar()
+    fresca = indicadores.Indicadores()
+    try:
+        fresca._agregar()
+        assert visao._por_tipo_mes == fresca._por_tipo_mes
+        assert visao._pares == fresca._pares
+    finally:
+        fresca.fechar()
+
+
+def test_registros_orfaos_ficam_fora_das_tabelas(armazenamento):
+    veiculo = db.adicionar_veiculo("Fiat", "Uno", 2010, 1000)
+    tipo = db.adicionar_tipo_manutencao("Troca de óleo", 10000, 180)
+    db.adicionar_registro_manutencao(veiculo["id"], tipo["id"], 900, "2026-01-10")
+    visao = indicadores.Indicadores()
+    try:
+        visao._consultar()
+        db.adicionar_registro_manutencao(veiculo["id"] + 50, tipo["id"], 1200, "2026-02-10")
+        db.adicionar_registro_manutencao(veiculo["id"], tipo["id"] + 50, 1300, "2026-03-10")
+        db.adicionar_em_lote("registros_manutencao", [
+            {"veiculo_id": veiculo["id"] + 60, "tipo_manutencao_id": tipo["id"],
+             "km_realizada": 1400, "data_realizada": "2026-04-10", "observacao": ""},
+        ])
+        _confere_com_agregacao(visao)
+        assert len(visao._pares) == 1
+    finally:
+        visao.fechar()
+
+
+def test_veiculo_novo_adota_registros_orfaos(armazenamento):
+    tipo = db.adicionar_tipo_manutencao("Troca de óleo", 10000, 180)
+    visao = indicadores.Indicadores()
+    try:
+        visao._consultar()
+        # O próximo veículo recebe o id 1, já citado pelo registro
+        db.adicionar_registro_manutencao(1, tipo["id"], 900, "2026-01-10")
+        _confere_com_agregacao(visao)
+        assert visao._pares == {}
+        veiculo = db.adicionar_veiculo("Fiat", "Uno", 2010, 1000)
+        assert veiculo["id"] == 1
+        _confere_com_agregacao(visao)
+        assert visao._pares == {(1, tipo["id"]): [1, 900.0, 900.0]}
+    finally:
+        visao.fechar()
@@ -0,0 +1,72 @@
+"""
+Base das visões mantidas a partir das escritas do database: a agenda
+(agenda.py), os indicadores (indicadores.py) e o índice de busca (busca.py).
+
+Uma visão é montada no primeiro uso e, daí em diante, atualizada a cada
+escrita feita por este processo (veja database.registrar_ouvinte), só no que
+mudou. Se uma escrita não puder ser aplicada ou a versão dos dados pular
+(alteração de outro processo, importação pela CLI), a visão é montada de
+novo na consulta seguinte.
+"""
+import threading
+from typing import Optional
+
+import database as db
+
+_compartilhadas: dict = {}  # classe -> instância compartilhada pelo processo
+_compartilhadas_lock = threading.RLock()
+
+
+class VisaoIncremental:
+    """
+    Subclasses implementam _montar (a montagem completa) e _aplicar (uma
+    escrita) e chamam _atualizar_versao, com o lock, antes de cada consulta.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._versao: Optional[int] = None
+        db.registrar_ouvinte(self._ao_escrever)
+
+    @classmethod
+    def compartilhada(cls):
+        """Instância compartilhada pelo processo, criada no primeiro uso."""
+        with _compartilhadas_lock:
+            if cls not in _compartilhadas:
+                _compartilhadas[cls] = cls()
+            return _compartilhadas[cls]
+
+    def fechar(self):
+        """Deixa de acompanhar as escritas."""
+        db.remover_ouvinte(self._ao_escrever)
+
+    def _montar(self):
+        """Monta a visão inteira a partir do armazenamento."""
+        raise NotImplementedError
+
+    def _aplicar(self, operacao: str, parametros: dict, resultado) -> bool:
+        """Aplica uma escrita à visão; retorna False se for preciso remontá-la."""
+        raise NotImplementedError
+
+    def _reconstruir(self):
+        """Monta a visão de novo, na versão atual dos dados."""
+        versao = db.versao_dados()
+        self._montar()
+        self._versao = versao
+
+    def _atualizar_versao(self):
+        """Remonta a visão se os dados mudaram sem que ela fosse avisada."""
+        if self._versao is None or db.versao_dados() != self._versao:
+            self._reconstruir()
+
+    def _ao_escrever(self, operacao: str, parametros: dict, resultado, versao: int):
+        """Ouvinte das escritas do database: aplica a escrita ou marca a visão para remontagem."""
+        with self._lock:
+            if self._versao is None:
+                return
+            try:
+                aplicada = self._aplicar(operacao, parametros, resultado)
+            except Exception:
+                aplicada = False
+            # Só a escrita que gerou a versão seguinte pode ser aplicada sobre esta
+            self._versao = versao if aplicada and versao == self._versao + 1 else None